@@ -0,0 +1,70 @@
+"""Copy the message timestamp onto message_recipients
+
+Revision ID: 3f9c1d7a2b64
+Revises: 64b69aa136dc
+Create Date: 2026-10-16 11:20:43.581920
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9c1d7a2b64"
+down_revision: Union[str, None] = "64b69aa136dc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "message_recipients",
+        sa.Column("message_timestamp", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.execute(
+        """
+        UPDATE message_recipients
+        SET message_timestamp = messages.timestamp
+        FROM messages
+        WHERE messages.id = message_recipients.message_id
+        """
+    )
+    op.alter_column("message_recipients", "message_timestamp", nullable=False)
+
+    # Inbox and unread pages now sort on the recipients table's own column
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_message_recipients_inbox",
+            "message_recipients",
+            ["recipient_id", sa.text("message_timestamp DESC"), sa.text("message_id DESC")],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_message_recipients_unread",
+            table_name="message_recipients",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_message_recipients_unread",
+            "message_recipients",
+            ["recipient_id", sa.text("message_timestamp DESC"), sa.text("message_id DESC")],
+            postgresql_where=sa.text("read = false"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_message_recipients_unread", table_name="message_recipients")
+    op.create_index(
+        "ix_message_recipients_unread",
+        "message_recipients",
+        ["recipient_id"],
+        postgresql_where=sa.text("read = false"),
+    )
+    op.drop_index("ix_message_recipients_inbox", table_name="message_recipients")
+    op.drop_column("message_recipients", "message_timestamp")
@@ -0,0 +1,51 @@
+"""Add maintained totals: per-user sent_count and row_counts
+
+Revision ID: 5c8e1f0a7d42
+Revises: e4a7c2d9b813
+Create Date: 2026-10-16 18:02:44.915307
+
+Both are filled from the current data. Writes that land between this
+migration and the new code being deployed are not counted; run
+``python -m app.mailbox reconcile`` after the deploy to catch them up.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5c8e1f0a7d42"
+down_revision: Union[str, None] = "e4a7c2d9b813"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "user_mailbox_stats",
+        sa.Column("sent_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_table(
+        "row_counts",
+        sa.Column("table_name", sa.String(length=64), nullable=False),
+        sa.Column("row_count", sa.BigInteger(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("table_name"),
+    )
+    # WHERE true keeps SQLite from parsing ON CONFLICT as a join constraint
+    op.execute(
+        "INSERT INTO user_mailbox_stats (user_id, sent_count) "
+        "SELECT sender_id, count(*) FROM messages WHERE true GROUP BY sender_id "
+        "ON CONFLICT (user_id) DO UPDATE SET sent_count = excluded.sent_count"
+    )
+    op.execute(
+        "INSERT INTO row_counts (table_name, row_count) SELECT 'users', count(*) FROM users"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("row_counts")
+    op.drop_column("user_mailbox_stats", "sent_count")
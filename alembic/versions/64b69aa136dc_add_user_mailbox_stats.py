@@ -0,0 +1,51 @@
+"""Add user_mailbox_stats counters
+
+Revision ID: 64b69aa136dc
+Revises: 80b7da2e1a05
+Create Date: 2026-10-16 10:02:17.118406
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "64b69aa136dc"
+down_revision: Union[str, None] = "80b7da2e1a05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_mailbox_stats",
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("unread_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("total_count", sa.Integer(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    # Backfill from existing inboxes; same query as app.mailbox.reconcile
+    op.execute(
+        """
+        INSERT INTO user_mailbox_stats (user_id, unread_count, total_count)
+        SELECT users.id,
+               count(message_recipients.id) FILTER (WHERE NOT message_recipients.read),
+               count(message_recipients.id)
+        FROM users
+        LEFT JOIN message_recipients ON message_recipients.recipient_id = users.id
+        GROUP BY users.id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("user_mailbox_stats")
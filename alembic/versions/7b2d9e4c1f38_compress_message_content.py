@@ -0,0 +1,72 @@
+"""Store message content codec-tagged for compression
+
+Revision ID: 7b2d9e4c1f38
+Revises: d81f3a6c0b57
+Create Date: 2026-10-16 15:37:12.480962
+
+content becomes BYTEA holding a one-byte codec tag and the body (see
+app.compression). Existing rows are converted as uncompressed; run
+``python -m app.compression backfill`` afterwards to compress them in
+batches. search_vector stops being a generated column, since it can no
+longer be computed from content, and is written by the insert paths.
+
+Changing the column type rewrites the messages table under an exclusive
+lock; on a large installation run this in a maintenance window.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7b2d9e4c1f38"
+down_revision: Union[str, None] = "d81f3a6c0b57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(subject, '')), 'A') || "
+    "setweight(to_tsvector('english', content), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    # Keeps the stored vectors, which are still correct
+    op.execute("ALTER TABLE messages ALTER COLUMN search_vector DROP EXPRESSION")
+    op.execute(
+        "ALTER TABLE messages ALTER COLUMN content TYPE bytea "
+        "USING '\\x00'::bytea || convert_to(content, 'UTF8')"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    compressed = bind.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM messages WHERE substr(content, 1, 1) <> '\\x00'::bytea)"
+    )).scalar()
+    if compressed:
+        raise RuntimeError(
+            "messages still holds compressed bodies; "
+            "run `python -m app.compression backfill --codec none` first"
+        )
+    op.drop_index("ix_messages_search_vector", table_name="messages")
+    op.drop_column("messages", "search_vector")
+    op.execute(
+        "ALTER TABLE messages ALTER COLUMN content TYPE text "
+        "USING convert_from(substr(content, 2), 'UTF8')"
+    )
+    op.execute(
+        f"ALTER TABLE messages ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    )
+    op.create_index(
+        "ix_messages_search_vector", "messages", ["search_vector"], postgresql_using="gin"
+    )
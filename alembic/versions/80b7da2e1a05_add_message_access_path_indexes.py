@@ -0,0 +1,73 @@
+"""Add indexes for inbox, unread, sent and mark-as-read access paths
+
+Revision ID: 80b7da2e1a05
+Revises: 14680180c517
+Create Date: 2026-10-16 09:12:41.503118
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "80b7da2e1a05"
+down_revision: Union[str, None] = "14680180c517"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built CONCURRENTLY so existing mailboxes stay writable while the
+    # indexes are created; that cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_message_recipients_recipient_id_read",
+            "message_recipients",
+            ["recipient_id", "read"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_message_recipients_unread",
+            "message_recipients",
+            ["recipient_id"],
+            postgresql_where=sa.text("read = false"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "uq_message_recipients_message_id_recipient_id",
+            "message_recipients",
+            ["message_id", "recipient_id"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_messages_sender_id_timestamp",
+            "messages",
+            ["sender_id", sa.text("timestamp DESC"), sa.text("id DESC")],
+            postgresql_concurrently=True,
+        )
+
+    # Promote the unique index to a named constraint without a second build
+    op.execute(
+        "ALTER TABLE message_recipients "
+        "ADD CONSTRAINT uq_message_recipients_message_id_recipient_id "
+        "UNIQUE USING INDEX uq_message_recipients_message_id_recipient_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(
+        "uq_message_recipients_message_id_recipient_id",
+        "message_recipients",
+        type_="unique",
+    )
+    op.drop_index("ix_messages_sender_id_timestamp", table_name="messages")
+    op.drop_index("ix_message_recipients_unread", table_name="message_recipients")
+    op.drop_index(
+        "ix_message_recipients_recipient_id_read", table_name="message_recipients"
+    )
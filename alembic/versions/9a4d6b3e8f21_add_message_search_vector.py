@@ -0,0 +1,58 @@
+"""Add a full-text search vector to messages
+
+Revision ID: 9a4d6b3e8f21
+Revises: c5e2a81f4d09
+Create Date: 2026-10-16 13:05:52.640187
+
+Adding a stored generated column rewrites the messages table under an
+exclusive lock; on a large installation run this in a maintenance window.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9a4d6b3e8f21"
+down_revision: Union[str, None] = "c5e2a81f4d09"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(subject, '')), 'A') || "
+    "setweight(to_tsvector('english', content), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        f"ALTER TABLE messages ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    )
+    partitioned = op.get_bind().execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('messages'))"
+    )).scalar()
+    if partitioned:
+        # CONCURRENTLY is not supported on partitioned tables
+        op.create_index(
+            "ix_messages_search_vector", "messages", ["search_vector"], postgresql_using="gin"
+        )
+        return
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_search_vector",
+            "messages",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_search_vector", table_name="messages")
+    op.drop_column("messages", "search_vector")
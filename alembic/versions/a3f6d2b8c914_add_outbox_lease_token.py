@@ -0,0 +1,31 @@
+"""Add message_outbox.lease_token
+
+Revision ID: a3f6d2b8c914
+Revises: 5c8e1f0a7d42
+Create Date: 2026-10-17 09:41:12.503817
+
+Jobs claimed before this migration have no token; their workers can no
+longer advance them and they are picked up again once the lease expires.
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a3f6d2b8c914"
+down_revision: Union[str, None] = "5c8e1f0a7d42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("message_outbox", sa.Column("lease_token", sa.UUID(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("message_outbox", "lease_token")
@@ -0,0 +1,161 @@
+"""Optionally partition messages and message_recipients by month
+
+Revision ID: c5e2a81f4d09
+Revises: 3f9c1d7a2b64
+Create Date: 2026-10-16 11:48:09.274315
+
+Opt-in: a no-op unless run as ``alembic -x partitioned=true upgrade head``
+(or with MESSAGES_PARTITIONED=true). The tables are rebuilt and their rows
+copied, which locks them for the duration; on a large installation run it
+in a maintenance window. ``python -m app.partitions maintain`` then keeps
+future partitions created and old ones detached.
+"""
+
+import os
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = "c5e2a81f4d09"
+down_revision: Union[str, None] = "3f9c1d7a2b64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+_INDEXES = (
+    'CREATE INDEX ix_messages_sender_id_timestamp '
+    'ON messages (sender_id, "timestamp" DESC, id DESC)',
+    "CREATE INDEX ix_message_recipients_recipient_id_read "
+    "ON message_recipients (recipient_id, read)",
+    "CREATE INDEX ix_message_recipients_inbox "
+    "ON message_recipients (recipient_id, message_timestamp DESC, message_id DESC)",
+    "CREATE INDEX ix_message_recipients_unread "
+    "ON message_recipients (recipient_id, message_timestamp DESC, message_id DESC) "
+    "WHERE read = false",
+)
+
+
+def _requested() -> bool:
+    value = context.get_x_argument(as_dictionary=True).get(
+        "partitioned", os.getenv("MESSAGES_PARTITIONED", "false")
+    )
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _is_partitioned(bind) -> bool:
+    return bool(bind.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('messages'))"
+    )).scalar())
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rebuild(partitioned: bool) -> None:
+    """Recreate both tables in the requested layout and copy the rows over."""
+    bind = op.get_bind()
+
+    op.execute("ALTER TABLE message_recipients RENAME TO message_recipients_old")
+    op.execute("ALTER TABLE messages RENAME TO messages_old")
+    # Index names are schema-wide; free them up for the new tables
+    op.execute("ALTER INDEX messages_pkey RENAME TO messages_old_pkey")
+    op.execute("ALTER INDEX message_recipients_pkey RENAME TO message_recipients_old_pkey")
+    op.execute(
+        "ALTER TABLE message_recipients_old "
+        "DROP CONSTRAINT uq_message_recipients_message_id_recipient_id"
+    )
+    for name in (
+        "ix_messages_sender_id_timestamp",
+        "ix_message_recipients_recipient_id_read",
+        "ix_message_recipients_inbox",
+        "ix_message_recipients_unread",
+    ):
+        op.execute(f"DROP INDEX {name}")
+
+    # Unique constraints on a partitioned table must include the partition key
+    key = ', "timestamp"' if partitioned else ""
+    recipient_key = ", message_timestamp" if partitioned else ""
+    op.execute(f"""
+        CREATE TABLE messages (
+            id UUID NOT NULL,
+            sender_id UUID NOT NULL REFERENCES users (id),
+            subject VARCHAR(500),
+            content TEXT NOT NULL,
+            "timestamp" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT messages_pkey PRIMARY KEY (id{key})
+        ){' PARTITION BY RANGE ("timestamp")' if partitioned else ''}
+    """)
+    op.execute(f"""
+        CREATE TABLE message_recipients (
+            id UUID NOT NULL,
+            message_id UUID NOT NULL,
+            message_timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            recipient_id UUID NOT NULL REFERENCES users (id),
+            read BOOLEAN NOT NULL,
+            read_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT message_recipients_pkey PRIMARY KEY (id{recipient_key}),
+            CONSTRAINT uq_message_recipients_message_id_recipient_id
+                UNIQUE (message_id, recipient_id{recipient_key}),
+            FOREIGN KEY (message_id{recipient_key}) REFERENCES messages (id{key})
+        ){' PARTITION BY RANGE (message_timestamp)' if partitioned else ''}
+    """)
+    for statement in _INDEXES:
+        op.execute(statement)
+
+    if partitioned:
+        oldest = bind.execute(sa.text('SELECT min("timestamp") FROM messages_old')).scalar()
+        now = datetime.now(timezone.utc)
+        month = date((oldest or now).year, (oldest or now).month, 1)
+        last = _add_months(date(now.year, now.month, 1), MONTHS_AHEAD)
+        while month <= last:
+            bounds = (
+                f"FROM ('{month.isoformat()} 00:00:00+00') "
+                f"TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+            )
+            op.execute(
+                f"CREATE TABLE messages_p{month:%Y_%m} "
+                f"PARTITION OF messages FOR VALUES {bounds}"
+            )
+            op.execute(
+                f"CREATE TABLE message_recipients_p{month:%Y_%m} "
+                f"PARTITION OF message_recipients FOR VALUES {bounds}"
+            )
+            month = _add_months(month, 1)
+
+    op.execute(
+        'INSERT INTO messages (id, sender_id, subject, content, "timestamp") '
+        'SELECT id, sender_id, subject, content, "timestamp" FROM messages_old'
+    )
+    op.execute(
+        "INSERT INTO message_recipients "
+        "(id, message_id, message_timestamp, recipient_id, read, read_at) "
+        "SELECT id, message_id, message_timestamp, recipient_id, read, read_at "
+        "FROM message_recipients_old"
+    )
+    # Dropping a partitioned parent drops its partitions too
+    op.execute("DROP TABLE message_recipients_old")
+    op.execute("DROP TABLE messages_old")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not _requested() or _is_partitioned(bind):
+        return
+    _rebuild(partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not _is_partitioned(bind):
+        return
+    _rebuild(partitioned=False)
@@ -0,0 +1,54 @@
+"""Add message_outbox for asynchronous recipient fan-out
+
+Revision ID: d81f3a6c0b57
+Revises: 9a4d6b3e8f21
+Create Date: 2026-10-16 14:22:31.908614
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d81f3a6c0b57"
+down_revision: Union[str, None] = "9a4d6b3e8f21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "message_outbox",
+        sa.Column("message_id", sa.UUID(), nullable=False),
+        sa.Column("message_timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("recipient_ids", sa.JSON(), nullable=False),
+        sa.Column("total_count", sa.Integer(), nullable=False),
+        sa.Column("processed_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("status", sa.String(length=16), server_default="pending", nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("message_id"),
+    )
+    op.create_index(
+        "ix_message_outbox_status_created_at",
+        "message_outbox",
+        ["status", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_message_outbox_status_created_at", table_name="message_outbox")
+    op.drop_table("message_outbox")
@@ -0,0 +1,37 @@
+"""Add a version and updated_at to user_mailbox_stats
+
+Revision ID: e4a7c2d9b813
+Revises: 7b2d9e4c1f38
+Create Date: 2026-10-16 16:41:05.317724
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e4a7c2d9b813"
+down_revision: Union[str, None] = "7b2d9e4c1f38"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "user_mailbox_stats",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "user_mailbox_stats",
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("user_mailbox_stats", "updated_at")
+    op.drop_column("user_mailbox_stats", "version")
@@ -0,0 +1,211 @@
+# Read-through cache for users and messages
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    async def delete(self, *keys: str) -> None: ...
+
+    async def clear(self) -> None: ...
+
+
+class MemoryCache:
+    """Bounded in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache:
+    """Backend for any client with the redis.asyncio get/set/delete API."""
+
+    def __init__(self, client: Any, prefix: str = "message-system:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package") from exc
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def clear(self) -> None:
+        keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+class Cache:
+    """Stores Pydantic models as JSON in a backend and counts hits/misses.
+
+    Backend errors are logged and treated as misses so an unavailable cache
+    never fails a request. So are entries that no longer validate (corrupt,
+    or written under an older schema by another release sharing Redis);
+    those are deleted so the next lookup stores a fresh copy.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend], ttl: float = 60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalid_entries = 0
+        self.invalidations = 0
+
+    async def get(self, key: str, model: Type[ModelT]) -> Optional[ModelT]:
+        if self.backend is None:
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception:
+            logger.exception("Cache get failed for %s", key)
+            self.errors += 1
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        try:
+            cached = model.model_validate_json(value)
+        except (ValidationError, ValueError):
+            logger.warning("Discarding unreadable cache entry %s", key, exc_info=True)
+            self.invalid_entries += 1
+            self.misses += 1
+            try:
+                await self.backend.delete(key)
+            except Exception:
+                logger.exception("Cache delete failed for %s", key)
+                self.errors += 1
+            return None
+        self.hits += 1
+        return cached
+
+    async def set(self, key: str, value: BaseModel, ttl: Optional[float] = None) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(key, value.model_dump_json().encode(), ttl or self.ttl)
+        except Exception:
+            logger.exception("Cache set failed for %s", key)
+            self.errors += 1
+
+    async def get_or_load(
+        self,
+        key: str,
+        model: Type[ModelT],
+        loader: Callable[[], Awaitable[Optional[ModelT]]],
+    ) -> Optional[ModelT]:
+        """Return the cached value, or call `loader` and cache what it returns.
+
+        A `None` from the loader (row not found) is not cached.
+        """
+        value = await self.get(key, model)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value)
+        return value
+
+    async def invalidate(self, *keys: str) -> None:
+        if self.backend is None or not keys:
+            return
+        self.invalidations += len(keys)
+        try:
+            await self.backend.delete(*keys)
+        except Exception:
+            logger.exception("Cache invalidation failed for %s", keys)
+            self.errors += 1
+
+    async def clear(self) -> None:
+        if self.backend is not None:
+            await self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "errors": self.errors,
+            "invalid_entries": self.invalid_entries,
+            "invalidations": self.invalidations,
+        }
+
+
+def user_key(user_id: Any) -> str:
+    return f"user:{user_id}"
+
+
+def message_key(message_id: Any) -> str:
+    return f"message:{message_id}"
+
+
+def build_cache() -> Cache:
+    backend_name = os.getenv("CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+    backend: Optional[CacheBackend]
+    if backend_name == "redis":
+        backend = RedisCache.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    elif backend_name == "memory":
+        backend = MemoryCache(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "10000")))
+    else:
+        backend = None
+    return Cache(backend, ttl=ttl)
+
+
+cache = build_cache()
@@ -0,0 +1,215 @@
+# Transparent compression of message bodies at rest
+import argparse
+import asyncio
+import logging
+import os
+import zlib
+from typing import Any, Dict, Optional, Union
+
+from sqlalchemy import LargeBinary, bindparam, case, event, func, select, type_coerce
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import NullType, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Every stored body starts with a one-byte codec tag. Bodies written before
+# compression existed carry no tag; they only survive as TEXT on SQLite.
+PLAIN = b"\x00"
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+
+CODECS = ("none", "zlib", "zstd")
+
+# Bodies shorter than this are stored as-is: below a kilobyte or so the
+# saving rarely pays for the CPU on every read
+MIN_BYTES = int(os.getenv("CONTENT_COMPRESS_MIN_BYTES", "1024"))
+CODEC = os.getenv("CONTENT_CODEC", "zlib").lower()
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+Stored = Union[bytes, memoryview, str]
+
+
+def _zstd():
+    if zstandard is None:
+        raise RuntimeError("zstd-compressed content needs the zstandard package")
+    return zstandard
+
+
+def compress(text: str, codec: str = CODEC, min_bytes: int = MIN_BYTES) -> bytes:
+    """Encode `text` for storage, compressing it if that makes it smaller."""
+    raw = text.encode()
+    if len(raw) >= min_bytes and codec != "none":
+        if codec == "zstd":
+            packed = ZSTD + _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        elif codec == "zlib":
+            packed = ZLIB + zlib.compress(raw, ZLIB_LEVEL)
+        else:
+            raise ValueError(f"Unknown content codec {codec!r}")
+        if len(packed) <= len(raw):
+            return packed
+    return PLAIN + raw
+
+
+def decompress(value: Stored) -> str:
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    tag, body = value[:1], value[1:]
+    if tag == PLAIN:
+        return body.decode()
+    if tag == ZLIB:
+        return zlib.decompress(body).decode()
+    if tag == ZSTD:
+        return _zstd().ZstdDecompressor().decompress(body).decode()
+    raise ValueError(f"Unknown content codec tag {tag!r}")
+
+
+def decompress_head(value: Stored, chars: int) -> str:
+    """The first `chars` characters of a stored body.
+
+    zlib bodies are only inflated as far as needed; `value` may itself be
+    just the start of a plain body, as selected by `head_sql`.
+    """
+    if isinstance(value, str):
+        return value[:chars]
+    value = bytes(value)
+    tag, body = value[:1], value[1:]
+    # A UTF-8 character is at most four bytes
+    limit = chars * 4
+    if tag == PLAIN:
+        raw = body[:limit]
+    elif tag == ZLIB:
+        raw = zlib.decompressobj().decompress(body, limit)
+    else:
+        return decompress(value)[:chars]
+    # The cut may have split the last character
+    return raw.decode(errors="ignore")[:chars]
+
+
+def head_sql(column, chars: int):
+    """SQL for enough of a stored body to read its first `chars` characters.
+
+    Plain bodies are cut down in the database; compressed ones are returned
+    whole, since their prefix is not a prefix of the text. Feed the result
+    to `decompress_head`.
+    """
+    return type_coerce(
+        case(
+            (
+                func.substr(column, 1, 1, type_=LargeBinary) == PLAIN,
+                func.substr(column, 1, 1 + chars * 4, type_=LargeBinary),
+            ),
+            else_=column,
+        ),
+        NullType(),
+    )
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored codec-tagged in a binary column.
+
+    Bodies of MIN_BYTES or more are compressed with CODEC on write; reads
+    decode whatever codec a row was written with, so CODEC can change at
+    any time. Use `head_sql` rather than SQL string functions on it.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    @property
+    def python_type(self):
+        return str
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        return None if value is None else compress(value)
+
+    def process_result_value(self, value: Optional[Stored], dialect) -> Optional[str]:
+        return None if value is None else decompress(value)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # SQLite's full-text index triggers call message_text() to index the
+    # plaintext of each body; only SQLite connections have create_function
+    create_function = getattr(dbapi_connection, "create_function", None)
+    if create_function is not None:
+        create_function("message_text", 1, decompress, deterministic=True)
+
+
+async def backfill(
+    db: AsyncSession,
+    codec: str = CODEC,
+    min_bytes: int = MIN_BYTES,
+    batch_size: int = 500,
+) -> Dict[str, Any]:
+    """Re-encode every stored body with `codec`, one transaction per batch.
+
+    Rows already stored the way `codec` would store them are left alone,
+    so the job can be interrupted and rerun. ``codec="none"`` stores
+    everything uncompressed again (needed before downgrading the schema).
+    """
+    from .models import Message
+
+    messages = Message.__table__
+    stored = type_coerce(messages.c.content, NullType())
+    rewrite = (
+        messages.update()
+        .where(messages.c.id == bindparam("b_id"), messages.c.timestamp == bindparam("b_timestamp"))
+        .values(content=bindparam("b_content", type_=LargeBinary))
+    )
+    stats = {"scanned": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = None
+    while True:
+        query = select(messages.c.id, messages.c.timestamp, stored.label("content"))
+        if last_id is not None:
+            query = query.where(messages.c.id > last_id)
+        rows = (await db.execute(query.order_by(messages.c.id).limit(batch_size))).all()
+        if not rows:
+            return stats
+        updates = []
+        for row in rows:
+            before = row.content.encode() if isinstance(row.content, str) else bytes(row.content)
+            after = compress(decompress(row.content), codec, min_bytes)
+            stats["bytes_before"] += len(before)
+            stats["bytes_after"] += len(after)
+            if after != before:
+                updates.append({"b_id": row.id, "b_timestamp": row.timestamp, "b_content": after})
+        if updates:
+            await db.execute(rewrite, updates)
+        await db.commit()
+        stats["scanned"] += len(rows)
+        stats["rewritten"] += len(updates)
+        last_id = rows[-1].id
+        logger.info("Backfilled %s messages, rewrote %s", stats["scanned"], stats["rewritten"])
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Message body compression")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--codec", choices=CODECS, default=CODEC)
+    parser.add_argument("--min-bytes", type=int, default=MIN_BYTES)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from .db import AsyncSessionLocal, engine
+
+    async with AsyncSessionLocal() as session:
+        stats = await backfill(session, args.codec, args.min_bytes, args.batch_size)
+    await engine.dispose()
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    print(
+        f"Scanned {stats['scanned']} message(s), rewrote {stats['rewritten']}; "
+        f"{stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes ({saved:,} saved)"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,70 @@
+# Conditional GET: ETag / Last-Modified validators and 304 responses
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response, status
+
+# Clients may keep responses but must revalidate before reusing them
+CACHE_CONTROL = "private, no-cache"
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without a zone; they are all UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str
+    last_modified: Optional[datetime] = None
+
+    @classmethod
+    def build(
+        cls, request: Request, *signals: Any, last_modified: Optional[datetime] = None
+    ) -> "Validators":
+        """Validators for `request` from cheap signals that change with its data.
+
+        The path and query string are part of the ETag, so every page, view
+        and fieldset of a resource gets its own. ETags are weak: the same
+        data may not always render to the same bytes. Only pass
+        `last_modified` for data that cannot change twice within a second;
+        If-Modified-Since cannot tell those changes apart.
+        """
+        key = repr((request.url.path, request.url.query) + signals).encode()
+        etag = f'W/"{hashlib.blake2b(key, digest_size=12).hexdigest()}"'
+        return cls(etag, _utc(last_modified) if last_modified else None)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        """Whether the client's copy is current (RFC 9110 section 13.2.2).
+
+        If-None-Match takes precedence; If-Modified-Since is only consulted
+        without it, at the one-second resolution of HTTP dates.
+        """
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            opaque = self.etag.removeprefix("W/")
+            return any(
+                tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(",")
+            )
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        try:
+            since = _utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+        return self.last_modified.replace(microsecond=0) <= since
+
+    def not_modified(self) -> Response:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self.headers())
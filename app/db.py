@@ -1,9 +1,20 @@
 # DB connection setup
+import asyncio
+import logging
 import os
-from typing import AsyncGenerator
+import time
+from dataclasses import dataclass, replace
+from typing import Any, AsyncGenerator, Callable, Dict, Iterable, Optional
+from uuid import uuid4
 
-from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
-                                    create_async_engine)
+from fastapi import Request
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import (AsyncConnection, AsyncEngine, AsyncSession,
+                                    async_sessionmaker, create_async_engine)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
 
 DB_USER = os.getenv("DB_USER", "bnhan2710")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "mynameisnhan")
@@ -11,17 +22,244 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "message-system")
 
-DATABASE_URL = (
+
+def _async_url(url: str) -> str:
+    """Point plain postgresql:// URLs (as in .env.example) at asyncpg."""
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+
+DATABASE_URL = _async_url(os.getenv(
+    "DATABASE_URL",
     f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
+))
+# Optional streaming replica for read-only endpoints
+REPLICA_DATABASE_URL = _async_url(os.getenv("REPLICA_DATABASE_URL", ""))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class EngineSettings:
+    """Engine and pool configuration, read from the environment.
+
+    Pool sizes are per worker process: with N uvicorn workers the database
+    sees up to N * (pool_size + max_overflow) connections.
+    """
+    url: str
+    echo: bool = False
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 10.0
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800
+    # Prepared statements cached per connection. 0 also turns off asyncpg's
+    # own cache and names each statement uniquely, as pgbouncer needs in
+    # transaction pooling mode (see _asyncpg_connect_args)
+    statement_cache_size: int = 100
+    warm_connections: int = 0
+
+    @classmethod
+    def from_env(cls, url: str = DATABASE_URL) -> "EngineSettings":
+        development = os.getenv("APP_ENV", "production").lower() in ("dev", "development", "local")
+        pool_size = int(os.getenv("DB_POOL_SIZE", "10"))
+        return cls(
+            url=url,
+            echo=_env_bool("DB_ECHO", development),
+            pool_size=pool_size,
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+            warm_connections=int(os.getenv("DB_POOL_WARM", str(pool_size))),
+        )
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection.
+
+    The time covers waiting for a free slot plus opening a new connection
+    when the pool grows.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid4()}__"
+
+
+def _asyncpg_connect_args(settings: EngineSettings) -> Dict[str, Any]:
+    """connect_args for the asyncpg dialect.
+
+    Behind pgbouncer in transaction pooling mode consecutive statements may
+    run on different server connections, so a statement prepared on one is
+    missing on the next. With a cache size of 0 nothing is reused and every
+    statement gets a fresh name, so names never collide either. pgbouncer
+    should also reset server connections (server_reset_query_always with
+    DISCARD ALL) so that one-off statements do not pile up.
+    """
+    connect_args: Dict[str, Any] = {
+        "prepared_statement_cache_size": settings.statement_cache_size
+    }
+    if settings.statement_cache_size == 0:
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_name_func=_unique_statement_name,
+        )
+    return connect_args
+
+
+def create_engine_from_settings(settings: EngineSettings) -> AsyncEngine:
+    kwargs: Dict[str, Any] = {"echo": settings.echo}
+    if settings.url.startswith("sqlite"):
+        return create_async_engine(settings.url, **kwargs)
+
+    kwargs.update(
+        poolclass=TimedQueuePool,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_pre_ping=settings.pool_pre_ping,
+        pool_recycle=settings.pool_recycle,
+    )
+    if settings.url.startswith("postgresql+asyncpg"):
+        kwargs["connect_args"] = _asyncpg_connect_args(settings)
+    return create_async_engine(settings.url, **kwargs)
 
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine_settings = EngineSettings.from_env()
+engine = create_engine_from_settings(engine_settings)
 
 AsyncSessionLocal = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+replica_engine: Optional[AsyncEngine] = None
+ReplicaSessionLocal: Optional[async_sessionmaker] = None
+if REPLICA_DATABASE_URL:
+    replica_engine = create_engine_from_settings(replace(engine_settings, url=REPLICA_DATABASE_URL))
+    ReplicaSessionLocal = async_sessionmaker(
+        replica_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+
+class ReadRouter:
+    """Chooses the primary or the replica for read-only requests.
+
+    Reads go to the replica unless it is not configured, recently failed to
+    connect (then the primary is used for `retry_after` seconds), or one of
+    the request's path ids was written within `window` seconds. The last
+    rule gives read-your-writes for clients re-reading what they just wrote
+    while the replica catches up. Writes are tracked per process, so with
+    several workers the window only covers requests served by the same one.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker,
+        replica: Optional[async_sessionmaker] = None,
+        window: float = 5.0,
+        retry_after: float = 30.0,
+        max_tracked: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.window = window
+        self.retry_after = retry_after
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._written: Dict[str, float] = {}
+        self._replica_down_until = 0.0
+        self.primary_reads = 0
+        self.replica_reads = 0
+        self.pinned_reads = 0
+        self.fallbacks = 0
+
+    def record_write(self, *ids: Any) -> None:
+        """Pin reads of `ids` (user or message ids) to the primary for a while."""
+        if self.replica is None:
+            return
+        now = self._clock()
+        if len(self._written) >= self.max_tracked:
+            self._written = {key: at for key, at in self._written.items() if at > now}
+        expires_at = now + self.window
+        for id_ in ids:
+            self._written[str(id_)] = expires_at
+
+    def _recently_written(self, ids: Iterable[Any]) -> bool:
+        now = self._clock()
+        return any(self._written.get(str(id_), 0.0) > now for id_ in ids)
+
+    async def session(self, ids: Iterable[Any] = ()) -> AsyncSession:
+        if self.replica is None or self._replica_down_until > self._clock():
+            self.primary_reads += 1
+            return self.primary()
+        if self._recently_written(ids):
+            self.pinned_reads += 1
+            return self.primary()
+
+        session = self.replica()
+        try:
+            # Connect now so an unreachable replica can still fall back
+            await session.connection()
+        except (exc.DBAPIError, OSError):
+            await session.close()
+            logger.warning("Replica unavailable, reading from the primary", exc_info=True)
+            self._replica_down_until = self._clock() + self.retry_after
+            self.fallbacks += 1
+            return self.primary()
+        self.replica_reads += 1
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replica_configured": self.replica is not None,
+            "replica_available": self._replica_down_until <= self._clock(),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+read_router = ReadRouter(
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    window=float(os.getenv("READ_YOUR_WRITES_SECONDS", "5")),
+    retry_after=float(os.getenv("REPLICA_RETRY_SECONDS", "30")),
+)
+
+
+def record_write(*ids: Any) -> None:
+    read_router.record_write(*ids)
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
@@ -34,6 +272,15 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Session for read-only handlers, routed by `read_router`."""
+    path_ids = [value for key, value in request.path_params.items() if key.endswith("_id")]
+    session = await read_router.session(path_ids)
+    try:
+        yield session
+    finally:
+        await session.close()
+
 async def init_db():
     """Initialize the database schema."""
     async with engine.begin() as conn:
@@ -47,10 +294,68 @@ async def test_connection() -> bool:
     """Test the database connection."""
     try:
         async with engine.connect() as conn:
-            await conn.execute("SELECT 1")
+            await conn.execute(text("SELECT 1"))
         return True
     except Exception as e:
         print(f"Database connection test failed: {e}")
         return False
-    
 
+
+async def warm_pool(target: AsyncEngine = engine, connections: int = 0) -> int:
+    """Open `connections` pooled connections up front.
+
+    Run at startup so the first requests after a deploy do not pay for
+    TCP/TLS/auth handshakes. Capped at the pool's base size, since overflow
+    connections are discarded on check-in. Connections that fail to open are
+    logged and skipped rather than raised. Returns how many were opened.
+    """
+    if not isinstance(target.pool, AsyncAdaptedQueuePool):
+        return 0
+    connections = min(connections, target.pool.size())
+    if connections <= 0:
+        return 0
+
+    async def open_one() -> AsyncConnection:
+        conn = await target.connect()
+        try:
+            await conn.execute(text("SELECT 1"))
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    # All are held until the last one opens, so each gets its own connection
+    results = await asyncio.gather(
+        *(open_one() for _ in range(connections)), return_exceptions=True
+    )
+    opened = [result for result in results if isinstance(result, AsyncConnection)]
+    for conn in opened:
+        await conn.close()
+    failed = [result for result in results if isinstance(result, BaseException)]
+    if failed:
+        logger.warning(
+            "Opened %d of %d pool connections at startup: %r",
+            len(opened), connections, failed[0],
+        )
+    return len(opened)
+
+
+def pool_stats(target: AsyncEngine = engine) -> Dict[str, Any]:
+    pool = target.pool
+    stats: Dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            wait_avg_ms=round(pool.wait_seconds_total / pool.checkouts * 1000, 3)
+            if pool.checkouts else None,
+            wait_max_ms=round(pool.wait_seconds_max * 1000, 3),
+        )
+    return stats
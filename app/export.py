@@ -0,0 +1,112 @@
+# Streaming NDJSON export of everything a user sent and received
+import os
+from typing import AsyncIterator, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Message, MessageRecipient
+from .schemas import ExportedReceivedMessage, ExportedSentMessage, MessageRecipientInfo
+
+# Rows per server-side cursor fetch, and per chunk written to the client
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def _line(model) -> bytes:
+    return model.__pydantic_serializer__.to_json(model) + b"\n"
+
+
+def _sent_query(user_id: UUID):
+    # One row per (message, recipient), grouped back into messages as the
+    # rows stream past; the outer join keeps messages still being fanned out
+    return (
+        select(
+            Message.id,
+            Message.subject,
+            Message.content,
+            Message.sender_id,
+            Message.timestamp,
+            MessageRecipient.id.label("recipient_row_id"),
+            MessageRecipient.recipient_id,
+            MessageRecipient.read,
+            MessageRecipient.read_at,
+        )
+        .outerjoin(
+            MessageRecipient,
+            (MessageRecipient.message_id == Message.id)
+            & (MessageRecipient.message_timestamp == Message.timestamp)
+        )
+        .where(Message.sender_id == user_id)
+        .order_by(Message.timestamp, Message.id)
+    )
+
+
+def _received_query(user_id: UUID):
+    return (
+        select(
+            MessageRecipient.id,
+            MessageRecipient.message_id,
+            Message.subject,
+            Message.content,
+            Message.sender_id,
+            MessageRecipient.message_timestamp.label("timestamp"),
+            MessageRecipient.read,
+            MessageRecipient.read_at,
+        )
+        .join(
+            Message,
+            (MessageRecipient.message_id == Message.id)
+            & (MessageRecipient.message_timestamp == Message.timestamp)
+        )
+        .where(MessageRecipient.recipient_id == user_id)
+        .order_by(MessageRecipient.message_timestamp, MessageRecipient.message_id)
+    )
+
+
+async def export_mailbox(
+    db: AsyncSession, user_id: UUID, batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """NDJSON lines for `user_id`'s sent, then received, messages, oldest first.
+
+    Both queries run on server-side cursors fetched `batch_size` rows at a
+    time (`BATCH_SIZE` by default), so memory use does not grow with the
+    mailbox. Sent messages carry their recipients' read state; the rows of
+    one message are the only ones held across fetches.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    result = await db.stream(_sent_query(user_id).execution_options(yield_per=batch_size))
+    current: Optional[ExportedSentMessage] = None
+    recipients: List[MessageRecipientInfo] = []
+    async for rows in result.partitions():
+        chunk = []
+        for row in rows:
+            if current is None or row.id != current.id:
+                if current is not None:
+                    chunk.append(_line(current))
+                recipients = []
+                current = ExportedSentMessage.model_construct(
+                    id=row.id,
+                    subject=row.subject,
+                    content=row.content,
+                    sender_id=row.sender_id,
+                    timestamp=row.timestamp,
+                    recipients=recipients,
+                )
+            if row.recipient_row_id is not None:
+                recipients.append(MessageRecipientInfo.model_construct(
+                    id=row.recipient_row_id,
+                    recipient_id=row.recipient_id,
+                    read=row.read,
+                    read_at=row.read_at,
+                ))
+        if chunk:
+            yield b"".join(chunk)
+    if current is not None:
+        yield _line(current)
+
+    result = await db.stream(_received_query(user_id).execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield b"".join(
+            _line(ExportedReceivedMessage.model_construct(**row._mapping)) for row in rows
+        )
@@ -0,0 +1,100 @@
+# Set-based recipient fan-out for send_message
+import uuid
+from datetime import datetime
+from typing import Iterable, List, Sequence, Set
+
+from sqlalchemy import Row, any_, bindparam, false, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, TIMESTAMP, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import MessageRecipient, User
+
+# Keeps each statement under SQLite's bound-parameter limit
+SQLITE_INSERT_CHUNK_SIZE = 500
+LOOKUP_CHUNK_SIZE = 5000
+
+_UUID_ARRAY = ARRAY(UUID(as_uuid=True))
+_recipients = MessageRecipient.__table__
+_returning = (
+    _recipients.c.id,
+    _recipients.c.recipient_id,
+    _recipients.c.read,
+    _recipients.c.read_at,
+)
+
+
+def dedupe(ids: Iterable[uuid.UUID]) -> List[uuid.UUID]:
+    """Drop repeated ids, keeping first-seen order."""
+    return list(dict.fromkeys(ids))
+
+
+def _chunks(items: Sequence, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def existing_user_ids(db: AsyncSession, user_ids: Sequence[uuid.UUID]) -> Set[uuid.UUID]:
+    """Return the subset of `user_ids` that exist."""
+    if db.get_bind().dialect.name == "postgresql":
+        result = await db.execute(
+            select(User.id).where(User.id == any_(bindparam("ids", user_ids, type_=_UUID_ARRAY)))
+        )
+        return set(result.scalars().all())
+
+    found: Set[uuid.UUID] = set()
+    for chunk in _chunks(user_ids, LOOKUP_CHUNK_SIZE):
+        result = await db.execute(select(User.id).where(User.id.in_(chunk)))
+        found.update(result.scalars().all())
+    return found
+
+
+async def insert_recipients(
+    db: AsyncSession,
+    message_id: uuid.UUID,
+    message_timestamp: datetime,
+    recipient_ids: Sequence[uuid.UUID],
+) -> List[Row]:
+    """Insert one unread `message_recipients` row per recipient.
+
+    Postgres gets a single ``INSERT ... SELECT unnest(...)`` statement no
+    matter how many recipients there are; other backends get multi-row
+    inserts in chunks. Either way the created rows come back via RETURNING.
+    """
+    if not recipient_ids:
+        return []
+
+    ids = [uuid.uuid4() for _ in recipient_ids]
+
+    if db.get_bind().dialect.name == "postgresql":
+        source = select(
+            func.unnest(bindparam("ids", ids, type_=_UUID_ARRAY), type_=UUID(as_uuid=True)),
+            literal(message_id, UUID(as_uuid=True)),
+            literal(message_timestamp, TIMESTAMP(timezone=True)),
+            func.unnest(
+                bindparam("recipient_ids", list(recipient_ids), type_=_UUID_ARRAY),
+                type_=UUID(as_uuid=True),
+            ),
+            false(),
+        )
+        result = await db.execute(
+            insert(_recipients)
+            .from_select(["id", "message_id", "message_timestamp", "recipient_id", "read"], source)
+            .returning(*_returning)
+        )
+        return list(result.all())
+
+    rows: List[Row] = []
+    values = [
+        {
+            "id": row_id,
+            "message_id": message_id,
+            "message_timestamp": message_timestamp,
+            "recipient_id": recipient_id,
+            "read": False,
+        }
+        for row_id, recipient_id in zip(ids, recipient_ids)
+    ]
+    for chunk in _chunks(values, SQLITE_INSERT_CHUNK_SIZE):
+        result = await db.execute(insert(_recipients).values(chunk).returning(*_returning))
+        rows.extend(result.all())
+    return rows
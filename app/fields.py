@@ -0,0 +1,100 @@
+# Sparse fieldsets: ?fields=id,timestamp,recipients.read
+import typing
+from typing import Any, Collection, Dict, Mapping, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+# A pydantic `include` spec; None means every field
+Include = Optional[Dict[str, Any]]
+
+FIELDS_DESCRIPTION = (
+    "Comma-separated fields to return, e.g. id,timestamp,recipients.read. "
+    "Fields that are not asked for are neither read from the database nor serialised."
+)
+
+
+def _list_item_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """The model inside a List[Model] or Optional[List[Model]] annotation."""
+    if typing.get_origin(annotation) is list:
+        item = typing.get_args(annotation)[0]
+        return item if isinstance(item, type) and issubclass(item, BaseModel) else None
+    for arg in typing.get_args(annotation):
+        item = _list_item_model(arg)
+        if item is not None:
+            return item
+    return None
+
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Include:
+    """Validate ?fields= against `model` and turn it into an `include` spec.
+
+    Fields holding lists of models take dotted names (``recipients.read``);
+    naming the list on its own selects all of its fields.
+    """
+    if fields is None:
+        return None
+    include: Dict[str, Any] = {}
+    unknown = []
+    for name in filter(None, (part.strip() for part in fields.split(","))):
+        field, _, child = name.partition(".")
+        info = model.model_fields.get(field)
+        item_model = _list_item_model(info.annotation) if info and child else None
+        if info is None or (child and (item_model is None or child not in item_model.model_fields)):
+            unknown.append(name)
+        elif not child:
+            include[field] = True
+        elif include.get(field) is not True:
+            include.setdefault(field, {"__all__": {}})["__all__"][child] = True
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    if not include:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields requested"
+        )
+    return include
+
+
+def wants(include: Include, field: str) -> bool:
+    return include is None or field in include
+
+
+def nested(include: Include, field: str) -> Include:
+    """The spec for the items of list field `field`."""
+    if include is None or include.get(field) is True:
+        return None
+    return include[field]["__all__"]
+
+
+def project(
+    columns: Sequence[Any],
+    include: Include,
+    always: Collection[str] = (),
+    sources: Mapping[str, Tuple[str, ...]] = {},
+) -> Tuple[Any, ...]:
+    """The subset of `columns` needed for the fields in `include`.
+
+    Columns are matched on their key (label). `always` names columns the
+    query itself needs, e.g. for the keyset cursor; `sources` maps a
+    column to the fields derived from it when they are named differently.
+    """
+    if include is None:
+        return tuple(columns)
+    return tuple(
+        column for column in columns
+        if column.key in always
+        or any(field in include for field in sources.get(column.key, (column.key,)))
+    )
+
+
+def list_include(include: Include, list_model: Type[BaseModel], items: str) -> Include:
+    """Apply an item spec to the `items` list of a list response."""
+    if include is None:
+        return None
+    spec: Dict[str, Any] = {name: True for name in list_model.model_fields}
+    spec[items] = {"__all__": include}
+    return spec
@@ -0,0 +1,191 @@
+# Bulk user import: CSV or NDJSON streamed from the request body
+import csv
+import os
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import User
+from .schemas import UserCreate, UserImportError, UserImportResult
+from .totals import add_row_count
+
+# Rows parsed before each insert and commit; bounds memory and transaction size
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Keeps each statement under SQLite's bound-parameter limit
+SQLITE_INSERT_CHUNK_SIZE = 500
+MAX_LINE_BYTES = 64 * 1024
+# Only the first few bad rows are reported back
+MAX_REPORTED_ERRORS = 20
+
+CSV_TYPES = ("text/csv",)
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+
+_users = User.__table__
+_UUID_ARRAY = ARRAY(UUID(as_uuid=True))
+
+
+def import_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in CSV_TYPES:
+        return "csv"
+    if media_type in NDJSON_TYPES:
+        return "ndjson"
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Send text/csv or application/x-ndjson"
+    )
+
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Numbered lines of `body`, holding at most one partial line."""
+    buffer = b""
+    number = 0
+    async for chunk in body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line.rstrip(b"\r")
+        if len(buffer) > MAX_LINE_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Line {number + 1} is longer than {MAX_LINE_BYTES} bytes"
+            )
+    if buffer.strip():
+        yield number + 1, buffer.rstrip(b"\r")
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in error.errors()
+        )
+    return str(error)
+
+
+class _Parser:
+    """Turns numbered lines into UserCreate rows, or the error for each line.
+
+    CSV needs a header naming ``email`` and ``name`` and takes one record
+    per line; quoted commas are fine, quoted newlines are not.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+
+    def parse(
+        self, lines: Sequence[Tuple[int, bytes]]
+    ) -> Tuple[List[UserCreate], List[Tuple[int, Exception]]]:
+        users: List[UserCreate] = []
+        errors: List[Tuple[int, Exception]] = []
+        for number, line in lines:
+            try:
+                user = self._parse_line(line)
+            except (ValidationError, UnicodeDecodeError, csv.Error) as error:
+                errors.append((number, error))
+            else:
+                if user is not None:
+                    users.append(user)
+        return users, errors
+
+    def _parse_line(self, line: bytes) -> Optional[UserCreate]:
+        if self.fmt == "ndjson":
+            return UserCreate.model_validate_json(line)
+        fields = next(csv.reader([line.decode("utf-8-sig" if self.header is None else "utf-8")]))
+        if self.header is not None:
+            return UserCreate.model_validate(dict(zip(self.header, fields)))
+        self.header = [name.strip().lower() for name in fields]
+        missing = {"email", "name"} - set(self.header)
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"CSV header is missing: {', '.join(sorted(missing))}"
+            )
+        return None
+
+
+async def insert_users(db: AsyncSession, users: Sequence[UserCreate]) -> int:
+    """Insert `users`, skipping emails that already exist; returns how many were created.
+
+    Postgres gets one ``INSERT ... SELECT unnest(...) ON CONFLICT (email)
+    DO NOTHING`` per call; SQLite gets the same conflict clause on
+    multi-row inserts in chunks.
+    """
+    if not users:
+        return 0
+    ids = [uuid.uuid4() for _ in users]
+
+    if db.get_bind().dialect.name == "postgresql":
+        source = select(
+            func.unnest(bindparam("ids", ids, type_=_UUID_ARRAY), type_=UUID(as_uuid=True)),
+            func.unnest(bindparam("emails", [u.email for u in users], type_=ARRAY(_users.c.email.type))),
+            func.unnest(bindparam("names", [u.name for u in users], type_=ARRAY(_users.c.name.type))),
+        )
+        result = await db.execute(
+            postgresql.insert(_users)
+            .from_select(["id", "email", "name"], source)
+            .on_conflict_do_nothing(index_elements=[_users.c.email])
+            .returning(_users.c.id)
+        )
+        return len(result.all())
+
+    created = 0
+    values = [
+        {"id": user_id, "email": user.email, "name": user.name}
+        for user_id, user in zip(ids, users)
+    ]
+    for start in range(0, len(values), SQLITE_INSERT_CHUNK_SIZE):
+        result = await db.execute(
+            sqlite.insert(_users)
+            .values(values[start:start + SQLITE_INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=[_users.c.email])
+            .returning(_users.c.id)
+        )
+        created += len(result.all())
+    return created
+
+
+async def import_users(
+    db: AsyncSession, body: AsyncIterator[bytes], fmt: str, chunk_size: Optional[int] = None
+) -> UserImportResult:
+    """Create the users in `body`, committing every `chunk_size` lines.
+
+    Rows whose email is already taken, by an existing user or earlier in
+    the upload, are skipped; rows that fail validation are counted and the
+    first few reported. Memory use does not depend on the upload size.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    parser = _Parser(fmt)
+    counts: Dict[str, int] = {"created": 0, "skipped": 0, "invalid": 0}
+    errors: List[UserImportError] = []
+    lines: List[Tuple[int, bytes]] = []
+
+    async def flush() -> None:
+        # Email validation is most of the CPU time; keep it off the event loop
+        users, invalid = await run_in_threadpool(parser.parse, lines)
+        lines.clear()
+        created = await insert_users(db, users)
+        await add_row_count(db, User.__tablename__, created)
+        await db.commit()
+        counts["created"] += created
+        counts["skipped"] += len(users) - created
+        counts["invalid"] += len(invalid)
+        for number, error in invalid[:MAX_REPORTED_ERRORS - len(errors)]:
+            errors.append(UserImportError(line=number, error=_error_message(error)))
+
+    async for number, line in _lines(body):
+        if line.strip():
+            lines.append((number, line))
+        if len(lines) >= chunk_size:
+            await flush()
+    await flush()
+
+    return UserImportResult(**counts, errors=errors)
@@ -0,0 +1,187 @@
+# Maintained per-user mailbox counters
+import argparse
+import asyncio
+import uuid
+from typing import Optional, Sequence
+
+from sqlalchemy import bindparam, func, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Message, MessageRecipient, User, UserMailboxStats
+
+SQLITE_UPSERT_CHUNK_SIZE = 500
+
+_stats = UserMailboxStats.__table__
+
+
+def upsert_insert(db: AsyncSession, table):
+    """Dialect-specific INSERT that supports ON CONFLICT clauses."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+async def record_delivery(db: AsyncSession, recipient_ids: Sequence[uuid.UUID]) -> None:
+    """Count one new unread inbox message for each of `recipient_ids`."""
+    if not recipient_ids:
+        return
+    # A fixed lock order keeps overlapping broadcasts from deadlocking
+    recipient_ids = sorted(recipient_ids)
+
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = postgresql.insert(_stats).from_select(
+            ["user_id", "unread_count", "total_count", "version", "updated_at"],
+            select(
+                func.unnest(
+                    bindparam("user_ids", recipient_ids, type_=ARRAY(UUID(as_uuid=True))),
+                    type_=UUID(as_uuid=True),
+                ),
+                literal(1),
+                literal(1),
+                literal(1),
+                func.now(),
+            ),
+        )
+        await db.execute(_increment_on_conflict(stmt))
+        return
+
+    for start in range(0, len(recipient_ids), SQLITE_UPSERT_CHUNK_SIZE):
+        chunk = recipient_ids[start:start + SQLITE_UPSERT_CHUNK_SIZE]
+        stmt = sqlite.insert(_stats).values(
+            [
+                {
+                    "user_id": user_id,
+                    "unread_count": 1,
+                    "total_count": 1,
+                    "version": 1,
+                    "updated_at": func.now(),
+                }
+                for user_id in chunk
+            ]
+        )
+        await db.execute(_increment_on_conflict(stmt))
+
+
+def _increment_on_conflict(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=[_stats.c.user_id],
+        set_={
+            "unread_count": _stats.c.unread_count + stmt.excluded.unread_count,
+            "total_count": _stats.c.total_count + stmt.excluded.total_count,
+            "version": _stats.c.version + 1,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+async def record_sent(db: AsyncSession, sender_id: uuid.UUID) -> None:
+    """Count one more sent message for `sender_id`."""
+    stmt = upsert_insert(db, _stats).values(user_id=sender_id, sent_count=1)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[_stats.c.user_id],
+            set_={"sent_count": _stats.c.sent_count + 1},
+        )
+    )
+
+
+async def record_reads(db: AsyncSession, user_id: uuid.UUID, count: int) -> None:
+    """Subtract `count` newly read messages from the user's unread counter."""
+    if count <= 0:
+        return
+    await db.execute(
+        update(_stats)
+        .where(_stats.c.user_id == user_id)
+        .values(
+            unread_count=_stats.c.unread_count - count,
+            version=_stats.c.version + 1,
+            updated_at=func.now(),
+        )
+    )
+
+
+async def reconcile(db: AsyncSession, user_ids: Optional[Sequence[uuid.UUID]] = None) -> int:
+    """Recompute counters from ``message_recipients`` and ``messages``.
+
+    Returns how many users had missing or drifted counters. Only the given
+    users are rebuilt when `user_ids` is passed, otherwise every user is.
+    Every rebuilt mailbox gets a new version, since a reconcile usually
+    follows rows disappearing (e.g. detached partitions).
+    """
+    actual = (
+        select(
+            User.id.label("user_id"),
+            func.count(MessageRecipient.id)
+            .filter(MessageRecipient.read == False)
+            .label("unread_count"),
+            func.count(MessageRecipient.id).label("total_count"),
+            select(func.count(Message.id))
+            .where(Message.sender_id == User.id)
+            .scalar_subquery()
+            .label("sent_count"),
+        )
+        .select_from(User)
+        .outerjoin(MessageRecipient, MessageRecipient.recipient_id == User.id)
+        .group_by(User.id)
+    )
+    if user_ids is not None:
+        actual = actual.where(User.id.in_(user_ids))
+    actual = actual.subquery()
+
+    drift_result = await db.execute(
+        select(func.count())
+        .select_from(actual)
+        .outerjoin(_stats, _stats.c.user_id == actual.c.user_id)
+        .where(
+            (_stats.c.user_id.is_(None))
+            | (_stats.c.unread_count != actual.c.unread_count)
+            | (_stats.c.total_count != actual.c.total_count)
+            | (_stats.c.sent_count != actual.c.sent_count)
+        )
+    )
+    drifted = drift_result.scalar_one()
+
+    stmt = upsert_insert(db, _stats).from_select(
+        ["user_id", "unread_count", "total_count", "sent_count"],
+        # WHERE true keeps SQLite from parsing ON CONFLICT as a join constraint
+        select(
+            actual.c.user_id, actual.c.unread_count, actual.c.total_count, actual.c.sent_count
+        ).where(true()),
+    )
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[_stats.c.user_id],
+            set_={
+                "unread_count": stmt.excluded.unread_count,
+                "total_count": stmt.excluded.total_count,
+                "sent_count": stmt.excluded.sent_count,
+                "version": _stats.c.version + 1,
+                "updated_at": func.now(),
+            },
+        )
+    )
+    return drifted
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Mailbox counter maintenance")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--user-id", action="append", type=uuid.UUID, dest="user_ids")
+    args = parser.parse_args()
+
+    from .db import AsyncSessionLocal, engine
+    from .totals import reconcile_row_counts
+
+    async with AsyncSessionLocal() as session:
+        drifted = await reconcile(session, args.user_ids)
+        if args.user_ids is None:
+            await reconcile_row_counts(session, User.__table__)
+        await session.commit()
+    await engine.dispose()
+    print(f"Reconciled mailbox counters, {drifted} user(s) had drifted")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,16 +1,52 @@
 # Entry point for FastAPI app
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from .cache import cache
+from .db import engine, engine_settings, get_db, pool_stats, read_router, replica_engine, warm_pool
+from .metrics import CONTENT_TYPE, METRICS_ENABLED, instrument, metrics
+from .outbox import backlog, outbox_worker
+from .realtime import broker
+from .responses import FAST_JSON_ENABLED, FastJSONResponse
 from .routes import router
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await warm_pool(engine, engine_settings.warm_connections)
+        if replica_engine is not None:
+            await warm_pool(replica_engine, engine_settings.warm_connections)
+    except Exception:
+        # Not fatal: connections are opened on demand instead
+        logger.exception("Database pool warm-up failed")
+    await broker.start()
+    if outbox_worker is not None:
+        await outbox_worker.start()
+    yield
+    if outbox_worker is not None:
+        await outbox_worker.stop()
+    await broker.stop()
+
+
 app = FastAPI(
     title="Message System API",
     description="A messaging system API with user management and message functionality",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse if FAST_JSON_ENABLED else JSONResponse,
+    lifespan=lifespan
 )
 
 app.include_router(router, prefix="/api/v1")
+if METRICS_ENABLED:
+    instrument(app)
 
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -19,3 +55,32 @@ async def read_root():
 @app.get("/health", tags=["Health Check"])
 async def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics", tags=["Health Check"], response_class=Response)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/cache", tags=["Health Check"])
+async def cache_stats():
+    return cache.stats()
+
+@app.get("/health/realtime", tags=["Health Check"])
+async def realtime_stats():
+    return broker.stats()
+
+@app.get("/health/db-pool", tags=["Health Check"])
+async def db_pool_stats():
+    return pool_stats(engine)
+
+@app.get("/health/db-replica", tags=["Health Check"])
+async def db_replica_stats():
+    stats = read_router.stats()
+    if replica_engine is not None:
+        stats["pool"] = pool_stats(replica_engine)
+    return stats
+
+@app.get("/health/outbox", tags=["Health Check"])
+async def outbox_stats(db: AsyncSession = Depends(get_db)):
+    stats = await backlog(db)
+    stats["worker"] = outbox_worker.stats() if outbox_worker is not None else None
+    return stats
@@ -0,0 +1,284 @@
+# Per-route request metrics in the Prometheus text format
+import bisect
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import fastapi.routing
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# METRICS=false leaves /metrics empty and skips all instrumentation
+METRICS_ENABLED = os.getenv("METRICS", "true").lower() not in ("0", "false", "no")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements per request; a route creeping up these buckets has grown an N+1
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        buckets = []
+        for bound, count in zip((*map(_format, self.bounds), "+Inf"), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class _RouteStats:
+    __slots__ = ("latency", "statements", "db_seconds", "serialization_seconds", "responses")
+
+    def __init__(self):
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.statements = _Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.responses: Dict[int, int] = {}
+
+
+class _RequestStats:
+    """What one request spent, filled in as it runs."""
+    __slots__ = ("statements", "db_seconds", "serialization_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+_current: ContextVar[Optional[_RequestStats]] = ContextVar("request_metrics", default=None)
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _route_template(scope: Dict[str, Any]) -> str:
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return UNMATCHED_ROUTE
+    # Routes from include_router keep their own path; find the prefix the
+    # request was routed through and put it back
+    path, regex = scope["path"], getattr(route, "path_regex", None)
+    if regex is None or regex.match(path):
+        return template
+    start = path.find("/", 1)
+    while start != -1:
+        if regex.match(path[start:]):
+            return path[:start] + template
+        start = path.find("/", start + 1)
+    return template
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RouteMetrics:
+    """Latency, SQL and serialisation totals per (method, route template).
+
+    Routes are labelled by their path template, so label cardinality is
+    bounded by the route table. Counts are per worker process; Prometheus
+    scrapes each worker and sums them.
+    """
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+
+    def record(
+        self, method: str, route: str, status_code: int, seconds: float, request: _RequestStats
+    ) -> None:
+        stats = self._routes.get((method, route))
+        if stats is None:
+            stats = self._routes[(method, route)] = _RouteStats()
+        stats.latency.observe(seconds)
+        stats.statements.observe(request.statements)
+        stats.db_seconds += request.db_seconds
+        stats.serialization_seconds += request.serialization_seconds
+        stats.responses[status_code] = stats.responses.get(status_code, 0) + 1
+
+    def clear(self) -> None:
+        self._routes.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        routes = sorted(self._routes.items())
+
+        def family(name: str, kind: str, help_text: str, samples: Callable[[str, _RouteStats], None]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (method, route), stats in routes:
+                samples(f'method="{_label(method)}",route="{_label(route)}"', stats)
+
+        def histogram(name: str, attribute: str):
+            def samples(labels: str, stats: _RouteStats):
+                hist: _Histogram = getattr(stats, attribute)
+                for bound, count in hist.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {_format(hist.sum)}")
+                lines.append(f"{name}_count{{{labels}}} {sum(hist.counts)}")
+            return samples
+
+        def counter(name: str, attribute: str):
+            def samples(labels: str, stats: _RouteStats):
+                lines.append(f"{name}{{{labels}}} {_format(getattr(stats, attribute))}")
+            return samples
+
+        def responses(labels: str, stats: _RouteStats):
+            for status_code, count in sorted(stats.responses.items()):
+                lines.append(f'http_requests_total{{{labels},status="{status_code}"}} {count}')
+
+        family("http_requests_total", "counter", "Requests by route and status code.", responses)
+        family(
+            "http_request_duration_seconds", "histogram",
+            "Time from receiving a request to sending the last of its response.",
+            histogram("http_request_duration_seconds", "latency"),
+        )
+        family(
+            "http_request_db_statements", "histogram",
+            "SQL statements executed per request.",
+            histogram("http_request_db_statements", "statements"),
+        )
+        family(
+            "http_request_db_seconds_total", "counter",
+            "Time spent executing SQL, including waiting on the database.",
+            counter("http_request_db_seconds_total", "db_seconds"),
+        )
+        family(
+            "http_request_serialization_seconds_total", "counter",
+            "Time spent validating and rendering response bodies.",
+            counter("http_request_serialization_seconds_total", "serialization_seconds"),
+        )
+        return "\n".join(lines) + "\n"
+
+
+metrics = RouteMetrics()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request into `metrics`.
+
+    Latency runs until the last body chunk is sent, so it covers streamed
+    responses but not background tasks, whose SQL still counts toward the
+    route. Whatever is left of the latency after DB and serialisation time
+    is the handler's own work, ORM hydration included.
+    """
+
+    def __init__(self, app: Any, registry: RouteMetrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = _RequestStats()
+        token = _current.set(request)
+        started = time.perf_counter()
+        finished: Optional[float] = None
+        status_code = 500
+
+        async def send_timed(message) -> None:
+            nonlocal finished, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _current.reset(token)
+            self.registry.record(
+                scope["method"],
+                _route_template(scope),
+                status_code,
+                (finished or time.perf_counter()) - started,
+                request,
+            )
+
+
+class serialization_timer:
+    """Adds the time spent in the block to the current request's serialisation time."""
+    __slots__ = ("request", "started")
+
+    def __enter__(self) -> None:
+        self.request = _current.get()
+        if self.request is not None:
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.request is not None:
+            self.request.serialization_seconds += time.perf_counter() - self.started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    request = _current.get()
+    if request is not None:
+        request.statements += 1
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    request = _current.get()
+    started = getattr(context, "_metrics_started", None)
+    if request is not None and started is not None:
+        request.db_seconds += time.perf_counter() - started
+
+
+def _timed_serialize_response(serialize_response: Callable[..., Any]) -> Callable[..., Any]:
+    async def timed(**kwargs: Any) -> Any:
+        with serialization_timer():
+            return await serialize_response(**kwargs)
+
+    timed.__wrapped__ = serialize_response  # type: ignore[attr-defined]
+    return timed
+
+
+def instrument(app: Any) -> None:
+    """Collect request metrics for `app` and every engine in the process.
+
+    Statements are counted on all engines (primary, replica, tests) through
+    class-level cursor events. Models rendered by FastJSONResponse are
+    timed in its render(). FastAPI validates and dumps `response_model`
+    returns in fastapi.routing.serialize_response, a private function
+    looked up as a module global on every request; it is wrapped here,
+    which is why requirements.txt pins the FastAPI versions this was
+    checked against. tests/test_metrics.py fails if the wrapper stops
+    seeing those routes.
+    """
+    app.add_middleware(MetricsMiddleware)
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    serialize_response = getattr(fastapi.routing, "serialize_response", None)
+    if serialize_response is None:
+        logger.warning("fastapi.routing.serialize_response is gone; response_model "
+                       "serialisation will not be timed")
+    elif not hasattr(serialize_response, "__wrapped__"):
+        fastapi.routing.serialize_response = _timed_serialize_response(serialize_response)
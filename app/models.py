@@ -3,10 +3,22 @@ import uuid
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (DDL, JSON, BigInteger, Boolean, DateTime, ForeignKey, Index,
+                        Integer, String, Text, UniqueConstraint, event)
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, functions, literal_column
+
+from .compression import CompressedText
+
+
+@compiles(functions.now, "sqlite")
+def _sqlite_now(element, compiler, **kw):
+    # CURRENT_TIMESTAMP only has second precision and a different text format
+    # from the one SQLAlchemy binds, which breaks (timestamp, id) keyset
+    # comparisons on SQLite.
+    return "STRFTIME('%Y-%m-%d %H:%M:%f000', 'now')"
 
 
 class Base(DeclarativeBase):
@@ -42,10 +54,16 @@ class Message(Base):
     )
     sender_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
     subject: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
-    content: Mapped[str] = mapped_column(Text, nullable=False)
+    # Stored codec-tagged and compressed when large (see app.compression)
+    content: Mapped[str] = mapped_column(CompressedText, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
+    # Postgres only, written from the plaintext by the insert paths with
+    # search_vector_sql(); always NULL on SQLite, which uses messages_fts
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR().with_variant(Text, "sqlite"), nullable=True, deferred=True
+    )
 
     # Relationships
     sender: Mapped["User"] = relationship(
@@ -58,6 +76,12 @@ class Message(Base):
 
 class MessageRecipient(Base):
     __tablename__ = "message_recipients"
+    __table_args__ = (
+        UniqueConstraint(
+            "message_id", "recipient_id", name="uq_message_recipients_message_id_recipient_id"
+        ),
+        Index("ix_message_recipients_recipient_id_read", "recipient_id", "read"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -65,6 +89,11 @@ class MessageRecipient(Base):
     message_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("messages.id"), nullable=False
     )
+    # Copy of messages.timestamp: the inbox sorts and pages on it without
+    # the join, and it is the partition key of the partitioned layout
+    message_timestamp: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
     recipient_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("users.id"), nullable=False
     )
@@ -78,3 +107,179 @@ class MessageRecipient(Base):
     recipient: Mapped["User"] = relationship(
         "User", back_populates="received_messages", foreign_keys=[recipient_id]
     )
+
+
+class UserMailboxStats(Base):
+    """Per-user inbox counters, maintained by the write paths.
+
+    Kept in step with ``message_recipients`` inside the same transaction as
+    each send/read so badge counts never need a COUNT over the inbox;
+    ``app.mailbox.reconcile`` rebuilds them if they ever drift. ``version``
+    and ``updated_at`` change with every write to the inbox and are the
+    validators for conditional GETs of the inbox and unread lists.
+    ``sent_count`` is the "maintained" total of the sent list; sending does
+    not touch the inbox, so it leaves ``version`` alone.
+    """
+    __tablename__ = "user_mailbox_stats"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id"), primary_key=True
+    )
+    unread_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    total_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    sent_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
+
+class RowCount(Base):
+    """Maintained row counts for whole tables, keyed by table name.
+
+    Bumped in the transactions that insert rows so "maintained" list totals
+    need no COUNT; ``app.mailbox.reconcile`` recounts them.
+    """
+    __tablename__ = "row_counts"
+
+    table_name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    row_count: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+
+
+class MessageOutbox(Base):
+    """Pending recipient fan-out for a message sent with ``POST /messages/async``.
+
+    Written in the same transaction as the message; ``app.outbox`` expands
+    ``recipient_ids`` into ``message_recipients`` in chunks, advancing
+    ``processed_count`` in the transaction that writes each chunk so an
+    interrupted job resumes where it stopped. There is deliberately no
+    foreign key to messages, whose key includes the timestamp when the
+    table is partitioned.
+    """
+    __tablename__ = "message_outbox"
+    __table_args__ = (
+        Index("ix_message_outbox_status_created_at", "status", "created_at"),
+    )
+
+    message_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    message_timestamp: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    recipient_ids: Mapped[List[str]] = mapped_column(JSON, nullable=False)
+    total_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    processed_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # pending -> processing -> done, or failed after too many attempts
+    status: Mapped[str] = mapped_column(
+        String(16), nullable=False, default="pending", server_default="pending"
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Lease held by the worker processing the job, or the retry backoff
+    locked_until: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Set afresh by every claim; only the current holder may advance the job
+    lease_token: Mapped[Optional[uuid.UUID]] = mapped_column(
+        UUID(as_uuid=True), nullable=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    completed_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+
+# Sent list: WHERE sender_id = ? ORDER BY timestamp DESC, id DESC
+Index(
+    "ix_messages_sender_id_timestamp",
+    Message.sender_id,
+    Message.timestamp.desc(),
+    Message.id.desc(),
+)
+
+# Inbox list: WHERE recipient_id = ? ORDER BY message_timestamp DESC, message_id DESC
+Index(
+    "ix_message_recipients_inbox",
+    MessageRecipient.recipient_id,
+    MessageRecipient.message_timestamp.desc(),
+    MessageRecipient.message_id.desc(),
+)
+
+# Unread list and unread counts only ever touch the small unread subset
+Index(
+    "ix_message_recipients_unread",
+    MessageRecipient.recipient_id,
+    MessageRecipient.message_timestamp.desc(),
+    MessageRecipient.message_id.desc(),
+    postgresql_where=MessageRecipient.read == False,
+    sqlite_where=MessageRecipient.read == False,
+)
+
+# Full-text search over subject and content (queried by app.search).
+# Postgres: a weighted tsvector column with a GIN index. It cannot be a
+# generated column because content is stored compressed.
+# SQLite: a contentless FTS5 table kept in step by triggers that index the
+# decompressed text through the message_text() function.
+SEARCH_CONFIG = "english"
+
+
+def search_vector_sql(subject, content):
+    """The value to insert into ``messages.search_vector`` (Postgres only).
+
+    `subject` and `content` are the plaintext values or bind parameters.
+    """
+    config = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+    subject_vector = func.to_tsvector(config, func.coalesce(subject, ""))
+    content_vector = func.to_tsvector(config, content)
+    # setweight() takes a "char", which a bound varchar will not cast to
+    return func.setweight(subject_vector, literal_column("'A'")).op("||")(
+        func.setweight(content_vector, literal_column("'B'"))
+    )
+
+
+event.listen(
+    Message.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)"
+    ).execute_if(dialect="postgresql"),
+)
+
+for _statement in (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "subject, content, content='', tokenize='porter unicode61')",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts (rowid, subject, content) "
+    "VALUES (new.rowid, new.subject, message_text(new.content)); END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, subject, content) "
+    "VALUES ('delete', old.rowid, old.subject, message_text(old.content)); END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE OF subject, content ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, subject, content) "
+    "VALUES ('delete', old.rowid, old.subject, message_text(old.content)); "
+    "INSERT INTO messages_fts (rowid, subject, content) "
+    "VALUES (new.rowid, new.subject, message_text(new.content)); END",
+):
+    event.listen(
+        Message.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Message.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite"),
+)
@@ -0,0 +1,418 @@
+# Transactional outbox: asynchronous recipient fan-out for large sends
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import Row, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .fanout import insert_recipients
+from .mailbox import record_delivery
+from .models import Message, MessageOutbox, MessageRecipient
+from .realtime import broker
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+CHUNK_SIZE = int(os.getenv("OUTBOX_CHUNK_SIZE", "1000"))
+LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("OUTBOX_RETRY_BACKOFF_SECONDS", "5"))
+POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+
+_outbox = MessageOutbox.__table__
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker has claimed it since."""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue(
+    db: AsyncSession,
+    message_id: uuid.UUID,
+    message_timestamp: datetime,
+    recipient_ids: Sequence[uuid.UUID],
+) -> None:
+    """Queue the fan-out; call inside the transaction that inserts the message."""
+    await db.execute(
+        _outbox.insert().values(
+            message_id=message_id,
+            message_timestamp=message_timestamp,
+            recipient_ids=[str(recipient_id) for recipient_id in recipient_ids],
+            total_count=len(recipient_ids),
+            processed_count=0,
+            status=PENDING,
+            attempts=0,
+        )
+    )
+
+
+async def claim(db: AsyncSession, lease: float = LEASE_SECONDS) -> Optional[Row]:
+    """Lease the oldest runnable job and commit the lease.
+
+    Runnable means pending, or processing under an expired lease (its
+    worker died or stalled). Every claim gets a new ``lease_token``; writes
+    made under an older one are refused. SKIP LOCKED lets several workers
+    claim in parallel on Postgres; SQLite serialises writers anyway.
+    """
+    now = _utcnow()
+    candidate = (
+        select(_outbox.c.message_id)
+        .where(
+            _outbox.c.status.in_((PENDING, PROCESSING)),
+            or_(_outbox.c.locked_until.is_(None), _outbox.c.locked_until <= now),
+        )
+        .order_by(_outbox.c.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(_outbox)
+        .where(_outbox.c.message_id == candidate)
+        .values(
+            status=PROCESSING,
+            attempts=_outbox.c.attempts + 1,
+            locked_until=now + timedelta(seconds=lease),
+            lease_token=uuid.uuid4(),
+        )
+        .returning(
+            _outbox.c.message_id,
+            _outbox.c.message_timestamp,
+            _outbox.c.recipient_ids,
+            _outbox.c.total_count,
+            _outbox.c.processed_count,
+            _outbox.c.attempts,
+            _outbox.c.lease_token,
+        )
+    )
+    job = result.first()
+    await db.commit()
+    return job
+
+
+def _leased(job: Row):
+    return (_outbox.c.message_id == job.message_id) & (_outbox.c.lease_token == job.lease_token)
+
+
+async def deliver(
+    db: AsyncSession,
+    job: Row,
+    chunk_size: int = CHUNK_SIZE,
+    lease: float = LEASE_SECONDS,
+    on_chunk: Optional[Callable[[int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> str:
+    """Write the job's remaining recipients, one transaction per chunk.
+
+    Each chunk first advances ``processed_count`` from the value this worker
+    expects, under its lease token, then writes the chunk's rows and
+    counters in the same transaction. A worker whose lease has passed to
+    another gets no row back, rolls back and raises LeaseLost before writing
+    anything; on Postgres the row lock also makes a competing worker wait
+    for the chunk in flight. When `should_stop` turns true between chunks
+    the job is handed back as pending. Returns the job's status.
+    """
+    recipient_ids = [uuid.UUID(recipient_id) for recipient_id in job.recipient_ids]
+    processed = job.processed_count
+    while processed < job.total_count:
+        if should_stop is not None and should_stop():
+            await _release(db, job)
+            return PENDING
+        chunk = recipient_ids[processed:processed + chunk_size]
+        result = await db.execute(
+            update(_outbox)
+            .where(_leased(job), _outbox.c.processed_count == processed)
+            .values(
+                processed_count=processed + len(chunk),
+                locked_until=_utcnow() + timedelta(seconds=lease),
+            )
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise LeaseLost(f"lost the lease on message {job.message_id}")
+        await insert_recipients(db, job.message_id, job.message_timestamp, chunk)
+        await record_delivery(db, chunk)
+        await db.commit()
+        processed += len(chunk)
+        if on_chunk is not None:
+            on_chunk(len(chunk))
+
+    result = await db.execute(
+        update(_outbox)
+        .where(_leased(job))
+        .values(
+            status=DONE, locked_until=None, lease_token=None, last_error=None,
+            completed_at=_utcnow(),
+        )
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        raise LeaseLost(f"lost the lease on message {job.message_id}")
+    await db.commit()
+    return DONE
+
+
+async def _release(db: AsyncSession, job: Row) -> None:
+    """Hand an unfinished job back for any worker to claim at once.
+
+    Stopping is not a failed attempt, so the claim's attempt is returned too.
+    """
+    await db.execute(
+        update(_outbox)
+        .where(_leased(job))
+        .values(
+            status=PENDING,
+            attempts=_outbox.c.attempts - 1,
+            locked_until=None,
+            lease_token=None,
+        )
+    )
+    await db.commit()
+
+
+async def _fail(db: AsyncSession, job: Row, error: BaseException) -> str:
+    """Record a failed attempt; the job is retried with backoff until MAX_ATTEMPTS.
+
+    Returns PROCESSING, recording nothing, if another worker holds the job now.
+    """
+    await db.rollback()
+    final = job.attempts >= MAX_ATTEMPTS
+    status = FAILED if final else PENDING
+    backoff = RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+    result = await db.execute(
+        update(_outbox)
+        .where(_leased(job))
+        .values(
+            status=status,
+            last_error=f"{type(error).__name__}: {error}"[:1000],
+            locked_until=None if final else _utcnow() + timedelta(seconds=backoff),
+            lease_token=None,
+        )
+    )
+    await db.commit()
+    return status if result.rowcount == 1 else PROCESSING
+
+
+async def _publish(db: AsyncSession, job: Row) -> None:
+    """Announce a finished job to its recipients.
+
+    A job can be written by several workers (stopped, retried or taken over),
+    so the rows are read back rather than collected by whoever finishes it.
+    Only recipients subscribed in this process need them; PostgresBroker
+    loads its own per worker.
+    """
+    result = await db.execute(
+        select(Message.id, Message.subject, Message.content, Message.sender_id, Message.timestamp)
+        .where(Message.id == job.message_id, Message.timestamp == job.message_timestamp)
+    )
+    message = result.first()
+    if message is None:
+        return
+    rows: List[Row] = []
+    connected = list(broker.subscribers)
+    if connected:
+        result = await db.execute(
+            select(MessageRecipient.id, MessageRecipient.recipient_id,
+                   MessageRecipient.read, MessageRecipient.read_at)
+            .where(
+                MessageRecipient.message_id == job.message_id,
+                MessageRecipient.message_timestamp == job.message_timestamp,
+                MessageRecipient.recipient_id.in_(connected),
+            )
+        )
+        rows = result.all()
+    await broker.publish(db, dict(message._mapping), rows)
+
+
+class OutboxWorker:
+    """Claims and delivers outbox jobs until stopped, keeping throughput stats."""
+
+    def __init__(
+        self,
+        session_factory: Optional[async_sessionmaker] = None,
+        chunk_size: int = CHUNK_SIZE,
+        poll_interval: float = POLL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.retries = 0
+        self.leases_lost = 0
+        self.chunks = 0
+        self.recipients_delivered = 0
+        self.delivery_seconds = 0.0
+
+    def _count_chunk(self, size: int) -> None:
+        self.chunks += 1
+        self.recipients_delivered += size
+
+    async def process_next(self, db: AsyncSession) -> Optional[str]:
+        """Run one job until it finishes, fails or the worker stops.
+
+        Returns the job's status afterwards: pending when it is to be
+        retried or was handed back on stop, processing when another worker
+        took it over.
+        """
+        job = await claim(db)
+        if job is None:
+            return None
+        started = time.perf_counter()
+        try:
+            status = await deliver(
+                db, job, self.chunk_size,
+                on_chunk=self._count_chunk, should_stop=lambda: self._stopping,
+            )
+        except LeaseLost:
+            logger.warning("Lease on message %s expired; another worker has it", job.message_id)
+            self.leases_lost += 1
+            return PROCESSING
+        except Exception as error:
+            logger.exception("Fan-out of message %s failed", job.message_id)
+            status = await _fail(db, job, error)
+            if status == FAILED:
+                self.jobs_failed += 1
+            elif status == PENDING:
+                self.retries += 1
+            else:
+                self.leases_lost += 1
+            return status
+        finally:
+            self.delivery_seconds += time.perf_counter() - started
+
+        if status != DONE:
+            return status
+        self.jobs_completed += 1
+        try:
+            await _publish(db, job)
+        except Exception:
+            logger.exception("Realtime publish for message %s failed", job.message_id)
+        return status
+
+    async def drain(self) -> int:
+        """Process jobs until none are runnable; returns how many were run."""
+        processed = 0
+        while not self._stopping:
+            async with self._session() as db:
+                if await self.process_next(db) is None:
+                    return processed
+            processed += 1
+        return processed
+
+    def _session(self) -> AsyncSession:
+        if self.session_factory is None:
+            from .db import AsyncSessionLocal
+
+            self.session_factory = AsyncSessionLocal
+        return self.session_factory()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Outbox worker iteration failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop once the chunk in flight is committed; its job goes back to pending."""
+        self._stopping = True
+        self.wake()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "retries": self.retries,
+            "leases_lost": self.leases_lost,
+            "chunks": self.chunks,
+            "recipients_delivered": self.recipients_delivered,
+            "recipients_per_second": round(self.recipients_delivered / self.delivery_seconds, 1)
+            if self.delivery_seconds else None,
+        }
+
+
+async def backlog(db: AsyncSession) -> Dict[str, Any]:
+    """Queued work across all workers."""
+    result = await db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(_outbox.c.total_count - _outbox.c.processed_count), 0),
+        ).where(_outbox.c.status.in_((PENDING, PROCESSING)))
+    )
+    jobs, recipients = result.one()
+    failed = await db.execute(
+        select(func.count()).select_from(_outbox).where(_outbox.c.status == FAILED)
+    )
+    return {
+        "pending_jobs": jobs,
+        "pending_recipients": recipients,
+        "failed_jobs": failed.scalar_one(),
+    }
+
+
+def build_worker() -> Optional[OutboxWorker]:
+    """The in-process worker, unless OUTBOX_WORKER=external (run `just outbox-worker`)."""
+    if os.getenv("OUTBOX_WORKER", "inprocess").lower() == "external":
+        return None
+    return OutboxWorker()
+
+
+outbox_worker = build_worker()
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Outbox fan-out worker")
+    parser.add_argument("command", choices=["work"])
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+
+    from .db import engine
+
+    worker = OutboxWorker()
+    try:
+        if args.once:
+            await worker.drain()
+        else:
+            await worker.run()
+    finally:
+        await engine.dispose()
+        print(worker.stats())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
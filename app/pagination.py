@@ -0,0 +1,78 @@
+# Keyset (cursor) pagination helpers
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+
+
+def _encode(key: Any, row_id: UUID) -> str:
+    payload = json.dumps([key, str(row_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str, parse_key: Callable[[Any], Any]) -> Tuple[Any, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return parse_key(key), UUID(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def encode_cursor(timestamp: datetime, row_id: UUID) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor."""
+    return _encode(timestamp.isoformat(), row_id)
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Decode a cursor produced by `encode_cursor`."""
+    return _decode(cursor, datetime.fromisoformat)
+
+
+def encode_rank_cursor(rank: float, row_id: UUID) -> str:
+    """Cursor for result lists ordered by a relevance score."""
+    return _encode(rank, row_id)
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, UUID]:
+    """Decode a cursor produced by `encode_rank_cursor`."""
+    return _decode(cursor, float)
+
+
+def apply_keyset(
+    query: Select,
+    timestamp_col: Any,
+    id_col: Any,
+    cursor: Optional[str],
+    limit: int,
+) -> Select:
+    """Restrict `query` to the page after `cursor`, newest first.
+
+    One extra row is fetched so `split_page` can tell whether another page
+    exists without a separate COUNT.
+    """
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(timestamp_col, id_col) < tuple_(timestamp, row_id))
+    return query.order_by(timestamp_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def split_page(
+    rows: Sequence[Any],
+    limit: int,
+    key: Callable[[Any], Tuple[Any, UUID]],
+    encode: Callable[[Any, UUID], str] = encode_cursor,
+) -> Tuple[List[Any], Optional[str]]:
+    """Trim the look-ahead row and build the cursor for the next page."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode(*key(rows[-1]))
@@ -0,0 +1,176 @@
+# Monthly range partitions for messages and message_recipients (Postgres)
+import argparse
+import asyncio
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Parent tables and their partition keys, in creation order. Partitions are
+# detached in reverse: message_recipients rows reference their message, so a
+# messages partition can only go once the matching recipients partition has.
+PARTITIONED_TABLES = (
+    ("messages", "timestamp"),
+    ("message_recipients", "message_timestamp"),
+)
+MONTHS_AHEAD = 3
+RETAIN_MONTHS = 24
+
+_MONTH_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+        f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+    )
+
+
+def _this_month(today: Optional[date]) -> date:
+    return month_start(today or datetime.now(timezone.utc).date())
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    """Whether the database uses the partitioned messages layout."""
+    if conn.dialect.name != "postgresql":
+        return False
+    result = await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('messages'))"
+    ))
+    return bool(result.scalar())
+
+
+async def attached_partitions(conn: AsyncConnection, table: str) -> List[str]:
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table) "
+            "ORDER BY child.relname"
+        ),
+        {"table": table},
+    )
+    return list(result.scalars())
+
+
+async def _drop_foreign_keys(conn: AsyncConnection, table: str) -> None:
+    # A detached partition keeps its own copy of the parent's foreign keys;
+    # the one to messages would block detaching the matching messages month
+    result = await conn.execute(
+        text(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = to_regclass(:table) AND contype = 'f'"
+        ),
+        {"table": table},
+    )
+    for name in result.scalars():
+        await conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+
+
+async def create_future_partitions(
+    conn: AsyncConnection, months_ahead: int = MONTHS_AHEAD, today: Optional[date] = None
+) -> List[str]:
+    """Make sure this month and the next `months_ahead` have partitions.
+
+    Inserts into a month without a partition fail, so this has to run
+    (e.g. daily from cron) well before the last one fills up. Returns the
+    names of the partitions it created.
+    """
+    current = _this_month(today)
+    created: List[str] = []
+    for table, _ in PARTITIONED_TABLES:
+        existing = set(await attached_partitions(conn, table))
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if partition_name(table, month) not in existing:
+                await conn.execute(text(create_partition_sql(table, month)))
+                created.append(partition_name(table, month))
+    return created
+
+
+async def detach_old_partitions(
+    conn: AsyncConnection,
+    retain_months: int = RETAIN_MONTHS,
+    drop: bool = False,
+    today: Optional[date] = None,
+) -> List[str]:
+    """Detach monthly partitions that ended more than `retain_months` ago.
+
+    Detached tables are left in place for archiving unless `drop` is set;
+    archived tables lose their foreign keys, since the rows they point at
+    are archived too. Partitions not named ``<table>_pYYYY_MM`` are never touched. Returns
+    the names of the partitions detached.
+    """
+    cutoff = add_months(_this_month(today), -retain_months)
+    detached: List[str] = []
+    for table, _ in reversed(PARTITIONED_TABLES):
+        for name in await attached_partitions(conn, table):
+            match = _MONTH_SUFFIX.search(name)
+            if match is None or date(int(match[1]), int(match[2]), 1) >= cutoff:
+                continue
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if drop:
+                await conn.execute(text(f"DROP TABLE {name}"))
+            else:
+                await _drop_foreign_keys(conn, name)
+            detached.append(name)
+    return detached
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Message partition maintenance")
+    parser.add_argument("command", choices=["maintain"])
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    parser.add_argument("--retain-months", type=int, default=RETAIN_MONTHS)
+    parser.add_argument("--drop", action="store_true", help="drop detached partitions")
+    args = parser.parse_args()
+
+    from .db import AsyncSessionLocal, engine
+    from .mailbox import reconcile
+
+    created: List[str] = []
+    detached: List[str] = []
+    async with engine.begin() as conn:
+        partitioned = await is_partitioned(conn)
+        if partitioned:
+            # One maintainer at a time; DDL on the parents takes brief exclusive locks
+            await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('app.partitions'))"))
+            created = await create_future_partitions(conn, args.months_ahead)
+            detached = await detach_old_partitions(conn, args.retain_months, args.drop)
+
+    if not partitioned:
+        await engine.dispose()
+        print("messages is not partitioned, nothing to do")
+        return
+    if detached:
+        # Detached messages no longer count towards anyone's mailbox
+        async with AsyncSessionLocal() as session:
+            await reconcile(session)
+            await session.commit()
+    await engine.dispose()
+    print(f"Created {len(created)} partition(s), detached {len(detached)}")
+    for name in created:
+        print(f"  + {name}")
+    for name in detached:
+        print(f"  - {name}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,125 @@
+# Column projections and snippet previews behind the list endpoints
+from typing import List, Literal, Optional, Tuple, Union
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .compression import decompress_head, head_sql
+from .fields import project
+from .models import Message, MessageRecipient, User
+from .pagination import apply_keyset, split_page
+from .schemas import MessageRecipientPreview, MessageRecipientSchema
+
+# List endpoints select just these columns and build the response models with
+# model_construct: rows come straight from our own schema, so neither ORM
+# identity-map bookkeeping nor a Pydantic validation pass buys anything.
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.subject,
+    Message.content,
+    Message.sender_id,
+    Message.timestamp,
+)
+USER_COLUMNS = (
+    User.id,
+    User.email,
+    User.name,
+    User.created_at,
+)
+RECIPIENT_INFO_COLUMNS = (
+    MessageRecipient.id,
+    MessageRecipient.recipient_id,
+    MessageRecipient.read,
+    MessageRecipient.read_at,
+)
+INBOX_COLUMNS = (
+    MessageRecipient.id,
+    MessageRecipient.message_id,
+    Message.subject,
+    Message.content,
+    Message.sender_id,
+    MessageRecipient.message_timestamp.label("timestamp"),
+    MessageRecipient.read,
+    MessageRecipient.read_at,
+)
+
+# List views can ask for ?view=snippet: the database then returns only the
+# start of each uncompressed body, we decode just the first SNIPPET_LENGTH + 1
+# characters (the extra one tells us whether it was cut) and the full text is
+# left to GET /messages/{id}.
+SNIPPET_LENGTH = 200
+ListView = Literal["full", "snippet"]
+_CONTENT_HEAD = head_sql(Message.content, SNIPPET_LENGTH + 1).label("content_head")
+MESSAGE_PREVIEW_COLUMNS = tuple(
+    _CONTENT_HEAD if column is Message.content else column for column in MESSAGE_COLUMNS
+)
+INBOX_PREVIEW_COLUMNS = tuple(
+    _CONTENT_HEAD if column is Message.content else column for column in INBOX_COLUMNS
+)
+# ?fields= names the response fields; these are the columns behind them
+PREVIEW_SOURCES = {"content_head": ("snippet", "truncated")}
+
+
+def _snippet(head: str) -> Tuple[str, bool]:
+    """Preview text from the start of a body, cut at a word boundary."""
+    text = " ".join(head.split())
+    if len(head) <= SNIPPET_LENGTH:
+        return text, False
+    cut = text[:SNIPPET_LENGTH]
+    space = cut.rfind(" ")
+    if space > SNIPPET_LENGTH // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "\u2026", True
+
+
+def preview_fields(row) -> dict:
+    fields = dict(row._mapping)
+    if "content_head" in fields:
+        head = decompress_head(fields.pop("content_head"), SNIPPET_LENGTH + 1)
+        fields["snippet"], fields["truncated"] = _snippet(head)
+    return fields
+
+
+async def recipient_page(
+    db: AsyncSession,
+    conditions: list,
+    cursor: Optional[str],
+    limit: int,
+    view: ListView = "full",
+    include: Optional[dict] = None,
+) -> Tuple[List[Union[MessageRecipientSchema, MessageRecipientPreview]], Optional[str]]:
+    """One keyset page of a user's received messages, newest first.
+
+    `conditions` select the rows (recipient, read state); `include` is a
+    parsed ?fields= selection. Returns the page and the next cursor.
+    """
+    columns = project(
+        INBOX_PREVIEW_COLUMNS if view == "snippet" else INBOX_COLUMNS,
+        include,
+        always=("message_id", "timestamp"),
+        sources=PREVIEW_SOURCES
+    )
+    query = select(*columns).select_from(MessageRecipient)
+    # Ids, timestamps and read state need no join at all. Otherwise, paging
+    # on message_recipients' own copy of the timestamp lets the inbox index
+    # drive the query, and with partitioned tables the keyset bound plus the
+    # timestamp join condition prune untouched partitions.
+    if Message.__table__ in query.get_final_froms():
+        query = query.join(
+            Message,
+            (MessageRecipient.message_id == Message.id)
+            & (MessageRecipient.message_timestamp == Message.timestamp)
+        )
+    query = apply_keyset(
+        query.where(*conditions),
+        MessageRecipient.message_timestamp, MessageRecipient.message_id, cursor, limit
+    )
+    result = await db.execute(query)
+    rows, next_cursor = split_page(
+        result.all(), limit, lambda row: (row.timestamp, row.message_id)
+    )
+    if view == "snippet":
+        messages = [MessageRecipientPreview.model_construct(**preview_fields(row)) for row in rows]
+    else:
+        messages = [MessageRecipientSchema.model_construct(**row._mapping) for row in rows]
+    return messages, next_cursor
@@ -0,0 +1,319 @@
+# Realtime inbox delivery: pub/sub brokers and the SSE stream
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Set
+from uuid import UUID
+
+from fastapi import Request
+from sqlalchemy import any_, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from .db import DATABASE_URL, AsyncSessionLocal
+from .models import Message, MessageRecipient
+from .schemas import MessageRecipientSchema
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "15"))
+QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+# How often an idle LISTEN connection is pinged to catch silent drops
+LISTENER_CHECK_SECONDS = float(os.getenv("REALTIME_LISTENER_CHECK_SECONDS", "30"))
+# Reconnect backoff for the LISTEN connection, doubling up to the maximum
+RECONNECT_DELAY_SECONDS = 0.5
+RECONNECT_MAX_DELAY_SECONDS = 30.0
+
+
+class Subscription:
+    """One connected client's queue of inbox events."""
+
+    def __init__(self, broker: "InMemoryBroker", user_id: UUID, maxsize: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[MessageRecipientSchema]" = asyncio.Queue(maxsize)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[MessageRecipientSchema]:
+        """Next event, or None if nothing arrived within `timeout`."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Single-process broker: events go straight onto subscribers' queues."""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[UUID, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.fanout_count = 0
+        self.fanout_seconds_total = 0.0
+        self.fanout_seconds_max = 0.0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def subscribe(self, user_id: UUID) -> Subscription:
+        subscription = Subscription(self, user_id, self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self.subscribers.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self.subscribers[subscription.user_id]
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self.subscribers.values())
+
+    async def publish(self, db: Any, message: Dict[str, Any], recipient_rows: Iterable[Any]) -> None:
+        """Announce a committed message to its recipients.
+
+        `message` holds the message columns (id, subject, content, sender_id,
+        timestamp); `recipient_rows` the created message_recipients rows.
+        Call after the transaction that wrote them has committed.
+        """
+        self.published += 1
+        self.dispatch(message, recipient_rows, time.perf_counter())
+
+    def dispatch(self, message: Dict[str, Any], recipient_rows: Iterable[Any], started: float) -> None:
+        """Queue events for the recipients connected to this process."""
+        if not self.subscribers:
+            return
+        for row in recipient_rows:
+            subscriptions = self.subscribers.get(row.recipient_id)
+            if not subscriptions:
+                continue
+            event = MessageRecipientSchema.model_construct(
+                id=row.id,
+                message_id=message["id"],
+                subject=message["subject"],
+                content=message["content"],
+                sender_id=message["sender_id"],
+                timestamp=message["timestamp"],
+                read=row.read,
+                read_at=row.read_at,
+            )
+            for subscription in subscriptions:
+                try:
+                    subscription.queue.put_nowait(event)
+                    self.delivered += 1
+                except asyncio.QueueFull:
+                    # The client is not keeping up; it can resync via the inbox
+                    self.dropped += 1
+        elapsed = time.perf_counter() - started
+        self.fanout_count += 1
+        self.fanout_seconds_total += elapsed
+        self.fanout_seconds_max = max(self.fanout_seconds_max, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "broker": type(self).__name__,
+            "connections": self.connections,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "fanout_avg_ms": round(self.fanout_seconds_total / self.fanout_count * 1000, 3)
+            if self.fanout_count else None,
+            "fanout_max_ms": round(self.fanout_seconds_max * 1000, 3),
+        }
+
+
+class PostgresBroker(InMemoryBroker):
+    """Multi-worker broker on Postgres LISTEN/NOTIFY.
+
+    NOTIFY carries only the message id and publish time; every worker,
+    including the publishing one, receives it and loads the recipient rows
+    for the users connected to it. Fan-out latency therefore covers the
+    NOTIFY round trip, measured against the publisher's wall clock. The
+    LISTEN connection is watched and reopened after restarts, failovers
+    and idle disconnects; stats() reports whether it is currently up.
+    """
+
+    channel = "inbox_events"
+
+    def __init__(
+        self,
+        dsn: str,
+        queue_size: int = QUEUE_SIZE,
+        connect: Optional[Callable[[str], Awaitable[Any]]] = None,
+        check_interval: float = LISTENER_CHECK_SECONDS,
+    ):
+        super().__init__(queue_size)
+        self.dsn = dsn
+        self.check_interval = check_interval
+        self._connect = connect
+        self._listener = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.listener_connected = False
+        self.listener_error: Optional[str] = None
+        self.reconnect_attempts = 0
+
+    async def start(self) -> None:
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def stop(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+        listener, self._listener = self._listener, None
+        self.listener_connected = False
+        if listener is not None and not listener.is_closed():
+            try:
+                await listener.remove_listener(self.channel, self._on_notify)
+                await listener.close()
+            except Exception:
+                listener.terminate()
+
+    async def _open(self) -> Any:
+        if self._connect is not None:
+            return await self._connect(self.dsn)
+        import asyncpg
+
+        return await asyncpg.connect(self.dsn)
+
+    async def _supervise(self) -> None:
+        """Keep a LISTEN connection open, reconnecting with backoff.
+
+        Notifications sent while it is down are lost; clients catch up from
+        the inbox when they reconnect.
+        """
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            try:
+                await self._listen()
+            except Exception as error:
+                self.listener_error = f"{type(error).__name__}: {error}"
+            if self.listener_connected:
+                # It was up, so try again promptly
+                self.listener_connected = False
+                delay = RECONNECT_DELAY_SECONDS
+            listener, self._listener = self._listener, None
+            if listener is not None and not listener.is_closed():
+                listener.terminate()
+            logger.warning(
+                "Realtime listener down (%s); reconnecting in %.1fs", self.listener_error, delay
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+            self.reconnect_attempts += 1
+
+    async def _listen(self) -> None:
+        """Listen on one connection until it is lost; always raises."""
+        lost = asyncio.Event()
+        self._listener = await self._open()
+        self._listener.add_termination_listener(lambda connection: lost.set())
+        await self._listener.add_listener(self.channel, self._on_notify)
+        self.listener_connected = True
+        self.listener_error = None
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), self.check_interval)
+            except asyncio.TimeoutError:
+                # A connection cut by a failover may never report being closed
+                await asyncio.wait_for(self._listener.execute("SELECT 1"), self.check_interval)
+        raise ConnectionError("listener connection closed")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(
+            listener_connected=self.listener_connected,
+            listener_error=self.listener_error,
+            reconnect_attempts=self.reconnect_attempts,
+        )
+        return stats
+
+    async def publish(self, db: Any, message: Dict[str, Any], recipient_rows: Iterable[Any]) -> None:
+        self.published += 1
+        await db.execute(select(func.pg_notify(self.channel, f"{message['id']}:{time.time()}")))
+        await db.commit()
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        if not self.subscribers:
+            return
+        message_id, published_at = payload.split(":", 1)
+        task = asyncio.create_task(self._load_and_dispatch(UUID(message_id), float(published_at)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_and_dispatch(self, message_id: UUID, published_at: float) -> None:
+        connected = list(self.subscribers)
+        try:
+            async with AsyncSessionLocal() as db:
+                message = (await db.execute(
+                    select(Message.id, Message.subject, Message.content,
+                           Message.sender_id, Message.timestamp)
+                    .where(Message.id == message_id)
+                )).first()
+                if message is None:
+                    return
+                rows = (await db.execute(
+                    select(MessageRecipient.id, MessageRecipient.recipient_id,
+                           MessageRecipient.read, MessageRecipient.read_at)
+                    .where(
+                        MessageRecipient.message_id == message_id,
+                        MessageRecipient.message_timestamp == message.timestamp,
+                        MessageRecipient.recipient_id == any_(
+                            bindparam("connected", connected, type_=ARRAY(PG_UUID(as_uuid=True)))
+                        )
+                    )
+                )).all()
+        except Exception:
+            logger.exception("Failed to load inbox event for message %s", message_id)
+            return
+        # Convert the publisher's wall-clock timestamp to this process's timer
+        started = time.perf_counter() - (time.time() - published_at)
+        self.dispatch(message._mapping, rows, started)
+
+
+async def event_stream(
+    request: Request,
+    broker: InMemoryBroker,
+    user_id: UUID,
+    heartbeat: float = HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """Server-Sent Events for one recipient, with keep-alive comments.
+
+    Subscribes only once the response starts streaming, so a client that
+    goes away earlier never leaves a subscription behind.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: message\nid: {event.id}\ndata: {event.model_dump_json()}\n\n"
+    finally:
+        subscription.close()
+
+
+def build_broker() -> InMemoryBroker:
+    if os.getenv("REALTIME_BROKER", "memory").lower() == "postgres":
+        return PostgresBroker(DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    return InMemoryBroker()
+
+
+broker = build_broker()
@@ -0,0 +1,66 @@
+# Fast JSON response serialisation
+import os
+from typing import Any, Dict, Optional, Union
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from .metrics import serialization_timer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# FAST_JSON=false falls back to FastAPI's stock JSONResponse everywhere
+FAST_JSON_ENABLED = os.getenv("FAST_JSON", "true").lower() not in ("0", "false", "no")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that skips the ``json.dumps`` path.
+
+    Models are serialised by pydantic-core straight to JSON bytes with no
+    intermediate dict. Anything else (dicts from FastAPI's own
+    serialisation, error bodies) goes through orjson when it is installed,
+    which handles UUID and datetime natively; ``OPT_UTC_Z`` keeps its
+    datetimes identical to Pydantic's. `include` narrows a model to a
+    sparse fieldset, as in ``model_dump(include=...)``.
+    """
+
+    def __init__(self, content: Any, *args: Any, include: Optional[dict] = None, **kwargs: Any):
+        # render() runs inside JSONResponse.__init__
+        self.include = include
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        with serialization_timer():
+            if isinstance(content, BaseModel):
+                return content.__pydantic_serializer__.to_json(content, include=self.include)
+            if orjson is not None:
+                return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+            return super().render(content)
+
+
+def json_response(
+    model: BaseModel,
+    status_code: int = 200,
+    include: Optional[dict] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Union[Response, BaseModel]:
+    """Render `model` directly, skipping FastAPI's response_model round trip.
+
+    Only for models the handler built itself from trusted rows. With
+    FAST_JSON disabled the model is returned unchanged for FastAPI to handle,
+    unless it is narrowed by `include` (and so would fail response
+    validation) or needs `headers`.
+    """
+    if not FAST_JSON_ENABLED:
+        if include is None and headers is None:
+            return model
+        with serialization_timer():
+            return JSONResponse(
+                model.model_dump(mode="json", include=include),
+                status_code=status_code,
+                headers=headers,
+            )
+    return FastJSONResponse(model, status_code=status_code, headers=headers, include=include)
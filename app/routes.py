@@ -1,24 +1,114 @@
 # FastAPI routes
+import logging
 from datetime import datetime
-from typing import List, Optional
-from uuid import UUID
+from typing import List, Optional, Tuple, Union
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import func, select, update, Integer
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, exists, func, insert, select, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
 
-from .db import get_db
-from .models import User, Message, MessageRecipient
+from . import outbox
+from .cache import cache, message_key, user_key
+from .conditional import Validators
+from .db import get_db, get_read_db, record_write
+from .export import export_mailbox
+from .importer import import_format, import_users
+from .fanout import dedupe, existing_user_ids, insert_recipients
+from .fields import FIELDS_DESCRIPTION, list_include, nested, parse_fields, project, wants
+from .mailbox import record_delivery, record_reads, record_sent
+from .models import (
+    User, Message, MessageOutbox, MessageRecipient, RowCount, UserMailboxStats,
+    search_vector_sql
+)
+from .pagination import apply_keyset, decode_cursor, split_page
+from .projections import (
+    MESSAGE_COLUMNS, MESSAGE_PREVIEW_COLUMNS, PREVIEW_SOURCES, RECIPIENT_INFO_COLUMNS,
+    USER_COLUMNS, ListView, preview_fields, recipient_page
+)
+from .realtime import broker, event_stream
+from .responses import json_response
+from .search import search_messages
+from .totals import (
+    DEFAULT_MODE, MAILBOX_TOTAL_DESCRIPTION, TOTAL_DESCRIPTION, TotalMode, add_row_count,
+    resolve_total
+)
 from .schemas import (
-    UserCreate, UserResponse, UserList,
-    MessageCreate, MessageResponse, MessageRecipientSchema, MessagesRecipientList, MessageList,
-    MarkAsReadResponse
+    UserCreate, UserResponse, UserList, UserImportResult,
+    MessageCreate, MessageResponse, MessageRecipientInfo, MessageRecipientSchema, MessagesRecipientList, MessageList,
+    MarkAsReadResponse, MarkAsReadBatchRequest, MarkAsReadBatchResponse, UnreadCountResponse,
+    MessageSearchList, MessageDeliveryStatus, MessagePreview, MessagePreviewList,
+    MessageRecipientPreview, MessagesRecipientPreviewList
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
+async def _mailbox_validators(
+    db: AsyncSession, request: Request, user_id: UUID
+) -> Tuple[Validators, Row]:
+    """Validators for a user's inbox lists, from the mailbox version.
+
+    ETag only: a mailbox can change twice within a second, finer than the
+    HTTP dates If-Modified-Since compares. Doubles as the user existence
+    check, so a 304 costs one primary-key read. Also returns the mailbox
+    counters (total_count, unread_count), the lists' maintained totals.
+    """
+    result = await db.execute(
+        select(
+            func.coalesce(UserMailboxStats.version, 0).label("version"),
+            func.coalesce(UserMailboxStats.total_count, 0).label("total_count"),
+            func.coalesce(UserMailboxStats.unread_count, 0).label("unread_count")
+        )
+        .select_from(User)
+        .outerjoin(UserMailboxStats, UserMailboxStats.user_id == User.id)
+        .where(User.id == user_id)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return Validators.build(request, user_id, row.version), row
+
+
+async def _message_validators(
+    db: AsyncSession, request: Request, message_id: UUID
+) -> Optional[Validators]:
+    """Validators for a message from its recipients' read state.
+
+    The message itself never changes; recipients are added by fan-out and
+    marked read, which moves the count, read count or latest read_at. ETag
+    only, as reads can land within the same second. None while the message
+    has no recipients yet (or does not exist).
+    """
+    result = await db.execute(
+        select(
+            func.count(),
+            func.count().filter(MessageRecipient.read == True),
+            func.max(MessageRecipient.read_at)
+        )
+        .where(MessageRecipient.message_id == message_id)
+    )
+    recipients, read, last_read = result.one()
+    if not recipients:
+        return None
+    return Validators.build(request, message_id, recipients, read, last_read)
+
+
+async def _get_user(db: AsyncSession, user_id: UUID) -> Optional[UserResponse]:
+    async def load() -> Optional[UserResponse]:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        return UserResponse.model_validate(user) if user else None
+
+    return await cache.get_or_load(user_key(user_id), UserResponse, load)
+
+
 @router.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
 
@@ -33,289 +123,543 @@ async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_db))
     
     user = User(**user_data.model_dump())
     db.add(user)
+    await add_row_count(db, User.__tablename__, 1)
     await db.commit()
     await db.refresh(user)
+    await cache.invalidate(user_key(user.id))
+    record_write(user.id)
     
     return user
 
+@router.post("/users/import", response_model=UserImportResult)
+async def import_users_endpoint(request: Request, db: AsyncSession = Depends(get_db)):
+
+    # Parsed as it arrives and committed in chunks: an interrupted import
+    # keeps what it wrote, and re-sending it skips those emails
+    fmt = import_format(request.headers.get("content-type"))
+    return await import_users(db, request.stream(), fmt)
+
 @router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_user(
+    user_id: UUID,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
+):
 
-    user = await db.execute(select(User).where(User.id == user_id))
-    user = user.scalar_one_or_none()
+    include = parse_fields(fields, UserResponse)
+    # Served whole from the cache, so only the output is narrowed
+    user = await _get_user(db, user_id)
     
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+
+    # Users are never modified once created
+    validators = Validators.build(request, user.id, user.created_at, last_modified=user.created_at)
+    if validators.matches(request):
+        return validators.not_modified()
     
-    return user
+    return json_response(user, include=include, headers=validators.headers())
+
+@router.get("/users/{user_id}/export")
+async def export_user_mailbox(
+    user_id: UUID,
+    # Request scope keeps the session open until the body has been sent
+    db: AsyncSession = Depends(get_read_db, scope="request")
+):
+
+    user = await _get_user(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return StreamingResponse(
+        export_mailbox(db, user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="mailbox-{user_id}.ndjson"'}
+    )
 
 @router.get("/users", response_model=UserList)
 async def list_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    db: AsyncSession = Depends(get_db)
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    total_mode: TotalMode = Query(DEFAULT_MODE, alias="total", description=TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
 ):
 
-    total_result = await db.execute(select(func.count(User.id)))
-    total = total_result.scalar_one()
+    include = parse_fields(fields, UserResponse)
+    total, total_kind = await resolve_total(
+        db,
+        total_mode,
+        select(User.id),
+        select(RowCount.row_count).where(RowCount.table_name == User.__tablename__),
+        table_name=User.__tablename__
+    )
     
     users_result = await db.execute(
-        select(User)
+        select(*project(USER_COLUMNS, include))
         .order_by(User.created_at.desc())
         .offset(skip)
         .limit(limit)
     )
-    users = users_result.scalars().all()
+    users = [UserResponse.model_construct(**row._mapping) for row in users_result]
     
-    return UserList(users=users, total=total)
+    return json_response(
+        UserList.model_construct(users=users, total=total, total_kind=total_kind),
+        include=list_include(include, UserList, "users")
+    )
 
 
 
 
 # Message APIs
-@router.post("/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
-async def send_message(
-    message_data: MessageCreate,
-    sender_id: UUID,
-    db: AsyncSession = Depends(get_db)
-):
+async def _insert_message(
+    db: AsyncSession, message_data: MessageCreate, sender_id: UUID
+) -> Tuple[UUID, datetime, List[UUID]]:
+    """Validate sender and recipients, then insert the message row.
 
-    sender_result = await db.execute(select(User).where(User.id == sender_id))
-    sender = sender_result.scalar_one_or_none()
+    Returns the new message's id and timestamp and the deduplicated
+    recipient ids; the recipients themselves are left to the caller.
+    """
+    sender = await _get_user(db, sender_id)
     if not sender:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Sender not found"
         )
     
-    recipients_result = await db.execute(
-        select(User).where(User.id.in_(message_data.recipient_ids))
-    )
-    recipients = recipients_result.scalars().all()
+    recipient_ids = dedupe(message_data.recipient_ids)
+    found_ids = await existing_user_ids(db, recipient_ids)
     
-    if len(recipients) != len(message_data.recipient_ids):
+    if len(found_ids) != len(recipient_ids):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="One or more recipients not found"
         )
 
-    message = Message(
+    message_id = uuid4()
+    values = dict(
+        id=message_id,
         sender_id=sender_id,
         subject=message_data.subject,
         content=message_data.content
     )
-    db.add(message)
-    await db.flush() 
+    if db.get_bind().dialect.name == "postgresql":
+        values["search_vector"] = search_vector_sql(message_data.subject, message_data.content)
+    message_result = await db.execute(
+        insert(Message).values(**values).returning(Message.timestamp)
+    )
+    await record_sent(db, sender_id)
+    return message_id, message_result.scalar_one(), recipient_ids
+
+
+@router.post("/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+async def send_message(
+    message_data: MessageCreate,
+    sender_id: UUID,
+    db: AsyncSession = Depends(get_db)
+):
+
+    message_id, timestamp, recipient_ids = await _insert_message(db, message_data, sender_id)
     
-    message_recipients = []
-    for recipient in recipients:
-        msg_recipient = MessageRecipient(
-            message_id=message.id,
-            recipient_id=recipient.id
-        )
-        db.add(msg_recipient)
-        message_recipients.append(msg_recipient)
+    recipient_rows = await insert_recipients(db, message_id, timestamp, recipient_ids)
+    await record_delivery(db, recipient_ids)
     
     await db.commit()
-    await db.refresh(message)
-    
-    recipient_info = []
-    for i, recipient in enumerate(recipients):
-        recipient_info.append({
-            "id": message_recipients[i].id,
-            "recipient_id": recipient.id,
-            "read": False,
-            "read_at": None
-        })
+    record_write(sender_id, message_id)
+    try:
+        await broker.publish(
+            db,
+            {
+                "id": message_id,
+                "subject": message_data.subject,
+                "content": message_data.content,
+                "sender_id": sender_id,
+                "timestamp": timestamp
+            },
+            recipient_rows
+        )
+    except Exception:
+        # The message is already committed; a 500 here would invite a
+        # duplicate resend, and clients can resync from the inbox
+        logger.exception("Realtime publish for message %s failed", message_id)
+        await db.rollback()
     
     return MessageResponse(
-        id=message.id,
-        subject=message.subject,
-        content=message.content,
-        sender_id=sender.id,
-        timestamp=message.timestamp,
-        recipients=recipient_info
+        id=message_id,
+        subject=message_data.subject,
+        content=message_data.content,
+        sender_id=sender_id,
+        timestamp=timestamp,
+        recipients=[row._asdict() for row in recipient_rows]
     )
 
-@router.get("/messages/{sender_id}/sent-messages", response_model=MessageList)
-async def get_sent_messages(
+@router.post(
+    "/messages/async",
+    response_model=MessageDeliveryStatus,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def send_message_async(
+    message_data: MessageCreate,
     sender_id: UUID,
     db: AsyncSession = Depends(get_db)
 ):
+
+    message_id, timestamp, recipient_ids = await _insert_message(db, message_data, sender_id)
+    await outbox.enqueue(db, message_id, timestamp, recipient_ids)
+    await db.commit()
+    record_write(sender_id, message_id)
+    if outbox.outbox_worker is not None:
+        outbox.outbox_worker.wake()
+
+    return await _delivery_status(db, message_id)
+
+async def _delivery_status(db: AsyncSession, message_id: UUID) -> Optional[MessageDeliveryStatus]:
+    result = await db.execute(
+        select(MessageOutbox).where(MessageOutbox.message_id == message_id)
+    )
+    job = result.scalar_one_or_none()
+    if job is None:
+        return None
+    return MessageDeliveryStatus(
+        message_id=job.message_id,
+        status=job.status,
+        total_recipients=job.total_count,
+        processed_recipients=job.processed_count,
+        attempts=job.attempts,
+        last_error=job.last_error,
+        created_at=job.created_at,
+        completed_at=job.completed_at
+    )
+
+@router.get("/messages/{message_id}/delivery", response_model=MessageDeliveryStatus)
+async def get_delivery_status(message_id: UUID, db: AsyncSession = Depends(get_db)):
+    # Read from the primary: clients poll this right after sending
+    delivery = await _delivery_status(db, message_id)
+    if not delivery:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No asynchronous delivery for this message"
+        )
+
+    return delivery
+
+@router.get(
+    "/messages/{sender_id}/sent-messages",
+    response_model=Union[MessageList, MessagePreviewList]
+)
+async def get_sent_messages(
+    sender_id: UUID,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    view: ListView = Query("full"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    total_mode: TotalMode = Query(DEFAULT_MODE, alias="total", description=TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
+):
     
-    user_result = await db.execute(select(User).where(User.id == sender_id))
-    user = user_result.scalar_one_or_none()
+    include = parse_fields(fields, MessagePreview if view == "snippet" else MessageResponse)
+    user = await _get_user(db, sender_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    total_result = await db.execute(
-        select(func.count(Message.id)).where(Message.sender_id == sender_id)
+    total, total_kind = await resolve_total(
+        db,
+        total_mode,
+        select(Message.id).where(Message.sender_id == sender_id),
+        select(UserMailboxStats.sent_count).where(UserMailboxStats.user_id == sender_id)
     )
-    total = total_result.scalar_one()
 
-    messages_query = (
-        select(Message)
-        .options(selectinload(Message.recipients).selectinload(MessageRecipient.recipient))
-        .where(Message.sender_id == sender_id)
-        .order_by(Message.timestamp.desc())
+    columns = project(
+        MESSAGE_PREVIEW_COLUMNS if view == "snippet" else MESSAGE_COLUMNS,
+        include,
+        always=("id", "timestamp"),
+        sources=PREVIEW_SOURCES
+    )
+    messages_query = apply_keyset(
+        select(*columns).where(Message.sender_id == sender_id),
+        Message.timestamp, Message.id, cursor, limit
     )
 
     result = await db.execute(messages_query)
-    messages_data = result.scalars().all()
-    
-    messages = []
-    for message in messages_data:
-        recipient_info = []
-        for recipient_rel in message.recipients:
-            recipient_info.append({
-                "id": recipient_rel.id,
-                "recipient_id": recipient_rel.recipient_id,
-                "read": recipient_rel.read,
-                "read_at": recipient_rel.read_at
-            })
-
-        messages.append(MessageResponse(
-            id=message.id,
-            subject=message.subject,
-            content=message.content,
-            sender_id=message.sender_id,
-            timestamp=message.timestamp,
-            recipients=recipient_info
-        ))
+    messages_data, next_cursor = split_page(
+        result.all(), limit, lambda row: (row.timestamp, row.id)
+    )
+
+    recipients_by_message = {row.id: [] for row in messages_data}
+    if recipients_by_message and wants(include, "recipients"):
+        recipient_columns = project(RECIPIENT_INFO_COLUMNS, nested(include, "recipients"))
+        recipients_result = await db.execute(
+            select(MessageRecipient.message_id, *recipient_columns)
+            .where(
+                MessageRecipient.message_id.in_(list(recipients_by_message)),
+                # The page's time span, for partition pruning
+                MessageRecipient.message_timestamp.between(
+                    messages_data[-1].timestamp, messages_data[0].timestamp
+                )
+            )
+        )
+        for message_id, *values in recipients_result:
+            recipients_by_message[message_id].append(
+                MessageRecipientInfo.model_construct(
+                    **dict(zip((column.key for column in recipient_columns), values))
+                )
+            )
+
+    if view == "snippet":
+        previews = [
+            MessagePreview.model_construct(
+                **preview_fields(row), recipients=recipients_by_message[row.id]
+            )
+            for row in messages_data
+        ]
+        return json_response(
+            MessagePreviewList.model_construct(
+                messages=previews, total=total, total_kind=total_kind, next_cursor=next_cursor
+            ),
+            include=list_include(include, MessagePreviewList, "messages")
+        )
+
+    messages = [
+        MessageResponse.model_construct(
+            **row._mapping, recipients=recipients_by_message[row.id]
+        )
+        for row in messages_data
+    ]
     
-    return MessageList(messages=messages, total=total)
+    return json_response(
+        MessageList.model_construct(
+            messages=messages, total=total, total_kind=total_kind, next_cursor=next_cursor
+        ),
+        include=list_include(include, MessageList, "messages")
+    )
 
-@router.get("/messages/{recipient_id}/inbox-messages", response_model=MessagesRecipientList)
+@router.get(
+    "/messages/{recipient_id}/inbox-messages",
+    response_model=Union[MessagesRecipientList, MessagesRecipientPreviewList]
+)
 async def get_inbox_messages(
     recipient_id: UUID,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    view: ListView = Query("full"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    total_mode: TotalMode = Query("maintained", alias="total", description=MAILBOX_TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
+):
+    include = parse_fields(
+        fields, MessageRecipientPreview if view == "snippet" else MessageRecipientSchema
+    )
+    validators, counters = await _mailbox_validators(db, request, recipient_id)
+    if validators.matches(request):
+        return validators.not_modified()
+
+    total, total_kind = await resolve_total(
+        db,
+        total_mode,
+        select(MessageRecipient.id).where(MessageRecipient.recipient_id == recipient_id),
+        counters.total_count
+    )
+
+    messages, next_cursor = await recipient_page(
+        db, [MessageRecipient.recipient_id == recipient_id], cursor, limit, view, include
+    )
+    
+    list_model = MessagesRecipientPreviewList if view == "snippet" else MessagesRecipientList
+    return json_response(
+        list_model.model_construct(
+            messages=messages, total=total, total_kind=total_kind, next_cursor=next_cursor
+        ),
+        include=list_include(include, list_model, "messages"),
+        headers=validators.headers()
+    )
+
+@router.get("/messages/{recipient_id}/inbox-stream")
+async def stream_inbox_messages(
+    recipient_id: UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    user_result = await db.execute(select(User).where(User.id == recipient_id))
-    user = user_result.scalar_one_or_none()
+
+    user = await _get_user(db, recipient_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    messages_query = (
-        select(MessageRecipient)
-        .options(selectinload(MessageRecipient.message).selectinload(Message.sender))
-        .where(MessageRecipient.recipient_id == recipient_id)
-        .join(Message, MessageRecipient.message_id == Message.id)
-        .order_by(Message.timestamp.desc())
+    # Hand the pooled connection back; the stream may stay open for hours
+    await db.close()
+
+    return StreamingResponse(
+        event_stream(request, broker, recipient_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    
-    result = await db.execute(messages_query)
-    message_recipients = result.scalars().all()
-    
-    messages = []
-    for msg_recipient in message_recipients:
-        message = msg_recipient.message  
-        messages.append(MessageRecipientSchema(
-            id=msg_recipient.id,
-            message_id=message.id,
-            subject=message.subject,
-            content=message.content,
-            sender_id=message.sender_id,
-            timestamp=message.timestamp,
-            read=msg_recipient.read,
-            read_at=msg_recipient.read_at
-        ))
-    
-    return MessagesRecipientList(messages=messages, total=len(messages))
 
-@router.get("/messages/{user_id}/unread-messages", response_model=MessagesRecipientList)
+@router.get(
+    "/messages/{user_id}/unread-messages",
+    response_model=Union[MessagesRecipientList, MessagesRecipientPreviewList]
+)
 async def get_unread_messages(
     user_id: UUID,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    view: ListView = Query("full"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    total_mode: TotalMode = Query("maintained", alias="total", description=MAILBOX_TOTAL_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
 ):
 
-    user_result = await db.execute(select(User).where(User.id == user_id))
-    user = user_result.scalar_one_or_none()
-    if not user:
+    include = parse_fields(
+        fields, MessageRecipientPreview if view == "snippet" else MessageRecipientSchema
+    )
+    validators, counters = await _mailbox_validators(db, request, user_id)
+    if validators.matches(request):
+        return validators.not_modified()
+
+    total, total_kind = await resolve_total(
+        db,
+        total_mode,
+        select(MessageRecipient.id).where(
+            MessageRecipient.recipient_id == user_id,
+            MessageRecipient.read == False
+        ),
+        counters.unread_count
+    )
+
+    messages, next_cursor = await recipient_page(
+        db,
+        [MessageRecipient.recipient_id == user_id, MessageRecipient.read == False],
+        cursor,
+        limit,
+        view,
+        include
+    )
+    list_model = MessagesRecipientPreviewList if view == "snippet" else MessagesRecipientList
+    return json_response(
+        list_model.model_construct(
+            messages=messages, total=total, total_kind=total_kind, next_cursor=next_cursor
+        ),
+        include=list_include(include, list_model, "messages"),
+        headers=validators.headers()
+    )
+
+@router.get("/messages/{user_id}/unread-count", response_model=UnreadCountResponse)
+async def get_unread_count(
+    user_id: UUID,
+    db: AsyncSession = Depends(get_read_db)
+):
+
+    result = await db.execute(
+        select(
+            User.id,
+            func.coalesce(UserMailboxStats.unread_count, 0).label("unread_count"),
+            func.coalesce(UserMailboxStats.total_count, 0).label("total_count")
+        )
+        .outerjoin(UserMailboxStats, UserMailboxStats.user_id == User.id)
+        .where(User.id == user_id)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    messages_query = (
-        select(MessageRecipient)
-        .options(selectinload(MessageRecipient.message).selectinload(Message.sender))
-        .where(
-            MessageRecipient.recipient_id == user_id,
-            MessageRecipient.read == False
+    return UnreadCountResponse(
+        user_id=row.id,
+        unread_count=row.unread_count,
+        total_count=row.total_count
+    )
+
+@router.get("/messages/{user_id}/search", response_model=MessageSearchList)
+async def search_mailbox(
+    user_id: UUID,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+
+    user = await _get_user(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
         )
-        .join(Message, MessageRecipient.message_id == Message.id)
-        .order_by(Message.timestamp.desc())
+
+    messages, next_cursor = await search_messages(db, user_id, q, cursor, limit)
+    return json_response(
+        MessageSearchList.model_construct(messages=messages, next_cursor=next_cursor)
     )
-    result = await db.execute(messages_query)
-    message_recipients = result.scalars().all()
-    messages = []
-    for msg_recipient in message_recipients:
-        message = msg_recipient.message  
-        messages.append(MessageRecipientSchema(
-            id=msg_recipient.id,
-            message_id=message.id,
-            subject=message.subject,
-            content=message.content,
-            sender_id=message.sender_id,
-            timestamp=message.timestamp,
-            read=msg_recipient.read,
-            read_at=msg_recipient.read_at
-        ))
-    return MessagesRecipientList(messages=messages, total=len(messages))
 
 @router.get("/messages/{message_id}", response_model=MessageResponse)
-async def get_message_with_recipients(message_id: UUID, db: AsyncSession = Depends(get_db)):
-    message_result = await db.execute(
-        select(Message, User.name.label("sender_name"), User.email.label("sender_email"))
-        .join(User, Message.sender_id == User.id)
-        .where(Message.id == message_id)
-    )
-    message_data = message_result.first()
+async def get_message_with_recipients(
+    message_id: UUID,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_read_db)
+):
+
+    include = parse_fields(fields, MessageResponse)
+    validators = await _message_validators(db, request, message_id)
+    if validators is not None and validators.matches(request):
+        return validators.not_modified()
+
+    # The message itself is immutable; only the recipients' read state changes
+    async def load() -> Optional[MessageResponse]:
+        result = await db.execute(select(*MESSAGE_COLUMNS).where(Message.id == message_id))
+        row = result.first()
+        return MessageResponse.model_construct(**row._mapping, recipients=None) if row else None
+
+    if wants(include, "content"):
+        message = await cache.get_or_load(message_key(message_id), MessageResponse, load)
+    else:
+        # Without the body this is a cheap primary-key read; going through
+        # the cache would mean fetching and decompressing content to fill it
+        result = await db.execute(
+            select(*project(MESSAGE_COLUMNS, include, always=("id", "timestamp")))
+            .where(Message.id == message_id)
+        )
+        row = result.first()
+        message = MessageResponse.model_construct(**row._mapping) if row else None
     
-    if not message_data:
+    if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
     
-    message = message_data.Message
-    
-    recipients_result = await db.execute(
-        select(MessageRecipient)
-        .join(User, MessageRecipient.recipient_id == User.id)
-        .where(MessageRecipient.message_id == message_id)
-        .order_by(User.name)
-    )
-    recipients_data = recipients_result.all()
-    
-    recipient_info = []
-    for row in recipients_data:
-        msg_recipient = row.MessageRecipient
-        recipient_info.append({
-            "id": msg_recipient.id,
-            "recipient_id": msg_recipient.recipient_id,
-            "read": msg_recipient.read,
-            "read_at": msg_recipient.read_at
-        })
+    recipient_info = None
+    if wants(include, "recipients"):
+        recipients_result = await db.execute(
+            select(*project(RECIPIENT_INFO_COLUMNS, nested(include, "recipients")))
+            .join(User, MessageRecipient.recipient_id == User.id)
+            .where(
+                MessageRecipient.message_id == message_id,
+                MessageRecipient.message_timestamp == message.timestamp
+            )
+            .order_by(User.name)
+        )
+        recipient_info = [
+            MessageRecipientInfo.model_construct(**row._mapping) for row in recipients_result
+        ]
     
-    return MessageResponse(
-        id=message.id,
-        subject=message.subject,
-        content=message.content,
-        sender_id=message.sender_id,
-        sender_name=message_data.sender_name,
-        sender_email=message_data.sender_email,
-        timestamp=message.timestamp,
-        recipients=recipient_info
+    return json_response(
+        message.model_copy(update={"recipients": recipient_info}),
+        include=include,
+        headers=validators.headers() if validators is not None else None
     )
 
 @router.patch("/messages/{message_id}/users/{user_id}/read", response_model=MarkAsReadResponse)
@@ -325,34 +669,42 @@ async def mark_message_as_read(
     db: AsyncSession = Depends(get_db)
 ):
     
-    msg_recipient_result = await db.execute(
-        select(MessageRecipient)
+    # Flip the flag only if it is still unread: the row lock taken by the
+    # UPDATE serialises concurrent requests, so exactly one of them wins.
+    result = await db.execute(
+        update(MessageRecipient)
         .where(
             MessageRecipient.message_id == message_id,
-            MessageRecipient.recipient_id == user_id
+            MessageRecipient.recipient_id == user_id,
+            MessageRecipient.read == False
         )
+        .values(read=True, read_at=func.now())
+        .returning(MessageRecipient.read_at)
+        .execution_options(synchronize_session=False)
     )
-    msg_recipient = msg_recipient_result.scalar_one_or_none()
+    read_time = result.scalar_one_or_none()
     
-    if not msg_recipient:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
+    if read_time is None:
+        existing = await db.execute(
+            select(MessageRecipient.id)
+            .where(
+                MessageRecipient.message_id == message_id,
+                MessageRecipient.recipient_id == user_id
+            )
         )
-    
-    if msg_recipient.read:
+        if existing.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Message is already marked as read"
         )
     
-    read_time = datetime.now()
-    await db.execute(
-        update(MessageRecipient)
-        .where(MessageRecipient.id == msg_recipient.id)
-        .values(read=True, read_at=read_time)
-    )
+    await record_reads(db, user_id, 1)
     await db.commit()
+    record_write(user_id, message_id)
     
     return MarkAsReadResponse(
         message_id=message_id,
@@ -360,3 +712,57 @@ async def mark_message_as_read(
         read=True,
         read_at=read_time
     )
+
+
+@router.patch("/messages/users/{user_id}/read", response_model=MarkAsReadBatchResponse)
+async def mark_messages_as_read(
+    user_id: UUID,
+    selector: MarkAsReadBatchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+
+    conditions = [
+        MessageRecipient.recipient_id == user_id,
+        MessageRecipient.read == False
+    ]
+    if selector.message_ids:
+        conditions.append(MessageRecipient.message_id.in_(selector.message_ids))
+
+    if selector.before:
+        conditions.append(MessageRecipient.message_timestamp <= selector.before)
+    if selector.cursor:
+        timestamp, message_id = decode_cursor(selector.cursor)
+        conditions.append(
+            tuple_(MessageRecipient.message_timestamp, MessageRecipient.message_id)
+            <= tuple_(timestamp, message_id)
+        )
+    if selector.sender_id:
+        conditions.append(
+            exists().where(
+                Message.id == MessageRecipient.message_id,
+                Message.timestamp == MessageRecipient.message_timestamp,
+                Message.sender_id == selector.sender_id
+            )
+        )
+
+    result = await db.execute(
+        update(MessageRecipient)
+        .where(*conditions)
+        .values(read=True, read_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    updated = result.rowcount
+
+    if updated == 0:
+        user_result = await db.execute(select(User.id).where(User.id == user_id))
+        if user_result.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+
+    await record_reads(db, user_id, updated)
+    await db.commit()
+    record_write(user_id)
+
+    return MarkAsReadBatchResponse(recipient_id=user_id, updated=updated)
@@ -1,8 +1,11 @@
 # Pydantic models
 from datetime import datetime
-from typing import List, Optional, Union
+from typing import List, Literal, Optional, Union
 from uuid import UUID
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, model_validator
+
+# How a list's `total` was computed; see app.totals
+TotalKind = Literal["exact", "estimated", "maintained"]
 
 
 class UserBase(BaseModel):
@@ -27,7 +30,20 @@ class UserList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
     users: List[UserResponse]
-    total: int
+    total: Optional[int] = None
+    total_kind: Optional[TotalKind] = None
+
+
+class UserImportError(BaseModel):
+    line: int
+    error: str
+
+
+class UserImportResult(BaseModel):
+    created: int
+    skipped: int
+    invalid: int
+    errors: List[UserImportError] = []
 
 
 # Message Schemas
@@ -66,7 +82,49 @@ class MessageList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
     messages: List[MessageResponse]
-    total: int
+    total: Optional[int] = None
+    total_kind: Optional[TotalKind] = None
+    next_cursor: Optional[str] = None
+
+
+class MessagePreview(BaseModel):
+    """A sent message as shown in list views: a snippet instead of the body."""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: UUID
+    subject: Optional[str]
+    snippet: str
+    truncated: bool
+    sender_id: UUID
+    timestamp: datetime
+    recipients: Optional[List[MessageRecipientInfo]] = None
+
+
+class MessagePreviewList(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    messages: List[MessagePreview]
+    total: Optional[int] = None
+    total_kind: Optional[TotalKind] = None
+    next_cursor: Optional[str] = None
+
+
+class MessageSearchResult(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: UUID
+    subject: Optional[str]
+    content: str
+    sender_id: UUID
+    timestamp: datetime
+    rank: float
+
+
+class MessageSearchList(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    messages: List[MessageSearchResult]
+    next_cursor: Optional[str] = None
 
 
 class MessageRecipientSchema(BaseModel):
@@ -86,7 +144,43 @@ class MessagesRecipientList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
     messages: List[MessageRecipientSchema]
-    total: int
+    total: Optional[int] = None
+    total_kind: Optional[TotalKind] = None
+    next_cursor: Optional[str] = None
+
+
+class MessageRecipientPreview(BaseModel):
+    """An inbox entry as shown in list views: a snippet instead of the body."""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: UUID
+    message_id: UUID
+    subject: Optional[str]
+    snippet: str
+    truncated: bool
+    sender_id: UUID
+    timestamp: datetime
+    read: bool
+    read_at: Optional[datetime] = None
+
+
+class MessagesRecipientPreviewList(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    messages: List[MessageRecipientPreview]
+    total: Optional[int] = None
+    total_kind: Optional[TotalKind] = None
+    next_cursor: Optional[str] = None
+
+
+class ExportedSentMessage(MessageResponse):
+    """A sent message, with its recipients' read state, in a mailbox export."""
+    type: Literal["sent"] = "sent"
+
+
+class ExportedReceivedMessage(MessageRecipientSchema):
+    """A received message in a mailbox export."""
+    type: Literal["received"] = "received"
 
 
 class MarkAsReadResponse(BaseModel):
@@ -95,4 +189,52 @@ class MarkAsReadResponse(BaseModel):
     message_id: UUID
     recipient_id: UUID
     read: bool
-    read_at: datetime
\ No newline at end of file
+    read_at: datetime
+
+
+class MarkAsReadBatchRequest(BaseModel):
+    """Selects which of a user's unread messages to mark as read.
+
+    Selectors are combined with AND; `all` must be set explicitly to clear
+    the whole inbox.
+    """
+    message_ids: Optional[List[UUID]] = Field(None, min_length=1, max_length=1000)
+    sender_id: Optional[UUID] = None
+    before: Optional[datetime] = None
+    cursor: Optional[str] = None
+    all: bool = False
+
+    @model_validator(mode="after")
+    def check_selector(self):
+        selectors = (self.message_ids, self.sender_id, self.before, self.cursor)
+        if not self.all and all(value is None for value in selectors):
+            raise ValueError("Provide message_ids, sender_id, before, cursor or all")
+        return self
+
+
+class MarkAsReadBatchResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    recipient_id: UUID
+    updated: int
+
+
+class UnreadCountResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    user_id: UUID
+    unread_count: int
+    total_count: int
+
+
+class MessageDeliveryStatus(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    message_id: UUID
+    status: str
+    total_recipients: int
+    processed_recipients: int
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
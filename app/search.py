@@ -0,0 +1,88 @@
+# Ranked full-text search over the messages a user sent or received
+import re
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import Float, cast, column, exists, func, literal_column, or_, select, table, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import SEARCH_CONFIG, Message, MessageRecipient
+from .pagination import decode_rank_cursor, encode_rank_cursor, split_page
+from .schemas import MessageSearchResult
+
+# Subject matches count for more than body matches on both backends
+SUBJECT_WEIGHT = 4.0
+CONTENT_WEIGHT = 1.0
+
+_messages_fts = table("messages_fts", column("rowid"))
+
+
+def fts5_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query that requires every word.
+
+    Each word is quoted so user input can never be parsed as FTS5 syntax.
+    Returns None when `q` contains no words at all.
+    """
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def _in_mailbox(user_id: UUID):
+    return or_(
+        Message.sender_id == user_id,
+        exists().where(
+            MessageRecipient.message_id == Message.id,
+            MessageRecipient.message_timestamp == Message.timestamp,
+            MessageRecipient.recipient_id == user_id,
+        ),
+    )
+
+
+def _ranked_matches(db: AsyncSession, user_id: UUID, q: str):
+    columns = (Message.id, Message.subject, Message.content, Message.sender_id, Message.timestamp)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # websearch_to_tsquery accepts anything a user types: quotes, OR, -word
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q)
+        vector = Message.search_vector
+        # ts_rank's default weights for D, C, B, A
+        weights = literal_column(f"'{{0.1, 0.2, {CONTENT_WEIGHT / SUBJECT_WEIGHT}, 1.0}}'::float4[]")
+        rank = cast(func.ts_rank(weights, vector, tsquery), Float(53))
+        return select(*columns, rank.label("rank")).where(
+            vector.op("@@")(tsquery), _in_mailbox(user_id)
+        )
+
+    match = fts5_query(q)
+    if match is None:
+        return None
+    # bm25() is lower for better matches
+    rank = cast(-func.bm25(literal_column("messages_fts"), SUBJECT_WEIGHT, CONTENT_WEIGHT), Float)
+    return (
+        select(*columns, rank.label("rank"))
+        .select_from(_messages_fts)
+        .join(Message, literal_column("messages.rowid") == _messages_fts.c.rowid)
+        .where(literal_column("messages_fts").op("MATCH")(match), _in_mailbox(user_id))
+    )
+
+
+async def search_messages(
+    db: AsyncSession, user_id: UUID, q: str, cursor: Optional[str], limit: int
+) -> Tuple[List[MessageSearchResult], Optional[str]]:
+    """One page of `user_id`'s messages matching `q`, best match first."""
+    matches = _ranked_matches(db, user_id, q)
+    if matches is None:
+        return [], None
+    matches = matches.subquery()
+
+    query = select(matches).order_by(matches.c.rank.desc(), matches.c.id.desc()).limit(limit + 1)
+    if cursor:
+        rank, row_id = decode_rank_cursor(cursor)
+        query = query.where(tuple_(matches.c.rank, matches.c.id) < tuple_(rank, row_id))
+
+    result = await db.execute(query)
+    rows, next_cursor = split_page(
+        result.all(), limit, lambda row: (row.rank, row.id), encode_rank_cursor
+    )
+    return [MessageSearchResult.model_construct(**row._mapping) for row in rows], next_cursor
@@ -0,0 +1,120 @@
+# List totals: exact COUNT, planner estimates or maintained counters
+import json
+import os
+from typing import Literal, Optional, Tuple, Union
+
+from sqlalchemy import Select, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from .mailbox import upsert_insert
+from .models import RowCount
+from .schemas import TotalKind
+
+TotalMode = Literal["exact", "estimated", "maintained", "none"]
+
+DEFAULT_MODE: TotalMode = os.getenv("TOTALS_MODE", "exact")  # type: ignore[assignment]
+
+TOTAL_DESCRIPTION = (
+    "How to compute `total`: exact (COUNT), estimated (planner statistics, Postgres only), "
+    "maintained (counters kept by the write paths) or none to skip it. "
+    "`total_kind` says which one was used; modes that are unavailable fall back to exact."
+)
+
+# The inbox lists default to their mailbox counters, which every send and
+# read updates in its own transaction
+MAILBOX_TOTAL_DESCRIPTION = TOTAL_DESCRIPTION + (
+    " Defaults to maintained, the user's mailbox counters; use exact to recount."
+)
+
+_row_counts = RowCount.__table__
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+async def add_row_count(db: AsyncSession, table_name: str, delta: int) -> None:
+    """Add `delta` rows to the maintained count of `table_name`."""
+    if delta == 0:
+        return
+    stmt = upsert_insert(db, _row_counts).values(table_name=table_name, row_count=delta)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[_row_counts.c.table_name],
+            set_={"row_count": _row_counts.c.row_count + delta},
+        )
+    )
+
+
+async def reconcile_row_counts(db: AsyncSession, *tables) -> None:
+    """Recount `tables` into their maintained row counts."""
+    for table in tables:
+        count = (await db.execute(select(func.count()).select_from(table))).scalar_one()
+        stmt = upsert_insert(db, _row_counts).values(table_name=table.name, row_count=count)
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[_row_counts.c.table_name],
+                set_={"row_count": stmt.excluded.row_count},
+            )
+        )
+
+
+async def _table_estimate(db: AsyncSession, table_name: str) -> Optional[int]:
+    # reltuples is -1 until the table has been vacuumed or analyzed
+    result = await db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": table_name},
+    )
+    estimate = result.scalar_one_or_none()
+    return estimate if estimate is not None and estimate >= 0 else None
+
+
+async def _plan_estimate(db: AsyncSession, rows: Select) -> int:
+    """The planner's row estimate for `rows`, without running it."""
+    plan = (await db.execute(_Explain(rows))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def resolve_total(
+    db: AsyncSession,
+    mode: TotalMode,
+    rows: Select,
+    maintained: Union[Select, int],
+    table_name: Optional[str] = None,
+) -> Tuple[Optional[int], Optional[TotalKind]]:
+    """The total of `rows` in `mode`, and the kind of total it turned out to be.
+
+    `maintained` selects the counter for "maintained", or is its value
+    when the caller has already read it; no counter row means zero. "estimated" reads pg_class.reltuples when `rows` is the
+    whole of `table_name`, otherwise the planner's estimate for `rows`.
+    Estimates are only available on Postgres; elsewhere they fall back
+    to an exact count.
+    """
+    if mode == "none":
+        return None, None
+    if mode == "maintained":
+        if isinstance(maintained, int):
+            return maintained, "maintained"
+        return (await db.execute(maintained)).scalar_one_or_none() or 0, "maintained"
+    if mode == "estimated" and db.get_bind().dialect.name == "postgresql":
+        if table_name is not None:
+            estimate = await _table_estimate(db, table_name)
+        else:
+            estimate = await _plan_estimate(db, rows)
+        if estimate is not None:
+            return estimate, "estimated"
+    count = await db.execute(select(func.count()).select_from(rows.subquery()))
+    return count.scalar_one(), "exact"
+
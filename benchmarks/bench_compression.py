@@ -0,0 +1,109 @@
+# Storage saved by message body compression against the CPU it costs
+import argparse
+import asyncio
+import json
+import random
+import timeit
+
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.compression import CODECS, backfill, compress, decompress, decompress_head, zstandard
+from app.models import Message
+
+from .common import make_engine, reset_schema, seed_inbox
+
+
+def machine_body(rng: random.Random, body_bytes: int) -> str:
+    """A CI/monitoring style report: JSON lines with a few varying fields."""
+    lines = []
+    size = 0
+    while size < body_bytes:
+        line = json.dumps({
+            "ts": f"2026-10-16T12:{rng.randrange(60):02d}:{rng.randrange(60):02d}Z",
+            "host": f"web-{rng.randrange(40):03d}",
+            "level": rng.choice(["INFO", "INFO", "INFO", "WARN", "ERROR"]),
+            "check": rng.choice(["disk", "cpu", "latency", "http_5xx"]),
+            "value": round(rng.uniform(0, 100), 2),
+            "msg": "threshold evaluated",
+        })
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def available_codecs():
+    return [codec for codec in CODECS if codec != "zstd" or zstandard is not None]
+
+
+def bench_cpu(body: str, number: int) -> None:
+    print(f"{len(body.encode()):,} byte body, best of 5 x {number}")
+    print(f"{'codec':>6} {'stored':>10} {'ratio':>7} {'write us':>10} {'read us':>10} {'head us':>10}")
+    for codec in available_codecs():
+        stored = compress(body, codec, min_bytes=0)
+        write = min(timeit.repeat(lambda: compress(body, codec, 0), number=number, repeat=5))
+        read = min(timeit.repeat(lambda: decompress(stored), number=number, repeat=5))
+        head = min(timeit.repeat(lambda: decompress_head(stored, 201), number=number, repeat=5))
+        print(
+            f"{codec:>6} {len(stored):>10,} {len(body.encode()) / len(stored):>7.1f} "
+            f"{write / number * 1e6:>10.1f} {read / number * 1e6:>10.1f} {head / number * 1e6:>10.1f}"
+        )
+
+
+async def database_bytes(engine: AsyncEngine) -> int:
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM FULL messages"))
+            result = await conn.execute(text("SELECT pg_total_relation_size('messages')"))
+            return result.scalar_one()
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM"))
+        pages = (await conn.execute(text("PRAGMA page_count"))).scalar_one()
+        page_size = (await conn.execute(text("PRAGMA page_size"))).scalar_one()
+        return pages * page_size
+
+
+async def bench_storage(messages: int, body_bytes: int) -> None:
+    engine = make_engine()
+    await reset_schema(engine)
+    await seed_inbox(engine, messages)
+    rng = random.Random(7)
+    messages_table = Message.__table__
+    async with engine.begin() as conn:
+        ids = (await conn.execute(select(Message.id))).scalars().all()
+        await conn.execute(
+            messages_table.update()
+            .where(messages_table.c.id == bindparam("b_id"))
+            .values(content=bindparam("b_content", type_=Message.content.type)),
+            [{"b_id": message_id, "b_content": machine_body(rng, body_bytes)} for message_id in ids],
+        )
+
+    print(f"\n{messages:,} messages of ~{body_bytes:,} bytes ({engine.dialect.name})")
+    # Each pass re-encodes the bodies the previous one wrote; "none" goes first
+    print(f"{'codec':>6} {'content MiB':>12} {'db MiB':>10} {'backfill s':>11}")
+    async with AsyncSession(engine) as db:
+        for codec in available_codecs():
+            started = asyncio.get_running_loop().time()
+            await backfill(db, codec, min_bytes=1024)
+            elapsed = asyncio.get_running_loop().time() - started
+            content = (await db.execute(select(func.sum(func.length(Message.content))))).scalar_one()
+            await db.commit()
+            total = await database_bytes(engine)
+            print(f"{codec:>6} {content / 2**20:>12.1f} {total / 2**20:>10.1f} {elapsed:>11.2f}")
+    await engine.dispose()
+
+
+def main(messages: int, body_bytes: int, number: int) -> None:
+    bench_cpu(machine_body(random.Random(7), body_bytes), number)
+    asyncio.run(bench_storage(messages, body_bytes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Message body compression benchmark")
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--body-bytes", type=int, default=8_000)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    main(args.messages, args.body_bytes, args.number)
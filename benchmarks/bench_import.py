@@ -0,0 +1,65 @@
+# Users per second: one POST /users per user against the bulk import
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.importer import import_users
+from app.routes import create_user
+from app.schemas import UserCreate
+
+from .common import make_engine, reset_schema
+
+
+def csv_body(users: int, prefix: str) -> bytes:
+    lines = ["email,name"] + [f"{prefix}{i}@example.com,User {i}" for i in range(users)]
+    return "\n".join(lines).encode()
+
+
+def ndjson_body(users: int, prefix: str) -> bytes:
+    return "\n".join(
+        json.dumps({"email": f"{prefix}{i}@example.com", "name": f"User {i}"})
+        for i in range(users)
+    ).encode()
+
+
+async def chunked(body: bytes, size: int = 64 * 1024):
+    # Arrives in pieces, as a request body does
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+async def main(users: int, single: int) -> None:
+    engine = make_engine()
+    await reset_schema(engine)
+    print(f"{'path':>18} {'users':>8} {'created':>8} {'seconds':>8} {'users/s':>10}")
+
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        started = time.perf_counter()
+        for i in range(single):
+            await create_user(UserCreate(email=f"single{i}@example.com", name=f"User {i}"), db)
+        elapsed = time.perf_counter() - started
+        print(f"{'POST /users':>18} {single:>8,} {single:>8,} {elapsed:>8.2f} {single / elapsed:>10,.0f}")
+
+        runs = (
+            ("import csv", "csv", csv_body(users, "csv")),
+            ("import ndjson", "ndjson", ndjson_body(users, "ndjson")),
+            # Every email taken: the cost of re-running an import
+            ("re-import csv", "csv", csv_body(users, "csv")),
+        )
+        for label, fmt, body in runs:
+            started = time.perf_counter()
+            result = await import_users(db, chunked(body), fmt)
+            elapsed = time.perf_counter() - started
+            print(f"{label:>18} {users:>8,} {result.created:>8,} {elapsed:>8.2f} {users / elapsed:>10,.0f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk user import throughput")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--single", type=int, default=2_000, help="users created one request at a time")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.single))
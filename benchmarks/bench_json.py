@@ -0,0 +1,64 @@
+# Response serialisation paths for a large MessagesRecipientList
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.responses import FastJSONResponse, orjson
+from app.schemas import MessageRecipientSchema, MessagesRecipientList
+
+_adapter = TypeAdapter(MessagesRecipientList)
+
+
+def build_payload(rows: int) -> MessagesRecipientList:
+    now = datetime.now(timezone.utc)
+    sender_id = uuid.uuid4()
+    messages = [
+        MessageRecipientSchema.model_construct(
+            id=uuid.uuid4(),
+            message_id=uuid.uuid4(),
+            subject=f"Subject {i}",
+            content="Lorem ipsum dolor sit amet " * 20,
+            sender_id=sender_id,
+            timestamp=now,
+            read=i % 3 == 0,
+            read_at=now if i % 3 == 0 else None,
+        )
+        for i in range(rows)
+    ]
+    return MessagesRecipientList.model_construct(messages=messages, total=rows, next_cursor=None)
+
+
+def main(rows: int, number: int) -> None:
+    payload = build_payload(rows)
+    paths = {
+        # No response_model: FastAPI falls back to jsonable_encoder + json.dumps
+        "jsonable_encoder+json": lambda: json.dumps(jsonable_encoder(payload)).encode(),
+        # response_model on older FastAPI: dump to JSON-mode dicts, then json.dumps
+        "dump_python+json": lambda: json.dumps(
+            _adapter.dump_python(_adapter.validate_python(payload), mode="json")
+        ).encode(),
+        # response_model on recent FastAPI (dump_json fast path)
+        "validate+dump_json": lambda: _adapter.dump_json(_adapter.validate_python(payload)),
+        "FastJSONResponse": lambda: FastJSONResponse(payload).body,
+    }
+    if orjson is not None:
+        paths["orjson(model_dump)"] = lambda: orjson.dumps(payload.model_dump())
+
+    print(f"{rows} rows, best of 5 x {number}")
+    print(f"{'path':>24} {'ms/call':>10}")
+    for name, fn in paths.items():
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{name:>24} {best * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON response serialisation microbenchmark")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    main(args.rows, args.number)
@@ -0,0 +1,66 @@
+# OFFSET vs keyset pagination cost at increasing page depth
+import argparse
+import asyncio
+
+from sqlalchemy import select
+
+from app.models import Message, MessageRecipient
+from app.pagination import apply_keyset, encode_cursor
+
+from .common import make_engine, reset_schema, seed_inbox, timed
+
+
+def inbox_query(recipient_id):
+    return (
+        select(Message.id, Message.timestamp)
+        .join(MessageRecipient, MessageRecipient.message_id == Message.id)
+        .where(MessageRecipient.recipient_id == recipient_id)
+    )
+
+
+def sent_query(sender_id):
+    return select(Message.id, Message.timestamp).where(Message.sender_id == sender_id)
+
+
+async def bench(conn, name, base_query, depths, limit, repeat) -> None:
+    ordered = base_query.order_by(Message.timestamp.desc(), Message.id.desc())
+    for depth in depths:
+        offset_query = ordered.offset(depth).limit(limit)
+
+        cursor = None
+        if depth:
+            anchor = (await conn.execute(ordered.offset(depth - 1).limit(1))).one()
+            cursor = encode_cursor(anchor.timestamp, anchor.id)
+        keyset_query = apply_keyset(base_query, Message.timestamp, Message.id, cursor, limit)
+
+        offset_ms = await timed(lambda: conn.execute(offset_query), repeat)
+        keyset_ms = await timed(lambda: conn.execute(keyset_query), repeat)
+        print(f"{name:>6} {depth:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+
+async def main(messages: int, limit: int, repeat: int) -> None:
+    engine = make_engine()
+    await reset_schema(engine)
+    recipient_id, sender_ids = await seed_inbox(engine, messages, senders=2)
+
+    depths = [0, 1_000, 10_000, 25_000, 50_000, 100_000, 250_000]
+    print(f"{'query':>6} {'depth':>10} {'offset ms':>12} {'keyset ms':>12}")
+    async with engine.connect() as conn:
+        await bench(
+            conn, "inbox", inbox_query(recipient_id),
+            [d for d in depths if d < messages], limit, repeat
+        )
+        await bench(
+            conn, "sent", sent_query(sender_ids[0]),
+            [d for d in depths if d < messages // 2], limit, repeat
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OFFSET vs keyset pagination benchmark")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.limit, args.repeat))
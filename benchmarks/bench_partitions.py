@@ -0,0 +1,158 @@
+# Recent-inbox latency as history grows, plain vs monthly-partitioned tables (Postgres only)
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.models import Base, Message, MessageRecipient, User, UserMailboxStats
+from app.partitions import add_months, create_partition_sql
+from app.projections import recipient_page
+
+from .common import make_engine, timed
+
+# Same shape as the partitioned layout at the head migration
+_PARTITIONED_DDL = (
+    """
+    CREATE TABLE messages (
+        id UUID NOT NULL,
+        sender_id UUID NOT NULL REFERENCES users (id),
+        subject VARCHAR(500),
+        content BYTEA NOT NULL,
+        "timestamp" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+        search_vector TSVECTOR,
+        PRIMARY KEY (id, "timestamp")
+    ) PARTITION BY RANGE ("timestamp")
+    """,
+    """
+    CREATE TABLE message_recipients (
+        id UUID NOT NULL,
+        message_id UUID NOT NULL,
+        message_timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+        recipient_id UUID NOT NULL REFERENCES users (id),
+        read BOOLEAN NOT NULL,
+        read_at TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (id, message_timestamp),
+        UNIQUE (message_id, recipient_id, message_timestamp),
+        FOREIGN KEY (message_id, message_timestamp) REFERENCES messages (id, "timestamp")
+    ) PARTITION BY RANGE (message_timestamp)
+    """,
+    'CREATE INDEX ON messages (sender_id, "timestamp" DESC, id DESC)',
+    "CREATE INDEX ON message_recipients (recipient_id, message_timestamp DESC, message_id DESC)",
+    "CREATE INDEX ON message_recipients (recipient_id, message_timestamp DESC, message_id DESC) "
+    "WHERE read = false",
+)
+
+START = date(2024, 1, 1)
+
+
+async def reset(engine: AsyncEngine, partitioned: bool, months: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        if not partitioned:
+            await conn.run_sync(Base.metadata.create_all)
+            return
+        await conn.run_sync(
+            Base.metadata.create_all, tables=[User.__table__, UserMailboxStats.__table__]
+        )
+        for statement in _PARTITIONED_DDL:
+            await conn.execute(text(statement))
+        for offset in range(months):
+            month = add_months(START, offset)
+            await conn.execute(text(create_partition_sql("messages", month)))
+            await conn.execute(text(create_partition_sql("message_recipients", month)))
+
+
+async def seed_month(
+    engine: AsyncEngine,
+    rng: random.Random,
+    month: date,
+    per_month: int,
+    user_ids: List[uuid.UUID],
+    target: uuid.UUID,
+) -> None:
+    """`per_month` messages spread over the month, 5% of them to `target`."""
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    step = (datetime.combine(add_months(month, 1), datetime.min.time(), timezone.utc) - start) / per_month
+    async with engine.begin() as conn:
+        for offset in range(0, per_month, 5000):
+            message_rows: List[dict] = []
+            recipient_rows: List[dict] = []
+            for i in range(offset, min(offset + 5000, per_month)):
+                message_id = uuid.UUID(int=rng.getrandbits(128))
+                timestamp = start + step * i
+                message_rows.append({
+                    "id": message_id,
+                    "sender_id": rng.choice(user_ids),
+                    "subject": f"Subject {i}",
+                    "content": f"Body of message {i} " * 8,
+                    "timestamp": timestamp,
+                })
+                recipient_rows.append({
+                    "id": uuid.UUID(int=rng.getrandbits(128)),
+                    "message_id": message_id,
+                    "message_timestamp": timestamp,
+                    "recipient_id": target if rng.random() < 0.05 else rng.choice(user_ids),
+                    "read": rng.random() < 0.9,
+                })
+            await conn.execute(insert(Message), message_rows)
+            await conn.execute(insert(MessageRecipient), recipient_rows)
+        await conn.execute(text("ANALYZE messages"))
+        await conn.execute(text("ANALYZE message_recipients"))
+
+
+async def run(
+    engine: AsyncEngine, partitioned: bool, months: int, per_month: int, every: int,
+    limit: int, repeat: int,
+) -> None:
+    rng = random.Random(42)
+    await reset(engine, partitioned, months)
+    user_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(1000)]
+    target = user_ids[0]
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {"id": uid, "email": f"user{i}@bench.local", "name": f"User {i}"}
+            for i, uid in enumerate(user_ids)
+        ])
+
+    layout = "partitioned" if partitioned else "plain"
+    for offset in range(months):
+        await seed_month(engine, rng, add_months(START, offset), per_month, user_ids, target)
+        if (offset + 1) % every:
+            continue
+        async with AsyncSession(engine) as db:
+            inbox_ms = await timed(lambda: recipient_page(
+                db, [MessageRecipient.recipient_id == target], None, limit
+            ), repeat)
+            unread_ms = await timed(lambda: recipient_page(
+                db,
+                [MessageRecipient.recipient_id == target, MessageRecipient.read == False],
+                None, limit
+            ), repeat)
+        rows = (offset + 1) * per_month
+        print(f"{layout:>11} {offset + 1:>7} {rows:>12,} {inbox_ms:>10.2f} {unread_ms:>10.2f}")
+
+
+async def main(months: int, per_month: int, every: int, limit: int, repeat: int) -> None:
+    engine = make_engine()
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("bench_partitions needs BENCH_DATABASE_URL pointing at Postgres")
+    print(f"{'layout':>11} {'months':>7} {'messages':>12} {'inbox ms':>10} {'unread ms':>10}")
+    for partitioned in (False, True):
+        await run(engine, partitioned, months, per_month, every, limit, repeat)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partitioned vs plain inbox latency benchmark")
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--per-month", type=int, default=50_000)
+    parser.add_argument("--every", type=int, default=6, help="measure every N months")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.months, args.per_month, args.every, args.limit, args.repeat))
@@ -0,0 +1,97 @@
+# ORM hydration vs column projection for the inbox list endpoint
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.models import Message, MessageRecipient
+from app.pagination import apply_keyset, split_page
+from app.projections import recipient_page
+from app.schemas import MessageRecipientSchema, MessagesRecipientList
+
+from .common import make_engine, reset_schema, seed_inbox
+
+_response = TypeAdapter(MessagesRecipientList)
+
+
+async def orm_page(db: AsyncSession, recipient_id, limit: int) -> MessagesRecipientList:
+    """The inbox handler as it was before the projection fast path."""
+    result = await db.execute(apply_keyset(
+        select(MessageRecipient)
+        .options(selectinload(MessageRecipient.message).selectinload(Message.sender))
+        .where(MessageRecipient.recipient_id == recipient_id)
+        .join(Message, MessageRecipient.message_id == Message.id),
+        Message.timestamp, Message.id, None, limit
+    ))
+    rows, next_cursor = split_page(
+        result.scalars().all(), limit, lambda r: (r.message.timestamp, r.message.id)
+    )
+    messages = [
+        MessageRecipientSchema(
+            id=r.id,
+            message_id=r.message.id,
+            subject=r.message.subject,
+            content=r.message.content,
+            sender_id=r.message.sender_id,
+            timestamp=r.message.timestamp,
+            read=r.read,
+            read_at=r.read_at
+        )
+        for r in rows
+    ]
+    return MessagesRecipientList(messages=messages, total=len(messages), next_cursor=next_cursor)
+
+
+async def projected_page(db: AsyncSession, recipient_id, limit: int) -> MessagesRecipientList:
+    messages, next_cursor = await recipient_page(
+        db, [MessageRecipient.recipient_id == recipient_id], None, limit
+    )
+    return MessagesRecipientList.model_construct(
+        messages=messages, total=len(messages), next_cursor=next_cursor
+    )
+
+
+async def measure(engine, build, recipient_id, limit: int, repeat: int):
+    """Median latency (ms) and median peak traced KiB per request, including
+    the response validation + JSON dump FastAPI performs."""
+    latencies = []
+    peaks = []
+    for _ in range(repeat):
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            tracemalloc.start()
+            start = time.perf_counter()
+            page = await build(db, recipient_id, limit)
+            _response.dump_json(_response.validate_python(page, from_attributes=True))
+            latencies.append((time.perf_counter() - start) * 1000)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peaks.append(peak / 1024)
+    latencies.sort()
+    peaks.sort()
+    return latencies[len(latencies) // 2], peaks[len(peaks) // 2]
+
+
+async def main(messages: int, repeat: int) -> None:
+    engine = make_engine()
+    await reset_schema(engine)
+    recipient_id, _ = await seed_inbox(engine, messages)
+
+    print(f"{'limit':>6} {'path':>10} {'p50 ms':>10} {'p50 peak KiB':>13}")
+    for limit in (10, 50, 100, 1000):
+        for name, build in (("orm", orm_page), ("projected", projected_page)):
+            latency, peak = await measure(engine, build, recipient_id, limit, repeat)
+            print(f"{limit:>6} {name:>10} {latency:>10.2f} {peak:>13.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ORM vs projected inbox page")
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.repeat))
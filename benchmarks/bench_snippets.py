@@ -0,0 +1,44 @@
+# Full bodies vs server-side snippets for the inbox list
+import argparse
+import asyncio
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Message, MessageRecipient
+from app.projections import recipient_page
+from app.schemas import MessagesRecipientList, MessagesRecipientPreviewList
+
+from .common import make_engine, reset_schema, seed_inbox, timed
+
+
+async def main(messages: int, body_bytes: int, limit: int, repeat: int) -> None:
+    engine = make_engine()
+    await reset_schema(engine)
+    recipient_id, _ = await seed_inbox(engine, messages)
+    async with engine.begin() as conn:
+        await conn.execute(update(Message).values(content="Body " + "x" * body_bytes))
+
+    print(f"{'view':>8} {'body KiB':>10} {'json KiB':>10} {'ms':>8}")
+    conditions = [MessageRecipient.recipient_id == recipient_id]
+    async with AsyncSession(engine) as db:
+        views = (("full", MessagesRecipientList), ("snippet", MessagesRecipientPreviewList))
+        for view, list_model in views:
+            page, _ = await recipient_page(db, conditions, None, limit, view)
+            body = page[0].content if view == "full" else page[0].snippet
+            # Body text per page; every row's body is the same length
+            body_bytes = len(body.encode()) * len(page)
+            wire_bytes = len(list_model.model_construct(messages=page, total=messages).model_dump_json())
+            ms = await timed(lambda: recipient_page(db, conditions, None, limit, view), repeat)
+            print(f"{view:>8} {body_bytes / 1024:>10.1f} {wire_bytes / 1024:>10.1f} {ms:>8.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inbox list payload size, full vs snippet")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--body-bytes", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.body_bytes, args.limit, args.repeat))
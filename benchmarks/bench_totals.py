@@ -0,0 +1,61 @@
+# Cost of each list total mode for the users list and a heavy sender
+import argparse
+import asyncio
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.mailbox import reconcile
+from app.models import Message, RowCount, User, UserMailboxStats
+from app.totals import reconcile_row_counts, resolve_total
+
+from .common import make_engine, reset_schema, seed_mailboxes, timed
+
+
+async def main(users: int, messages: int, repeat: int) -> None:
+    engine = make_engine()
+    await reset_schema(engine)
+    user_ids = await seed_mailboxes(engine, users, messages)
+    sender_id = user_ids[0]
+    async with AsyncSession(engine) as db:
+        await reconcile(db)
+        await reconcile_row_counts(db, User.__table__)
+        await db.commit()
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("ANALYZE"))
+
+    lists = {
+        "users": (
+            select(User.id),
+            select(RowCount.row_count).where(RowCount.table_name == "users"),
+            "users",
+        ),
+        "sent": (
+            select(Message.id).where(Message.sender_id == sender_id),
+            select(UserMailboxStats.sent_count).where(UserMailboxStats.user_id == sender_id),
+            None,
+        ),
+    }
+    print(f"{users:,} users, {messages:,} messages ({engine.dialect.name})")
+    print(f"{'list':>6} {'mode':>11} {'kind':>11} {'total':>10} {'ms':>8}")
+    async with AsyncSession(engine) as db:
+        for name, (rows, maintained, table_name) in lists.items():
+            for mode in ("exact", "estimated", "maintained", "none"):
+                total, kind = await resolve_total(db, mode, rows, maintained, table_name)
+                ms = await timed(
+                    lambda: resolve_total(db, mode, rows, maintained, table_name), repeat
+                )
+                shown = "-" if total is None else f"{total:,}"
+                print(f"{name:>6} {mode:>11} {kind or '-':>11} {shown:>10} {ms:>8.3f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List total modes")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.messages, args.repeat))
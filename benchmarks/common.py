@@ -0,0 +1,129 @@
+# Shared helpers for the benchmark scripts
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.models import Base, Message, MessageRecipient, User
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "sqlite+aiosqlite:///./bench.db")
+
+
+def make_engine(url: str = BENCH_DATABASE_URL) -> AsyncEngine:
+    return create_async_engine(url, echo=False)
+
+
+async def reset_schema(engine: AsyncEngine, metadata=Base.metadata) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.drop_all)
+        await conn.run_sync(metadata.create_all)
+
+
+async def seed_inbox(
+    engine: AsyncEngine, messages: int, senders: int = 10, seed: int = 42
+) -> Tuple[uuid.UUID, List[uuid.UUID]]:
+    """Seed one recipient with `messages` inbox rows.
+
+    Returns the recipient id and the ids of the senders.
+    """
+    rng = random.Random(seed)
+    recipient_id = uuid.UUID(int=rng.getrandbits(128))
+    sender_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(senders)]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    users = [{"id": recipient_id, "email": "recipient@example.com", "name": "Recipient"}]
+    users += [
+        {"id": sid, "email": f"sender{i}@example.com", "name": f"Sender {i}"}
+        for i, sid in enumerate(sender_ids)
+    ]
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), users)
+        for offset in range(0, messages, 5000):
+            batch = range(offset, min(offset + 5000, messages))
+            message_rows: List[dict] = []
+            recipient_rows: List[dict] = []
+            for i in batch:
+                message_id = uuid.UUID(int=rng.getrandbits(128))
+                timestamp = start + timedelta(seconds=i)
+                message_rows.append({
+                    "id": message_id,
+                    "sender_id": rng.choice(sender_ids),
+                    "subject": f"Subject {i}",
+                    "content": f"Body of message {i} " * 8,
+                    "timestamp": timestamp,
+                })
+                recipient_rows.append({
+                    "id": uuid.UUID(int=rng.getrandbits(128)),
+                    "message_id": message_id,
+                    "message_timestamp": timestamp,
+                    "recipient_id": recipient_id,
+                    "read": rng.random() < 0.7,
+                })
+            await conn.execute(insert(Message), message_rows)
+            await conn.execute(insert(MessageRecipient), recipient_rows)
+    return recipient_id, sender_ids
+
+
+async def seed_mailboxes(
+    engine: AsyncEngine, users: int, messages: int, fanout: int = 3, seed: int = 42
+) -> List[uuid.UUID]:
+    """Seed `users` users exchanging `messages` messages with random recipients.
+
+    Returns the user ids; the first one sends and receives the most so it is
+    a representative "heavy" mailbox.
+    """
+    rng = random.Random(seed)
+    user_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(users)]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {"id": uid, "email": f"user{i}@example.com", "name": f"User {i}"}
+            for i, uid in enumerate(user_ids)
+        ])
+        for offset in range(0, messages, 5000):
+            message_rows: List[dict] = []
+            recipient_rows: List[dict] = []
+            for i in range(offset, min(offset + 5000, messages)):
+                message_id = uuid.UUID(int=rng.getrandbits(128))
+                # Skew traffic towards the first user in both directions
+                sender = user_ids[0] if rng.random() < 0.05 else rng.choice(user_ids)
+                timestamp = start + timedelta(seconds=i)
+                message_rows.append({
+                    "id": message_id,
+                    "sender_id": sender,
+                    "subject": f"Subject {i}",
+                    "content": f"Body of message {i} " * 8,
+                    "timestamp": timestamp,
+                })
+                recipients = set(rng.sample(user_ids, fanout))
+                if rng.random() < 0.05:
+                    recipients.add(user_ids[0])
+                for recipient_id in recipients:
+                    recipient_rows.append({
+                        "id": uuid.UUID(int=rng.getrandbits(128)),
+                        "message_id": message_id,
+                        "message_timestamp": timestamp,
+                        "recipient_id": recipient_id,
+                        "read": rng.random() < 0.7,
+                    })
+            await conn.execute(insert(Message), message_rows)
+            await conn.execute(insert(MessageRecipient), recipient_rows)
+    return user_ids
+
+
+async def timed(fn, repeat: int) -> float:
+    """Run the coroutine factory `fn` `repeat` times and return the median in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
@@ -0,0 +1,91 @@
+# EXPLAIN the message access paths with and without the secondary indexes
+import argparse
+import asyncio
+
+from sqlalchemy import MetaData, Table, select, text
+
+from app.models import Base, Message, MessageRecipient
+from app.pagination import apply_keyset
+
+from .common import make_engine, reset_schema, seed_mailboxes
+
+
+def bare_metadata() -> MetaData:
+    """Copy of the schema with only primary keys and the email constraint."""
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        Table(table.name, metadata, *(column._copy() for column in table.columns))
+    return metadata
+
+
+def access_paths(user_id, message_id):
+    return {
+        "inbox": apply_keyset(
+            select(MessageRecipient.id, Message.id, Message.timestamp)
+            .join(Message, MessageRecipient.message_id == Message.id)
+            .where(MessageRecipient.recipient_id == user_id),
+            Message.timestamp, Message.id, None, 50
+        ),
+        "unread": apply_keyset(
+            select(MessageRecipient.id, Message.id, Message.timestamp)
+            .join(Message, MessageRecipient.message_id == Message.id)
+            .where(
+                MessageRecipient.recipient_id == user_id,
+                MessageRecipient.read == False
+            ),
+            Message.timestamp, Message.id, None, 50
+        ),
+        "sent": apply_keyset(
+            select(Message.id, Message.timestamp).where(Message.sender_id == user_id),
+            Message.timestamp, Message.id, None, 50
+        ),
+        "mark-as-read": select(MessageRecipient.id).where(
+            MessageRecipient.message_id == message_id,
+            MessageRecipient.recipient_id == user_id
+        ),
+    }
+
+
+async def explain(engine, label: str) -> None:
+    dialect = engine.dialect
+    prefix = (
+        "EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) "
+        if dialect.name == "postgresql" else "EXPLAIN QUERY PLAN "
+    )
+    async with engine.connect() as conn:
+        await conn.execute(text("ANALYZE"))
+        user_id = (await conn.execute(
+            select(MessageRecipient.recipient_id)
+            .group_by(MessageRecipient.recipient_id)
+            .order_by(text("count(*) DESC"))
+            .limit(1)
+        )).scalar_one()
+        message_id = (await conn.execute(
+            select(MessageRecipient.message_id)
+            .where(MessageRecipient.recipient_id == user_id)
+            .limit(1)
+        )).scalar_one()
+
+        for name, query in access_paths(user_id, message_id).items():
+            sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            rows = (await conn.exec_driver_sql(prefix + sql)).all()
+            print(f"--- {label}: {name}")
+            for row in rows:
+                print("   ", row[-1])
+
+
+async def main(users: int, messages: int) -> None:
+    engine = make_engine()
+    for label, metadata in (("before", bare_metadata()), ("after", Base.metadata)):
+        await reset_schema(engine, metadata)
+        await seed_mailboxes(engine, users, messages)
+        await explain(engine, label)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN before/after the access-path indexes")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--messages", type=int, default=50_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.messages))
@@ -0,0 +1,384 @@
+# Synthetic dataset generator: skewed users, messages and recipients at scale
+#
+# Messages are generated in fixed-size blocks, each from its own seeded RNG,
+# so a given --seed produces the same rows whatever --workers is. On
+# Postgres every worker process COPYs its blocks over its own connection;
+# on SQLite, which has a single writer, the workers only generate and the
+# parent writes them with batched executemany. Mailbox counters and the
+# maintained totals are rebuilt at the end.
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import math
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import column, func, insert, make_url, select, table, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.compression import compress
+from app.mailbox import reconcile
+from app.models import Message, MessageRecipient, User, UserMailboxStats, search_vector_sql
+from app.partitions import (
+    PARTITIONED_TABLES, add_months, create_partition_sql, is_partitioned, month_start
+)
+from app.totals import reconcile_row_counts
+
+from .common import BENCH_DATABASE_URL, make_engine, reset_schema
+
+# Messages per block: the unit of work handed to a worker
+BLOCK_SIZE = 20_000
+SQLITE_BATCH_SIZE = 5_000
+
+WORDS = (
+    "build deploy report invoice meeting review release incident update weekly "
+    "draft budget schedule customer ticket alert backup migration roadmap design "
+    "payment contract follow-up reminder summary notes agenda feedback launch metrics"
+).split()
+
+_MESSAGE_COLUMNS = ("id", "sender_id", "subject", "content", "timestamp")
+_RECIPIENT_COLUMNS = ("id", "message_id", "message_timestamp", "recipient_id", "read", "read_at")
+
+
+@dataclass(frozen=True)
+class Distributions:
+    """Shape of the generated traffic."""
+    # Zipf exponents over users: a few send, or receive, most messages
+    sender_skew: float = 1.1
+    recipient_skew: float = 0.9
+    # Recipients of an ordinary message: lognormal with this mean
+    fanout_mean: float = 3.0
+    fanout_sigma: float = 1.0
+    # The top `broadcasters` senders also send broadcasts to many users
+    broadcasters: int = 10
+    broadcast_share: float = 0.0005
+    broadcast_fanout: int = 5_000
+    # Each user reads a Beta-distributed share of their inbox with mean
+    # `read_ratio`; lower `read_concentration` polarises users more
+    read_ratio: float = 0.7
+    read_concentration: float = 4.0
+    body_words: int = 40
+
+
+@dataclass(frozen=True)
+class Plan:
+    seed: int
+    users: int
+    messages: int
+    start: datetime
+    end: datetime
+    distributions: Distributions
+
+    @property
+    def interval(self) -> float:
+        return (self.end - self.start).total_seconds() / max(self.messages, 1)
+
+    def blocks(self) -> Iterator[Tuple[int, int]]:
+        """(first message index, count) of every block."""
+        for first in range(0, self.messages, BLOCK_SIZE):
+            yield first, min(BLOCK_SIZE, self.messages - first)
+
+
+def user_id(seed: int, index: int) -> uuid.UUID:
+    digest = hashlib.blake2b(f"{seed}:user:{index}".encode(), digest_size=16).digest()
+    return uuid.UUID(bytes=digest, version=4)
+
+
+def user_rows(plan: Plan) -> Iterator[dict]:
+    step = (plan.end - plan.start) / max(plan.users, 1)
+    for index in range(plan.users):
+        yield {
+            "id": user_id(plan.seed, index),
+            "email": f"user{index}@example.com",
+            "name": f"User {index}",
+            "created_at": plan.start + step * index,
+        }
+
+
+class _Sampler:
+    """Per-process lookup tables for a plan, built once per worker."""
+
+    def __init__(self, plan: Plan):
+        d = plan.distributions
+        rng = random.Random(f"{plan.seed}:tables")
+        self.users = plan.users
+        self.sender_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** d.sender_skew for rank in range(plan.users)
+        ))
+        # Heavy inboxes are not the same users as heavy senders
+        self.recipient_order = list(range(plan.users))
+        rng.shuffle(self.recipient_order)
+        self.recipient_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** d.recipient_skew for rank in range(plan.users)
+        ))
+        a = max(d.read_ratio * d.read_concentration, 1e-3)
+        b = max((1 - d.read_ratio) * d.read_concentration, 1e-3)
+        self.read_propensity = [rng.betavariate(a, b) for _ in range(plan.users)]
+        self.fanout_mu = math.log(d.fanout_mean) - d.fanout_sigma ** 2 / 2
+
+    def sender(self, rng: random.Random) -> int:
+        return bisect.bisect(self.sender_weights, rng.random() * self.sender_weights[-1])
+
+    def recipient(self, rng: random.Random) -> int:
+        rank = bisect.bisect(self.recipient_weights, rng.random() * self.recipient_weights[-1])
+        return self.recipient_order[rank]
+
+
+_sampler: Optional[_Sampler] = None
+
+
+def _init_worker(plan: Plan) -> None:
+    global _sampler
+    _sampler = _Sampler(plan)
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_block(plan: Plan, first: int, count: int) -> Tuple[List[tuple], List[tuple]]:
+    """Message and recipient rows for messages `first` to `first + count`."""
+    d = plan.distributions
+    sampler = _sampler
+    rng = random.Random(f"{plan.seed}:block:{first}")
+    messages: List[tuple] = []
+    recipients: List[tuple] = []
+    for index in range(first, first + count):
+        timestamp = plan.start + timedelta(seconds=index * plan.interval)
+        if d.broadcasters and rng.random() < d.broadcast_share:
+            sender = rng.randrange(min(d.broadcasters, plan.users))
+            fanout = min(d.broadcast_fanout, plan.users - 1)
+            chosen = set(rng.sample(range(plan.users), fanout + 1))
+            chosen.discard(sender)
+            chosen = set(itertools.islice(chosen, fanout))
+        else:
+            sender = sampler.sender(rng)
+            fanout = max(1, round(rng.lognormvariate(sampler.fanout_mu, d.fanout_sigma)))
+            fanout = min(fanout, plan.users - 1)
+            chosen = set()
+            while len(chosen) < fanout:
+                recipient = sampler.recipient(rng)
+                if recipient != sender:
+                    chosen.add(recipient)
+
+        message_id = uuid.UUID(int=rng.getrandbits(128))
+        words = max(3, round(rng.lognormvariate(math.log(d.body_words), 0.6)))
+        messages.append((
+            message_id,
+            user_id(plan.seed, sender),
+            _text(rng, rng.randint(2, 6)).capitalize(),
+            _text(rng, words),
+            timestamp,
+        ))
+        for recipient in sorted(chosen):
+            read = rng.random() < sampler.read_propensity[recipient]
+            recipients.append((
+                uuid.UUID(int=rng.getrandbits(128)),
+                message_id,
+                timestamp,
+                user_id(plan.seed, recipient),
+                read,
+                timestamp + timedelta(seconds=rng.expovariate(1 / 3600)) if read else None,
+            ))
+    return messages, recipients
+
+
+# Postgres: COPY through a staging table so search_vector is computed by
+# the same expression the API inserts with
+_STAGING_DDL = (
+    "CREATE TEMP TABLE generate_messages (id uuid, sender_id uuid, subject varchar(500), "
+    "body text, content bytea, timestamp timestamptz) ON COMMIT DROP"
+)
+
+
+def _staging_insert_sql() -> str:
+    staging = table("generate_messages", *(column(name) for name in (
+        "id", "sender_id", "subject", "body", "content", "timestamp"
+    )))
+    stmt = insert(Message.__table__).from_select(
+        [*_MESSAGE_COLUMNS, "search_vector"],
+        select(
+            staging.c.id, staging.c.sender_id, staging.c.subject, staging.c.content,
+            staging.c.timestamp, search_vector_sql(staging.c.subject, staging.c.body),
+        ),
+    )
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def _asyncpg_dsn(url: str) -> str:
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def _copy_block(dsn: str, plan: Plan, first: int, count: int) -> int:
+    import asyncpg
+
+    messages, recipients = generate_block(plan, first, count)
+    conn = await asyncpg.connect(dsn)
+    try:
+        async with conn.transaction():
+            await conn.execute(_STAGING_DDL)
+            await conn.copy_records_to_table(
+                "generate_messages",
+                records=[
+                    (id_, sender, subject, body, compress(body), timestamp)
+                    for id_, sender, subject, body, timestamp in messages
+                ],
+            )
+            await conn.execute(_staging_insert_sql())
+            await conn.copy_records_to_table(
+                "message_recipients", records=recipients, columns=_RECIPIENT_COLUMNS
+            )
+    finally:
+        await conn.close()
+    return len(recipients)
+
+
+def _copy_block_sync(dsn: str, plan: Plan, first: int, count: int) -> int:
+    return asyncio.run(_copy_block(dsn, plan, first, count))
+
+
+async def _load_users(engine: AsyncEngine, plan: Plan) -> None:
+    rows = user_rows(plan)
+    if engine.dialect.name == "postgresql":
+        import asyncpg
+
+        conn = await asyncpg.connect(_asyncpg_dsn(engine.url.render_as_string(hide_password=False)))
+        try:
+            await conn.copy_records_to_table(
+                "users",
+                records=((r["id"], r["email"], r["name"], r["created_at"]) for r in rows),
+                columns=("id", "email", "name", "created_at"),
+            )
+        finally:
+            await conn.close()
+        return
+    async with engine.begin() as conn:
+        while batch := list(itertools.islice(rows, SQLITE_BATCH_SIZE)):
+            await conn.execute(insert(User.__table__), batch)
+
+
+async def _create_partitions(engine: AsyncEngine, plan: Plan) -> None:
+    async with engine.begin() as conn:
+        if not await is_partitioned(conn):
+            return
+        month = month_start(plan.start.date())
+        while month <= plan.end.date():
+            for table_name, _ in PARTITIONED_TABLES:
+                await conn.execute(text(create_partition_sql(table_name, month)))
+            month = add_months(month, 1)
+
+
+async def _load_messages(engine: AsyncEngine, plan: Plan, workers: int) -> int:
+    blocks = list(plan.blocks())
+    loop = asyncio.get_running_loop()
+    recipients = 0
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(plan,)) as pool:
+        if engine.dialect.name == "postgresql":
+            dsn = _asyncpg_dsn(engine.url.render_as_string(hide_password=False))
+            futures = [
+                loop.run_in_executor(pool, _copy_block_sync, dsn, plan, first, count)
+                for first, count in blocks
+            ]
+            for done, future in enumerate(asyncio.as_completed(futures), 1):
+                recipients += await future
+                print(f"  {done}/{len(blocks)} blocks", end="\r", flush=True)
+            return recipients
+
+        # Generate ahead in the workers while this process writes, in order,
+        # keeping a few blocks in flight so memory stays bounded
+        pending = iter(blocks)
+        window = [
+            loop.run_in_executor(pool, generate_block, plan, first, count)
+            for first, count in itertools.islice(pending, workers * 2)
+        ]
+        done = 0
+        while window:
+            messages, recipient_rows = await window.pop(0)
+            for first, count in itertools.islice(pending, 1):
+                window.append(loop.run_in_executor(pool, generate_block, plan, first, count))
+            async with engine.begin() as conn:
+                await conn.execute(
+                    insert(Message.__table__),
+                    [dict(zip(_MESSAGE_COLUMNS, row)) for row in messages],
+                )
+                for start in range(0, len(recipient_rows), SQLITE_BATCH_SIZE):
+                    await conn.execute(
+                        insert(MessageRecipient.__table__),
+                        [
+                            dict(zip(_RECIPIENT_COLUMNS, row))
+                            for row in recipient_rows[start:start + SQLITE_BATCH_SIZE]
+                        ],
+                    )
+            recipients += len(recipient_rows)
+            done += 1
+            print(f"  {done}/{len(blocks)} blocks", end="\r", flush=True)
+    return recipients
+
+
+async def main(args: argparse.Namespace) -> None:
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    plan = Plan(
+        seed=args.seed,
+        users=args.users,
+        messages=args.messages,
+        start=end - timedelta(days=args.days),
+        end=end,
+        distributions=Distributions(**{name: getattr(args, name) for name in asdict(Distributions())}),
+    )
+    engine = make_engine(args.database_url)
+    if args.reset:
+        await reset_schema(engine)
+    await _create_partitions(engine, plan)
+
+    started = time.perf_counter()
+    await _load_users(engine, plan)
+    recipients = await _load_messages(engine, plan, args.workers)
+    loaded = time.perf_counter() - started
+
+    async with AsyncSession(engine) as db:
+        await reconcile(db)
+        await reconcile_row_counts(db, User.__table__)
+        await db.commit()
+        top = (await db.execute(select(
+            func.max(UserMailboxStats.sent_count), func.max(UserMailboxStats.total_count)
+        ))).one()
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("ANALYZE"))
+    total = time.perf_counter() - started
+    await engine.dispose()
+
+    rows = plan.users + plan.messages + recipients
+    print(
+        f"{plan.users:,} users, {plan.messages:,} messages, {recipients:,} recipients "
+        f"({engine.dialect.name}, {args.workers} workers)\n"
+        f"loaded in {loaded:.1f}s ({rows / loaded:,.0f} rows/s), {total:.1f}s with counters\n"
+        f"largest sent box {top[0]:,}, largest inbox {top[1]:,}"
+    )
+
+
+if __name__ == "__main__":
+    defaults = Distributions()
+    parser = argparse.ArgumentParser(description="Generate a synthetic messaging dataset")
+    parser.add_argument("--database-url", default=BENCH_DATABASE_URL)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate the schema first")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=180, help="history the messages span")
+    parser.add_argument("--end", help="timestamp of the last message (default now)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=4)
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    asyncio.run(main(parser.parse_args()))
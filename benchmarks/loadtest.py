@@ -0,0 +1,438 @@
+# Load test: req/s and latency percentiles for every API route
+#
+# Seeds BENCH_DATABASE_URL, then drives each route in app/routes.py with a
+# fixed number of requests from concurrent httpx clients, in-process over
+# ASGI and over a real socket to a uvicorn subprocess. Results are written
+# as JSON and compared with a saved baseline; the exit status is 1 when a
+# route errors or regresses past --threshold.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.mailbox import reconcile
+from app.models import MessageRecipient, User
+from app.totals import reconcile_row_counts
+
+from .common import BENCH_DATABASE_URL, make_engine, reset_schema, seed_mailboxes
+
+API = "/api/v1"
+TRANSPORTS = ("asgi", "uvicorn")
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+
+@dataclass
+class Fixture:
+    """Ids the scenarios pick from; `rng` makes each run's requests the same."""
+    user_ids: List[uuid.UUID]
+    # (message_id, recipient_id) pairs from the seeded inboxes
+    deliveries: List[Tuple[uuid.UUID, uuid.UUID]]
+    # Unread ones, each handed out once so every mark-as-read succeeds
+    unread: List[Tuple[uuid.UUID, uuid.UUID]]
+    async_message_ids: List[uuid.UUID] = field(default_factory=list)
+    rng: random.Random = field(default_factory=lambda: random.Random(7))
+    serial: Any = field(default_factory=itertools.count)
+
+    def user(self) -> uuid.UUID:
+        return self.rng.choice(self.user_ids)
+
+    def delivery(self) -> Tuple[uuid.UUID, uuid.UUID]:
+        return self.rng.choice(self.deliveries)
+
+    def unread_delivery(self) -> Tuple[uuid.UUID, uuid.UUID]:
+        return self.unread.pop()
+
+    def message_body(self) -> Dict[str, Any]:
+        return {
+            "subject": "Load test",
+            "content": f"Load test message {next(self.serial)}",
+            "recipient_ids": [str(user_id) for user_id in self.rng.sample(self.user_ids, 3)],
+        }
+
+
+Request = Tuple[str, Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    method: str
+    build: Callable[[Fixture], Request]
+    # Only read the headers: the body never ends
+    stream: bool = False
+    # httpx's ASGI transport buffers whole responses, so endless streams
+    # can only be driven over a socket
+    asgi: bool = True
+
+
+# (method, route path) -> how to call it; every route needs an entry
+SCENARIOS: Dict[Tuple[str, str], Scenario] = {}
+
+
+def scenario(method: str, path: str, **options: Any):
+    def register(build: Callable[[Fixture], Request]):
+        SCENARIOS[(method, path)] = Scenario(method, build, **options)
+        return build
+    return register
+
+
+@scenario("POST", "/users")
+def _create_user(f: Fixture) -> Request:
+    n = next(f.serial)
+    return "/users", {"json": {"email": f"load{n}@example.com", "name": f"Load {n}"}}
+
+
+@scenario("POST", "/users/import")
+def _import_users(f: Fixture) -> Request:
+    batch = next(f.serial)
+    rows = "".join(f"import{batch}-{i}@example.com,Import {i}\n" for i in range(50))
+    return "/users/import", {
+        "content": ("email,name\n" + rows).encode(), "headers": {"Content-Type": "text/csv"}
+    }
+
+
+@scenario("GET", "/users/{user_id}")
+def _get_user(f: Fixture) -> Request:
+    return f"/users/{f.user()}", {}
+
+
+@scenario("GET", "/users/{user_id}/export")
+def _export(f: Fixture) -> Request:
+    return f"/users/{f.user()}/export", {}
+
+
+@scenario("GET", "/users")
+def _list_users(f: Fixture) -> Request:
+    return "/users", {"params": {"skip": f.rng.randrange(0, 1000), "limit": 50}}
+
+
+@scenario("POST", "/messages")
+def _send(f: Fixture) -> Request:
+    return "/messages", {"params": {"sender_id": str(f.user())}, "json": f.message_body()}
+
+
+@scenario("POST", "/messages/async")
+def _send_async(f: Fixture) -> Request:
+    return "/messages/async", {"params": {"sender_id": str(f.user())}, "json": f.message_body()}
+
+
+@scenario("GET", "/messages/{message_id}/delivery")
+def _delivery(f: Fixture) -> Request:
+    return f"/messages/{f.rng.choice(f.async_message_ids)}/delivery", {}
+
+
+@scenario("GET", "/messages/{sender_id}/sent-messages")
+def _sent(f: Fixture) -> Request:
+    return f"/messages/{f.user()}/sent-messages", {"params": {"limit": 50}}
+
+
+@scenario("GET", "/messages/{recipient_id}/inbox-messages")
+def _inbox(f: Fixture) -> Request:
+    return f"/messages/{f.user()}/inbox-messages", {"params": {"limit": 50}}
+
+
+@scenario("GET", "/messages/{recipient_id}/inbox-stream", stream=True, asgi=False)
+def _inbox_stream(f: Fixture) -> Request:
+    return f"/messages/{f.user()}/inbox-stream", {}
+
+
+@scenario("GET", "/messages/{user_id}/unread-messages")
+def _unread(f: Fixture) -> Request:
+    return f"/messages/{f.user()}/unread-messages", {"params": {"limit": 50}}
+
+
+@scenario("GET", "/messages/{user_id}/unread-count")
+def _unread_count(f: Fixture) -> Request:
+    return f"/messages/{f.user()}/unread-count", {}
+
+
+@scenario("GET", "/messages/{user_id}/search")
+def _search(f: Fixture) -> Request:
+    return f"/messages/{f.user()}/search", {"params": {"q": "message"}}
+
+
+@scenario("GET", "/messages/{message_id}")
+def _get_message(f: Fixture) -> Request:
+    message_id, _ = f.delivery()
+    return f"/messages/{message_id}", {}
+
+
+@scenario("PATCH", "/messages/{message_id}/users/{user_id}/read")
+def _mark_read(f: Fixture) -> Request:
+    message_id, recipient_id = f.unread_delivery()
+    return f"/messages/{message_id}/users/{recipient_id}/read", {}
+
+
+@scenario("PATCH", "/messages/users/{user_id}/read")
+def _mark_read_batch(f: Fixture) -> Request:
+    message_id, recipient_id = f.unread_delivery()
+    return f"/messages/users/{recipient_id}/read", {"json": {"message_ids": [str(message_id)]}}
+
+
+def route_keys() -> List[Tuple[str, str]]:
+    """(method, path) of every route in app.routes, failing on unknown ones."""
+    from app.routes import router
+
+    keys = [(method, route.path) for route in router.routes for method in sorted(route.methods)]
+    missing = [f"{method} {path}" for method, path in keys if (method, path) not in SCENARIOS]
+    if missing:
+        raise SystemExit(f"No load test scenario for: {', '.join(missing)}")
+    return keys
+
+
+@dataclass
+class RouteResult:
+    requests: int
+    errors: int
+    seconds: float
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+async def drive(
+    client: httpx.AsyncClient, fixture: Fixture, scenario: Scenario, requests: int, concurrency: int
+) -> RouteResult:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        # The workers share `remaining`, so exactly `requests` are sent
+        for _ in remaining:
+            path, kwargs = scenario.build(fixture)
+            started = time.perf_counter()
+            if scenario.stream:
+                async with client.stream(scenario.method, API + path, **kwargs) as response:
+                    status_code = response.status_code
+            else:
+                response = await client.request(scenario.method, API + path, **kwargs)
+                status_code = response.status_code
+            latencies.append(time.perf_counter() - started)
+            if status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return RouteResult(
+        requests=requests,
+        errors=errors,
+        seconds=round(seconds, 3),
+        rps=round(requests / seconds, 1),
+        p50_ms=round(cuts[49] * 1000, 2),
+        p95_ms=round(cuts[94] * 1000, 2),
+        p99_ms=round(cuts[98] * 1000, 2),
+    )
+
+
+async def seed(users: int, messages: int, seed_value: int, unread_rows: int) -> Fixture:
+    engine = make_engine()
+    await reset_schema(engine)
+    user_ids = await seed_mailboxes(engine, users, messages, seed=seed_value)
+    async with AsyncSession(engine) as db:
+        await reconcile(db)
+        await reconcile_row_counts(db, User.__table__)
+        await db.commit()
+        pairs = select(MessageRecipient.message_id, MessageRecipient.recipient_id).order_by(
+            MessageRecipient.id
+        )
+        deliveries = [tuple(row) for row in await db.execute(pairs.limit(10_000))]
+        unread = [
+            tuple(row)
+            for row in await db.execute(pairs.where(MessageRecipient.read == False).limit(unread_rows))
+        ]
+    await engine.dispose()
+    return Fixture(
+        user_ids=user_ids, deliveries=deliveries, unread=unread, rng=random.Random(seed_value)
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def asgi_client(concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=60
+        ) as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise SystemExit("uvicorn exited during startup")
+                await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn did not start")
+            yield client
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+CLIENTS = {"asgi": asgi_client, "uvicorn": uvicorn_client}
+
+
+async def run_transport(transport: str, args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    # Enough unread rows for both mark-as-read routes
+    fixture = await seed(args.users, args.messages, args.seed, 2 * (args.requests + args.warmup))
+    results: Dict[str, Dict[str, Any]] = {}
+    async with CLIENTS[transport](args.concurrency) as client:
+        for _ in range(20):
+            path, kwargs = _send_async(fixture)
+            response = await client.post(API + path, **kwargs)
+            fixture.async_message_ids.append(response.json()["message_id"])
+
+        for method, path in route_keys():
+            name = f"{method} {path}"
+            scenario = SCENARIOS[(method, path)]
+            if transport == "asgi" and not scenario.asgi:
+                continue
+            if args.route and args.route not in name:
+                continue
+            await drive(client, fixture, scenario, args.warmup, args.concurrency)
+            result = await drive(client, fixture, scenario, args.requests, args.concurrency)
+            results[name] = asdict(result)
+            print(
+                f"{transport:>8} {name:<52} {result.rps:>8.1f} {result.p50_ms:>8.2f} "
+                f"{result.p95_ms:>8.2f} {result.p99_ms:>8.2f} {result.errors:>6}"
+            )
+    return results
+
+
+def regressions(
+    results: Dict[str, Dict[str, Dict[str, Any]]],
+    baseline: Dict[str, Dict[str, Dict[str, Any]]],
+    threshold: float,
+) -> List[str]:
+    """Routes whose p95 rose, or whose req/s fell, by more than `threshold`."""
+    found = []
+    for transport, routes in results.items():
+        for name, result in routes.items():
+            before = baseline.get(transport, {}).get(name)
+            if before is None:
+                continue
+            if result["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                found.append(
+                    f"{transport} {name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms"
+                )
+            if result["rps"] < before["rps"] * (1 - threshold):
+                found.append(
+                    f"{transport} {name}: {before['rps']:.1f} -> {result['rps']:.1f} req/s"
+                )
+    return found
+
+
+async def main(args: argparse.Namespace) -> int:
+    dialect = make_engine().dialect.name
+    transports = TRANSPORTS if args.transport == "both" else (args.transport,)
+    print(f"{args.users:,} users, {args.messages:,} messages ({dialect}), "
+          f"{args.requests} requests per route, concurrency {args.concurrency}")
+    print(f"{'':>8} {'route':<52} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    results = {transport: await run_transport(transport, args) for transport in transports}
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "database": dialect,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "settings": {
+            name: getattr(args, name)
+            for name in ("users", "messages", "requests", "warmup", "concurrency", "seed")
+        },
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"\nWrote {args.output}")
+
+    baseline_path = args.baseline or BASELINE_DIR / f"{dialect}.json"
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline {baseline_path}")
+        return 0
+
+    failed = [
+        f"{transport} {name}: {result['errors']} errors"
+        for transport, routes in results.items()
+        for name, result in routes.items()
+        if result["errors"]
+    ]
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        if baseline["settings"] != report["settings"]:
+            print(f"Baseline {baseline_path} was recorded with other settings; not comparing")
+        else:
+            failed += regressions(results, baseline["results"], args.threshold)
+    else:
+        print(f"No baseline at {baseline_path}; record one with --save-baseline")
+
+    for failure in failed:
+        print(f"FAIL {failure}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API load test with a regression baseline")
+    parser.add_argument("--transport", choices=TRANSPORTS + ("both",), default="both")
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=300, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=30, help="unmeasured requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--route", help="only routes whose 'METHOD /path' contains this")
+    parser.add_argument("--output", type=Path, default=Path("bench-results/loadtest.json"))
+    parser.add_argument("--baseline", type=Path, help="default: benchmarks/baselines/<database>.json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+    # Both the in-process app and the uvicorn subprocess use the bench database
+    os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+    sys.exit(asyncio.run(main(args)))
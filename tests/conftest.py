@@ -7,7 +7,8 @@ from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.models import Base
-from app.db import get_db
+from app.db import get_db, get_read_db
+from app.cache import cache
 
 TEST_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -41,6 +42,8 @@ async def client(test_db):
         yield test_db
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    await cache.clear()
     
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         yield ac
@@ -0,0 +1,143 @@
+import pytest
+
+from app.cache import Cache, MemoryCache, RedisCache, cache
+from app.schemas import UserCreate
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio.Redis for RedisCache."""
+
+    def __init__(self):
+        self.store = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.expiry[key] = ex
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    async def scan_iter(self, match=None):
+        prefix = match.rstrip("*")
+        for key in list(self.store):
+            if key.startswith(prefix):
+                yield key
+
+
+class BrokenBackend:
+
+    async def get(self, key):
+        raise ConnectionError("down")
+
+    async def set(self, key, value, ttl):
+        raise ConnectionError("down")
+
+
+class TestCacheBackends:
+
+    @pytest.mark.asyncio
+    async def test_memory_cache_evicts_lru_and_expires(self):
+        now = [0.0]
+        backend = MemoryCache(max_entries=2, clock=lambda: now[0])
+
+        await backend.set("a", b"1", ttl=10)
+        await backend.set("b", b"2", ttl=10)
+        assert await backend.get("a") == b"1"
+        await backend.set("c", b"3", ttl=10)
+
+        assert await backend.get("b") is None
+        assert await backend.get("a") == b"1"
+
+        now[0] = 11
+        assert await backend.get("a") is None
+        assert len(backend) == 1
+
+    @pytest.mark.asyncio
+    async def test_redis_cache_round_trip(self):
+        client = FakeRedis()
+        redis_cache = Cache(RedisCache(client), ttl=30)
+        user = UserCreate(email="cached@example.com", name="Cached")
+
+        assert await redis_cache.get("user:1", UserCreate) is None
+        await redis_cache.set("user:1", user)
+        assert client.expiry["message-system:user:1"] == 30
+        assert await redis_cache.get("user:1", UserCreate) == user
+
+        await redis_cache.invalidate("user:1")
+        assert await redis_cache.get("user:1", UserCreate) is None
+        assert redis_cache.stats()["hits"] == 1
+        assert redis_cache.stats()["misses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_backend_errors_fail_open(self):
+        broken = Cache(BrokenBackend())
+        user = UserCreate(email="loaded@example.com", name="Loaded")
+
+        async def load():
+            return user
+
+        assert await broken.get_or_load("user:2", UserCreate, load) == user
+        assert broken.stats()["errors"] == 2
+
+    @pytest.mark.asyncio
+    async def test_unreadable_entries_are_dropped_and_reloaded(self):
+        client = FakeRedis()
+        redis_cache = Cache(RedisCache(client), ttl=30)
+        user = UserCreate(email="fresh@example.com", name="Fresh")
+        # Corrupt, and written by a release with a different schema
+        client.store["message-system:user:3"] = b'{"email": "fresh@exa'
+        client.store["message-system:user:4"] = b'{"mail": "old@example.com", "name": "Old"}'
+
+        async def load():
+            return user
+
+        assert await redis_cache.get_or_load("user:3", UserCreate, load) == user
+        assert await redis_cache.get("user:3", UserCreate) == user
+        assert await redis_cache.get("user:4", UserCreate) is None
+        assert "message-system:user:4" not in client.store
+        stats = redis_cache.stats()
+        assert (stats["hits"], stats["misses"], stats["invalid_entries"]) == (1, 2, 2)
+        assert stats["errors"] == 0
+
+
+class TestCachedLookups:
+
+    @pytest.mark.asyncio
+    async def test_user_and_message_lookups_hit_cache(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "cache1@example.com", "name": "Cache Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "cache2@example.com", "name": "Cache Recipient"}
+        )
+        recipient = recipient_response.json()
+
+        hits = cache.hits
+        await client.get(f"/api/v1/users/{sender['id']}")
+        response = await client.get(f"/api/v1/users/{sender['id']}")
+        assert response.json()["email"] == "cache1@example.com"
+        assert cache.hits == hits + 1
+
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"subject": "Cached", "content": "Body", "recipient_ids": [recipient["id"]]}
+        )
+        message = response.json()
+        assert cache.hits == hits + 2
+
+        await client.get(f"/api/v1/messages/{message['id']}")
+        await client.patch(f"/api/v1/messages/{message['id']}/users/{recipient['id']}/read")
+        response = await client.get(f"/api/v1/messages/{message['id']}")
+        data = response.json()
+        assert data["content"] == "Body"
+        assert data["recipients"][0]["read"] is True
+        assert cache.hits == hits + 3
+
+        response = await client.get("/health/cache")
+        assert response.json()["backend"] == "MemoryCache"
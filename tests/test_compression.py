@@ -0,0 +1,105 @@
+from uuid import UUID
+
+import pytest
+from sqlalchemy import select, text, type_coerce
+from sqlalchemy.types import NullType
+
+from app.compression import PLAIN, ZLIB, backfill, compress, decompress, decompress_head
+from app.models import Message
+
+
+class TestCodec:
+
+    def test_small_bodies_are_stored_plain(self):
+        stored = compress("Hello", min_bytes=1024)
+        assert stored == PLAIN + b"Hello"
+        assert decompress(stored) == "Hello"
+
+    def test_large_bodies_round_trip_through_zlib(self):
+        body = "disk usage at 91% on host-042\n" * 200
+        stored = compress(body, "zlib", min_bytes=1024)
+        assert stored[:1] == ZLIB
+        assert len(stored) * 10 < len(body)
+        assert decompress(stored) == body
+        assert decompress(memoryview(stored)) == body
+
+    def test_incompressible_bodies_stay_plain(self):
+        body = "".join(chr(0x4E00 + (i * 7919) % 20000) for i in range(2000))
+        stored = compress(body, "zlib", min_bytes=16)
+        assert decompress(stored) == body
+        assert len(stored) <= len(body.encode()) + 1
+
+    def test_head_inflates_only_the_start(self):
+        body = "ünïcode " * 1000
+        for stored in (compress(body, "zlib", 16), compress(body, "none"), body):
+            assert decompress_head(stored, 50) == body[:50]
+        # A plain prefix cut in the middle of a multi-byte character
+        assert decompress_head((PLAIN + body.encode())[:4], 10) == "ün"
+
+    def test_unknown_tags_are_rejected(self):
+        with pytest.raises(ValueError):
+            decompress(b"\x7fwhatever")
+
+
+class TestStoredContent:
+
+    async def _send(self, client, content):
+        sender = (await client.post(
+            "/api/v1/users", json={"email": "zip1@example.com", "name": "Zip Sender"}
+        )).json()
+        recipient = (await client.post(
+            "/api/v1/users", json={"email": "zip2@example.com", "name": "Zip Recipient"}
+        )).json()
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"subject": "Nightly report", "content": content, "recipient_ids": [recipient["id"]]}
+        )
+        return response.json(), recipient
+
+    async def _stored(self, test_db, message_id):
+        result = await test_db.execute(
+            select(type_coerce(Message.content, NullType())).where(Message.id == UUID(message_id))
+        )
+        return result.scalar_one()
+
+    @pytest.mark.asyncio
+    async def test_large_bodies_are_compressed_and_searchable(self, client, test_db):
+        body = "build 1234 finished: 512 tests passed, 0 failed. checksum ok\n" * 100
+        message, recipient = await self._send(client, body)
+
+        stored = await self._stored(test_db, message["id"])
+        assert stored[:1] == ZLIB
+        assert len(stored) * 10 < len(body)
+
+        response = await client.get(f"/api/v1/messages/{message['id']}")
+        assert response.json()["content"] == body
+
+        response = await client.get(f"/api/v1/messages/{recipient['id']}/search?q=checksum")
+        assert [m["id"] for m in response.json()["messages"]] == [message["id"]]
+
+    @pytest.mark.asyncio
+    async def test_backfill_compresses_existing_rows(self, client, test_db):
+        body = "temperature sensor 7 reported 21.5C\n" * 100
+        message, recipient = await self._send(client, body)
+        # A body written before compression, as SQLite keeps old TEXT values
+        await test_db.execute(
+            text("UPDATE messages SET content = :body"), {"body": body}
+        )
+        await test_db.commit()
+        assert isinstance(await self._stored(test_db, message["id"]), str)
+
+        stats = await backfill(test_db, "zlib", min_bytes=1024)
+        assert stats["scanned"] == 1
+        assert stats["rewritten"] == 1
+        assert stats["bytes_after"] * 10 < stats["bytes_before"]
+        assert (await self._stored(test_db, message["id"]))[:1] == ZLIB
+        assert (await backfill(test_db, "zlib", min_bytes=1024))["rewritten"] == 0
+
+        stats = await backfill(test_db, "none")
+        assert stats["rewritten"] == 1
+        assert (await self._stored(test_db, message["id"]))[:1] == PLAIN
+
+        response = await client.get(f"/api/v1/messages/{message['id']}")
+        assert response.json()["content"] == body
+        response = await client.get(f"/api/v1/messages/{recipient['id']}/search?q=sensor")
+        assert response.json()["messages"][0]["id"] == message["id"]
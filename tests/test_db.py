@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db import (EngineSettings, TimedQueuePool, _async_url, _asyncpg_connect_args, pool_stats,
+                    warm_pool)
+
+
+class TestEngineSettings:
+
+    def test_production_defaults_disable_echo(self, monkeypatch):
+        monkeypatch.delenv("APP_ENV", raising=False)
+        monkeypatch.delenv("DB_ECHO", raising=False)
+        monkeypatch.setenv("DB_POOL_SIZE", "4")
+        settings = EngineSettings.from_env("postgresql+asyncpg://u:p@db/app")
+        assert settings.echo is False
+        assert settings.pool_size == 4
+        assert settings.warm_connections == 4
+
+    def test_development_enables_echo_unless_overridden(self, monkeypatch):
+        monkeypatch.setenv("APP_ENV", "development")
+        monkeypatch.delenv("DB_ECHO", raising=False)
+        assert EngineSettings.from_env("sqlite+aiosqlite://").echo is True
+        monkeypatch.setenv("DB_ECHO", "false")
+        assert EngineSettings.from_env("sqlite+aiosqlite://").echo is False
+
+    def test_plain_postgres_url_uses_asyncpg(self):
+        assert _async_url("postgresql://u:p@db:5432/app") == "postgresql+asyncpg://u:p@db:5432/app"
+        assert _async_url("sqlite+aiosqlite:///./x.db") == "sqlite+aiosqlite:///./x.db"
+
+    def test_zero_statement_cache_is_safe_for_transaction_pooling(self):
+        url = "postgresql+asyncpg://u:p@pgbouncer/app"
+        assert _asyncpg_connect_args(EngineSettings(url)) == {"prepared_statement_cache_size": 100}
+
+        connect_args = _asyncpg_connect_args(EngineSettings(url, statement_cache_size=0))
+        assert connect_args["prepared_statement_cache_size"] == 0
+        assert connect_args["statement_cache_size"] == 0
+        name_func = connect_args["prepared_statement_name_func"]
+        assert name_func() != name_func()
+
+
+class TestPoolStats:
+
+    @pytest.mark.asyncio
+    async def test_warm_pool_opens_connections_and_records_waits(self, tmp_path):
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+            poolclass=TimedQueuePool,
+            pool_size=3,
+            max_overflow=0,
+        )
+        try:
+            # Capped at the pool size
+            assert await warm_pool(engine, 5) == 3
+            stats = pool_stats(engine)
+            assert stats["pool"] == "TimedQueuePool"
+            assert stats["checked_in"] == 3
+            assert stats["checked_out"] == 0
+            assert stats["checkouts"] == 3
+            assert stats["timeouts"] == 0
+            assert stats["wait_max_ms"] >= stats["wait_avg_ms"] >= 0
+        finally:
+            await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_warm_pool_returns_when_a_connection_fails(self, tmp_path):
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+            poolclass=TimedQueuePool,
+            pool_size=3,
+            max_overflow=0,
+        )
+        attempts = []
+
+        @event.listens_for(engine.sync_engine, "do_connect")
+        def refuse_second(dialect, conn_rec, cargs, cparams):
+            attempts.append(1)
+            if len(attempts) == 2:
+                raise ConnectionRefusedError("connection refused")
+
+        try:
+            assert await asyncio.wait_for(warm_pool(engine, 3), timeout=5) == 2
+            stats = pool_stats(engine)
+            assert stats["checked_out"] == 0
+            assert stats["checked_in"] == 2
+        finally:
+            await engine.dispose()
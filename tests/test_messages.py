@@ -1,5 +1,11 @@
+import json
+from uuid import uuid4
+
 import pytest
 import pytest_asyncio
+from sqlalchemy import event
+
+from app import export
 
 
 class TestMessaging:
@@ -189,3 +195,1047 @@ class TestReadStatus:
         for msg in data["messages"]:
             assert msg["read"] == False
             assert msg["read_at"] is None
+
+
+    @pytest.mark.asyncio
+    async def test_mark_as_read_twice_and_unknown(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "reread1@example.com", "name": "Reread Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "reread2@example.com", "name": "Reread Recipient"}
+        )
+        recipient = recipient_response.json()
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"content": "Read me once", "recipient_ids": [recipient["id"]]}
+        )
+        message = response.json()
+
+        url = f"/api/v1/messages/{message['id']}/users/{recipient['id']}/read"
+        response = await client.patch(url)
+        assert response.status_code == 200
+        assert response.json()["read_at"] is not None
+
+        response = await client.patch(url)
+        assert response.status_code == 400
+
+        response = await client.patch(
+            f"/api/v1/messages/{message['id']}/users/{sender['id']}/read"
+        )
+        assert response.status_code == 404
+
+        response = await client.get(f"/api/v1/messages/{recipient['id']}/unread-count")
+        assert response.json()["unread_count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_mark_messages_as_read_in_batch(self, client):
+        users = []
+        for i in range(3):
+            response = await client.post(
+                "/api/v1/users", json={"email": f"batch{i}@example.com", "name": f"Batch {i}"}
+            )
+            users.append(response.json())
+        alice, bob, reader = users
+
+        sent = []
+        for sender in (alice, bob, alice, bob):
+            response = await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={"content": "Batch", "recipient_ids": [reader["id"]]}
+            )
+            sent.append(response.json())
+
+        url = f"/api/v1/messages/users/{reader['id']}/read"
+        response = await client.patch(url, json={"message_ids": [sent[0]["id"]]})
+        assert response.status_code == 200
+        assert response.json()["updated"] == 1
+
+        response = await client.patch(url, json={"sender_id": alice["id"]})
+        assert response.json()["updated"] == 1
+
+        response = await client.get(f"/api/v1/messages/{reader['id']}/unread-count")
+        assert response.json()["unread_count"] == 2
+
+        response = await client.patch(url, json={"all": True})
+        assert response.json()["updated"] == 2
+
+        response = await client.get(f"/api/v1/messages/{reader['id']}/unread-messages")
+        assert response.json()["total"] == 0
+        response = await client.get(f"/api/v1/messages/{reader['id']}/unread-count")
+        assert response.json()["unread_count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_mark_messages_as_read_up_to_cursor(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "cursor-read1@example.com", "name": "Sender"}
+        )
+        sender = sender_response.json()
+        reader_response = await client.post(
+            "/api/v1/users", json={"email": "cursor-read2@example.com", "name": "Reader"}
+        )
+        reader = reader_response.json()
+        for i in range(4):
+            await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={"content": f"Older {i}", "recipient_ids": [reader["id"]]}
+            )
+
+        response = await client.get(
+            f"/api/v1/messages/{reader['id']}/inbox-messages", params={"limit": 1}
+        )
+        cursor = response.json()["next_cursor"]
+
+        # The first page's last row and everything older than it
+        response = await client.patch(
+            f"/api/v1/messages/users/{reader['id']}/read", json={"cursor": cursor}
+        )
+        assert response.json()["updated"] == 4
+
+    @pytest.mark.asyncio
+    async def test_mark_messages_as_read_requires_selector(self, client):
+        response = await client.patch(
+            "/api/v1/messages/users/00000000-0000-0000-0000-000000000001/read", json={}
+        )
+        assert response.status_code == 422
+
+        response = await client.patch(
+            "/api/v1/messages/users/00000000-0000-0000-0000-000000000001/read",
+            json={"all": True}
+        )
+        assert response.status_code == 404
+
+class TestPagination:
+
+    @pytest.mark.asyncio
+    async def test_inbox_cursor_pagination(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "pager1@example.com", "name": "Pager Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "pager2@example.com", "name": "Pager Recipient"}
+        )
+        recipient = recipient_response.json()
+
+        sent_ids = []
+        for i in range(5):
+            response = await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={
+                    "subject": f"Page Message {i}",
+                    "content": f"Content of page message {i}",
+                    "recipient_ids": [recipient["id"]]
+                }
+            )
+            assert response.status_code == 201
+            sent_ids.append(response.json()["id"])
+
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get(
+                f"/api/v1/messages/{recipient['id']}/inbox-messages", params=params
+            )
+            assert response.status_code == 200
+            data = response.json()
+            assert data["total"] == 5
+            assert len(data["messages"]) <= 2
+            seen.extend(msg["message_id"] for msg in data["messages"])
+            pages += 1
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        assert pages == 3
+        assert sorted(seen) == sorted(sent_ids)
+
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages", params={"limit": 3}
+        )
+        data = response.json()
+        assert len(data["messages"]) == 3
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages",
+            params={"limit": 3, "cursor": data["next_cursor"]}
+        )
+        data = response.json()
+        assert len(data["messages"]) == 2
+        assert data["next_cursor"] is None
+
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self, client):
+        user_response = await client.post(
+            "/api/v1/users", json={"email": "pager3@example.com", "name": "Pager User"}
+        )
+        user = user_response.json()
+
+        response = await client.get(
+            f"/api/v1/messages/{user['id']}/unread-messages", params={"cursor": "not-a-cursor"}
+        )
+        assert response.status_code == 400
+
+
+class TestFanOut:
+
+    @pytest.mark.asyncio
+    async def test_send_message_dedupes_and_chunks_recipients(self, client, monkeypatch):
+        from app import fanout
+        monkeypatch.setattr(fanout, "SQLITE_INSERT_CHUNK_SIZE", 2)
+
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "fanout@example.com", "name": "Fan Out"}
+        )
+        sender = sender_response.json()
+        recipients = []
+        for i in range(5):
+            response = await client.post(
+                "/api/v1/users", json={"email": f"fanout{i}@example.com", "name": f"Fan {i}"}
+            )
+            recipients.append(response.json()["id"])
+
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={
+                "subject": "Broadcast",
+                "content": "Hello everyone",
+                "recipient_ids": recipients + recipients[:2]
+            }
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert sorted(r["recipient_id"] for r in data["recipients"]) == sorted(recipients)
+        assert all(r["read"] is False and r["read_at"] is None for r in data["recipients"])
+
+        response = await client.get(f"/api/v1/messages/{data['id']}")
+        assert response.status_code == 200
+        assert len(response.json()["recipients"]) == 5
+
+    @pytest.mark.asyncio
+    async def test_send_message_unknown_recipient(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "fanout-missing@example.com", "name": "Fan Out"}
+        )
+        sender = sender_response.json()
+
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={
+                "content": "Hello",
+                "recipient_ids": [sender["id"], "00000000-0000-0000-0000-000000000001"]
+            }
+        )
+        assert response.status_code == 400
+
+
+class TestUnreadCount:
+
+    @pytest.mark.asyncio
+    async def test_unread_count_tracks_send_and_read(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "counter1@example.com", "name": "Counter Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "counter2@example.com", "name": "Counter Recipient"}
+        )
+        recipient = recipient_response.json()
+
+        response = await client.get(f"/api/v1/messages/{recipient['id']}/unread-count")
+        assert response.status_code == 200
+        assert response.json()["unread_count"] == 0
+
+        sent = []
+        for i in range(3):
+            response = await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={"content": f"Counted {i}", "recipient_ids": [recipient["id"]]}
+            )
+            sent.append(response.json())
+
+        await client.patch(f"/api/v1/messages/{sent[0]['id']}/users/{recipient['id']}/read")
+
+        response = await client.get(f"/api/v1/messages/{recipient['id']}/unread-count")
+        data = response.json()
+        assert data["unread_count"] == 2
+        assert data["total_count"] == 3
+
+    @pytest.mark.asyncio
+    async def test_unread_count_unknown_user(self, client):
+        response = await client.get(
+            "/api/v1/messages/00000000-0000-0000-0000-000000000001/unread-count"
+        )
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_reconcile_repairs_drift(self, client, test_db):
+        from sqlalchemy import update
+        from app.mailbox import reconcile
+        from app.models import UserMailboxStats
+
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "counter3@example.com", "name": "Counter Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "counter4@example.com", "name": "Counter Recipient"}
+        )
+        recipient = recipient_response.json()
+        await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"content": "Drift", "recipient_ids": [recipient["id"]]}
+        )
+
+        await test_db.execute(update(UserMailboxStats).values(unread_count=42))
+        await test_db.commit()
+
+        assert await reconcile(test_db) == 2
+        await test_db.commit()
+
+        response = await client.get(f"/api/v1/messages/{recipient['id']}/unread-count")
+        assert response.json()["unread_count"] == 1
+        assert await reconcile(test_db) == 0
+
+
+
+class TestSearch:
+
+    async def _users(self, client, *names):
+        users = []
+        for name in names:
+            response = await client.post(
+                "/api/v1/users", json={"email": f"{name}@example.com", "name": name}
+            )
+            users.append(response.json())
+        return users
+
+    async def _send(self, client, sender, recipients, subject, content):
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={
+                "subject": subject,
+                "content": content,
+                "recipient_ids": [r["id"] for r in recipients]
+            }
+        )
+        assert response.status_code == 201
+        return response.json()
+
+    @pytest.mark.asyncio
+    async def test_search_is_ranked_and_scoped_to_mailbox(self, client):
+        alice, bob, carol = await self._users(client, "search-alice", "search-bob", "search-carol")
+        in_subject = await self._send(
+            client, bob, [alice], "Quarterly budget", "Numbers attached"
+        )
+        in_body = await self._send(
+            client, alice, [bob], "Hello", "Let's talk about the budget tomorrow"
+        )
+        await self._send(client, bob, [carol], "Budget", "Not for Alice")
+        await self._send(client, bob, [alice], "Lunch", "Pizza on Friday")
+
+        response = await client.get(f"/api/v1/messages/{alice['id']}/search?q=budget")
+        assert response.status_code == 200
+        data = response.json()
+        assert [m["id"] for m in data["messages"]] == [in_subject["id"], in_body["id"]]
+        assert data["messages"][0]["rank"] > data["messages"][1]["rank"]
+        assert data["next_cursor"] is None
+
+        # Stemmed, all words required, operators in user input are harmless
+        response = await client.get(
+            f"/api/v1/messages/{alice['id']}/search", params={"q": 'talking "budget" ('}
+        )
+        assert [m["id"] for m in response.json()["messages"]] == [in_body["id"]]
+
+    @pytest.mark.asyncio
+    async def test_search_pagination(self, client):
+        sender, recipient = await self._users(client, "search-sender", "search-recipient")
+        sent = [
+            await self._send(client, sender, [recipient], f"Report {i}", "weekly report")
+            for i in range(5)
+        ]
+
+        seen = []
+        cursor = None
+        while True:
+            params = {"q": "report", "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get(
+                f"/api/v1/messages/{recipient['id']}/search", params=params
+            )
+            data = response.json()
+            assert len(data["messages"]) <= 2
+            seen.extend(m["id"] for m in data["messages"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        assert sorted(seen) == sorted(m["id"] for m in sent)
+
+        response = await client.get(
+            f"/api/v1/messages/{recipient['id']}/search?q=report&cursor=bogus"
+        )
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_search_unknown_user(self, client):
+        response = await client.get(
+            "/api/v1/messages/00000000-0000-0000-0000-000000000001/search?q=hello"
+        )
+        assert response.status_code == 404
+
+
+class TestAsyncSend:
+
+    async def _setup(self, client, prefix, recipients):
+        response = await client.post(
+            "/api/v1/users", json={"email": f"{prefix}-sender@example.com", "name": "Sender"}
+        )
+        sender = response.json()
+        recipient_ids = []
+        for i in range(recipients):
+            response = await client.post(
+                "/api/v1/users",
+                json={"email": f"{prefix}-r{i}@example.com", "name": f"Recipient {i}"}
+            )
+            recipient_ids.append(response.json()["id"])
+        return sender, recipient_ids
+
+    @pytest.mark.asyncio
+    async def test_async_send_fans_out_in_background(self, client, test_db):
+        from app.outbox import OutboxWorker
+
+        sender, recipient_ids = await self._setup(client, "async", 5)
+        response = await client.post(
+            f"/api/v1/messages/async?sender_id={sender['id']}",
+            json={"subject": "Bulk", "content": "Hello all", "recipient_ids": recipient_ids}
+        )
+        assert response.status_code == 202
+        data = response.json()
+        assert data["status"] == "pending"
+        assert data["total_recipients"] == 5
+        assert data["processed_recipients"] == 0
+        message_id = data["message_id"]
+
+        response = await client.get(f"/api/v1/messages/{recipient_ids[0]}/inbox-messages")
+        assert response.json()["total"] == 0
+
+        worker = OutboxWorker(chunk_size=2)
+        assert await worker.process_next(test_db) == "done"
+        assert await worker.process_next(test_db) is None
+        assert worker.chunks == 3
+        assert worker.recipients_delivered == 5
+
+        response = await client.get(f"/api/v1/messages/{message_id}/delivery")
+        data = response.json()
+        assert data["status"] == "done"
+        assert data["processed_recipients"] == 5
+        assert data["completed_at"] is not None
+
+        for recipient_id in recipient_ids:
+            response = await client.get(f"/api/v1/messages/{recipient_id}/inbox-messages")
+            assert [m["message_id"] for m in response.json()["messages"]] == [message_id]
+            response = await client.get(f"/api/v1/messages/{recipient_id}/unread-count")
+            assert response.json()["unread_count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_fan_out_resumes_where_it_stopped(self, client, test_db, monkeypatch):
+        from sqlalchemy import func, select, update
+        from app import outbox
+        from app.models import MessageOutbox, MessageRecipient
+
+        sender, recipient_ids = await self._setup(client, "resume", 5)
+        response = await client.post(
+            f"/api/v1/messages/async?sender_id={sender['id']}",
+            json={"content": "Resume me", "recipient_ids": recipient_ids}
+        )
+        message_id = response.json()["message_id"]
+
+        real_record_delivery = outbox.record_delivery
+        calls = []
+
+        async def flaky_record_delivery(db, ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            await real_record_delivery(db, ids)
+
+        monkeypatch.setattr(outbox, "record_delivery", flaky_record_delivery)
+        worker = outbox.OutboxWorker(chunk_size=2)
+        assert await worker.process_next(test_db) == "pending"
+
+        response = await client.get(f"/api/v1/messages/{message_id}/delivery")
+        data = response.json()
+        assert data["processed_recipients"] == 2
+        assert data["attempts"] == 1
+        assert "database went away" in data["last_error"]
+
+        # Backing off: not claimable until the retry delay has passed
+        assert await worker.process_next(test_db) is None
+        await test_db.execute(update(MessageOutbox).values(locked_until=None))
+        await test_db.commit()
+
+        assert await worker.process_next(test_db) == "done"
+        result = await test_db.execute(select(func.count(MessageRecipient.id)))
+        assert result.scalar_one() == 5
+        assert worker.retries == 1
+
+        response = await client.get("/health/outbox")
+        assert response.json()["pending_jobs"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stale_worker_cannot_write_after_losing_its_lease(self, client, test_db):
+        from sqlalchemy import func, select, update
+        from app import outbox
+        from app.models import MessageOutbox, MessageRecipient
+
+        sender, recipient_ids = await self._setup(client, "lease", 5)
+        response = await client.post(
+            f"/api/v1/messages/async?sender_id={sender['id']}",
+            json={"content": "Who has it", "recipient_ids": recipient_ids}
+        )
+        message_id = response.json()["message_id"]
+
+        stale = await outbox.claim(test_db)
+        # The first worker stalls past its lease and a second one claims the job
+        await test_db.execute(update(MessageOutbox).values(locked_until=None))
+        await test_db.commit()
+        current = await outbox.claim(test_db)
+        assert current.lease_token != stale.lease_token
+
+        with pytest.raises(outbox.LeaseLost):
+            await outbox.deliver(test_db, stale, chunk_size=2)
+        assert await outbox._fail(test_db, stale, RuntimeError("late")) == outbox.PROCESSING
+        result = await test_db.execute(select(func.count(MessageRecipient.id)))
+        assert result.scalar_one() == 0
+
+        assert await outbox.deliver(test_db, current, chunk_size=2) == "done"
+        result = await test_db.execute(select(func.count(MessageRecipient.id)))
+        assert result.scalar_one() == 5
+        response = await client.get(f"/api/v1/messages/{message_id}/delivery")
+        data = response.json()
+        assert (data["status"], data["processed_recipients"]) == ("done", 5)
+        assert data["last_error"] is None
+
+    @pytest.mark.asyncio
+    async def test_stopping_worker_hands_the_job_back_between_chunks(self, client, test_db):
+        from app import outbox
+
+        sender, recipient_ids = await self._setup(client, "stop", 5)
+        response = await client.post(
+            f"/api/v1/messages/async?sender_id={sender['id']}",
+            json={"content": "Halfway", "recipient_ids": recipient_ids}
+        )
+        message_id = response.json()["message_id"]
+
+        worker = outbox.OutboxWorker(chunk_size=2)
+        count_chunk = worker._count_chunk
+
+        def stop_after_chunk(size):
+            count_chunk(size)
+            worker._stopping = True
+
+        worker._count_chunk = stop_after_chunk
+        assert await worker.process_next(test_db) == "pending"
+        assert worker.chunks == 1
+
+        response = await client.get(f"/api/v1/messages/{message_id}/delivery")
+        data = response.json()
+        assert (data["status"], data["processed_recipients"], data["attempts"]) == ("pending", 2, 0)
+
+        assert await outbox.OutboxWorker(chunk_size=2).process_next(test_db) == "done"
+        response = await client.get(f"/api/v1/messages/{message_id}/delivery")
+        assert response.json()["processed_recipients"] == 5
+
+    @pytest.mark.asyncio
+    async def test_resumed_job_pushes_every_recipient_once(self, client, test_db, monkeypatch):
+        from uuid import UUID
+        from sqlalchemy import update
+        from app import outbox
+        from app.models import MessageOutbox
+        from app.realtime import broker
+
+        sender, recipient_ids = await self._setup(client, "push", 5)
+        subscriptions = [broker.subscribe(UUID(recipient_id)) for recipient_id in recipient_ids]
+        try:
+            response = await client.post(
+                f"/api/v1/messages/async?sender_id={sender['id']}",
+                json={"content": "Everyone", "recipient_ids": recipient_ids}
+            )
+            message_id = response.json()["message_id"]
+
+            first = outbox.OutboxWorker(chunk_size=2)
+            count_chunk = first._count_chunk
+
+            def stop_after_chunk(size):
+                count_chunk(size)
+                first._stopping = True
+
+            first._count_chunk = stop_after_chunk
+            assert await first.process_next(test_db) == "pending"
+
+            # The next worker writes the second chunk and fails on the third
+            real_record_delivery = outbox.record_delivery
+            calls = []
+
+            async def flaky_record_delivery(db, ids):
+                calls.append(ids)
+                if len(calls) == 2:
+                    raise RuntimeError("database went away")
+                await real_record_delivery(db, ids)
+
+            monkeypatch.setattr(outbox, "record_delivery", flaky_record_delivery)
+            assert await outbox.OutboxWorker(chunk_size=2).process_next(test_db) == "pending"
+            monkeypatch.setattr(outbox, "record_delivery", real_record_delivery)
+            await test_db.execute(update(MessageOutbox).values(locked_until=None))
+            await test_db.commit()
+
+            assert await outbox.OutboxWorker(chunk_size=2).process_next(test_db) == "done"
+
+            for subscription in subscriptions:
+                event = await subscription.get(timeout=1)
+                assert event is not None, f"no event for {subscription.user_id}"
+                assert str(event.message_id) == message_id
+                assert subscription.queue.empty()
+        finally:
+            for subscription in subscriptions:
+                subscription.close()
+
+    @pytest.mark.asyncio
+    async def test_delivery_status_unknown_message(self, client):
+        response = await client.get(
+            "/api/v1/messages/00000000-0000-0000-0000-000000000001/delivery"
+        )
+        assert response.status_code == 404
+
+
+class TestSnippetView:
+
+    @pytest.mark.asyncio
+    async def test_list_views_return_snippets(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "snippet1@example.com", "name": "Snippet Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "snippet2@example.com", "name": "Snippet Recipient"}
+        )
+        recipient = recipient_response.json()
+
+        long_body = "lorem ipsum dolor sit amet " * 400
+        for content in ("Short and\nsweet", long_body):
+            await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={"subject": "Preview", "content": content, "recipient_ids": [recipient["id"]]}
+            )
+
+        full = await client.get(f"/api/v1/messages/{recipient['id']}/inbox-messages")
+        response = await client.get(
+            f"/api/v1/messages/{recipient['id']}/inbox-messages?view=snippet"
+        )
+        assert response.status_code == 200
+        assert len(response.content) * 10 < len(full.content)
+        long_item, short_item = response.json()["messages"]
+        assert "content" not in long_item
+        assert long_item["truncated"] is True
+        assert long_item["snippet"].endswith("…")
+        assert len(long_item["snippet"]) <= 201
+        assert long_body.startswith(long_item["snippet"][:-1])
+        assert short_item["truncated"] is False
+        assert short_item["snippet"] == "Short and sweet"
+
+        response = await client.get(
+            f"/api/v1/messages/{recipient['id']}/unread-messages?view=snippet"
+        )
+        assert [m["truncated"] for m in response.json()["messages"]] == [True, False]
+
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages?view=snippet"
+        )
+        messages = response.json()["messages"]
+        assert "content" not in messages[0]
+        assert messages[0]["recipients"][0]["recipient_id"] == recipient["id"]
+
+        # The full body is still available from the message itself
+        response = await client.get(f"/api/v1/messages/{long_item['message_id']}")
+        assert response.json()["content"] == long_body
+
+        response = await client.get(
+            f"/api/v1/messages/{recipient['id']}/inbox-messages?view=compact"
+        )
+        assert response.status_code == 422
+
+
+class TestSparseFields:
+
+    @pytest_asyncio.fixture
+    async def statements(self, test_db):
+        seen = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            seen.append(statement)
+
+        engine = test_db.bind.sync_engine
+        event.listen(engine, "before_cursor_execute", record)
+        yield seen
+        event.remove(engine, "before_cursor_execute", record)
+
+    async def _send(self, client):
+        sender = (await client.post(
+            "/api/v1/users", json={"email": "sparse1@example.com", "name": "Sparse Sender"}
+        )).json()
+        recipient = (await client.post(
+            "/api/v1/users", json={"email": "sparse2@example.com", "name": "Sparse Recipient"}
+        )).json()
+        message = (await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"subject": "Hi", "content": "Body text", "recipient_ids": [recipient["id"]]}
+        )).json()
+        return sender, recipient, message
+
+    @pytest.mark.asyncio
+    async def test_sent_messages_fetch_only_requested_columns(self, client, statements):
+        sender, _, message = await self._send(client)
+        statements.clear()
+
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages"
+            "?fields=id,timestamp,recipients.read"
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert body["total"] == 1
+        item, = body["messages"]
+        assert set(item) == {"id", "timestamp", "recipients"}
+        assert item["id"] == message["id"]
+        assert item["recipients"] == [{"read": False}]
+        sql = " ".join(statements)
+        assert "messages.content" not in sql
+        assert "messages.subject" not in sql
+        assert "message_recipients.read_at" not in sql
+
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages?fields=id,subject"
+        )
+        assert response.json()["messages"] == [{"id": message["id"], "subject": "Hi"}]
+
+    @pytest.mark.asyncio
+    async def test_inbox_read_state_skips_the_messages_join(self, client, statements):
+        _, recipient, message = await self._send(client)
+        statements.clear()
+
+        for endpoint in ("inbox-messages", "unread-messages"):
+            response = await client.get(
+                f"/api/v1/messages/{recipient['id']}/{endpoint}?fields=message_id,read"
+            )
+            assert response.json()["messages"] == [{"message_id": message["id"], "read": False}]
+        assert not any("JOIN messages" in statement for statement in statements)
+
+        response = await client.get(
+            f"/api/v1/messages/{recipient['id']}/inbox-messages?view=snippet&fields=snippet"
+        )
+        assert response.json()["messages"] == [{"snippet": "Body text"}]
+
+    @pytest.mark.asyncio
+    async def test_single_message_and_users(self, client, statements):
+        sender, recipient, message = await self._send(client)
+        statements.clear()
+
+        response = await client.get(f"/api/v1/messages/{message['id']}?fields=id,subject")
+        assert response.json() == {"id": message["id"], "subject": "Hi"}
+        # Only the validator query touches recipients; their rows are not loaded
+        assert not any("JOIN users" in statement for statement in statements)
+
+        response = await client.get(
+            f"/api/v1/messages/{message['id']}?fields=recipients.recipient_id"
+        )
+        assert response.json() == {"recipients": [{"recipient_id": recipient["id"]}]}
+
+        response = await client.get(f"/api/v1/users/{sender['id']}?fields=email")
+        assert response.json() == {"email": "sparse1@example.com"}
+
+        response = await client.get("/api/v1/users?fields=name")
+        body = response.json()
+        assert body["total"] == 2
+        assert sorted(body["users"], key=lambda user: user["name"]) == [
+            {"name": "Sparse Recipient"}, {"name": "Sparse Sender"}
+        ]
+
+    @pytest.mark.asyncio
+    async def test_unknown_fields_are_rejected(self, client):
+        sender, _, message = await self._send(client)
+
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages?fields=id,bogus,recipients.nope"
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Unknown fields: bogus, recipients.nope"
+
+        # Snippet views only have snippets
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages?view=snippet&fields=content"
+        )
+        assert response.status_code == 400
+
+        response = await client.get(f"/api/v1/messages/{message['id']}?fields=,")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "No fields requested"
+
+
+class TestConditionalGet:
+
+    async def _send(self, client):
+        sender = (await client.post(
+            "/api/v1/users", json={"email": "etag1@example.com", "name": "ETag Sender"}
+        )).json()
+        recipient = (await client.post(
+            "/api/v1/users", json={"email": "etag2@example.com", "name": "ETag Recipient"}
+        )).json()
+        message = (await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"subject": "Poll", "content": "Body", "recipient_ids": [recipient["id"]]}
+        )).json()
+        return sender, recipient, message
+
+    @pytest.mark.asyncio
+    async def test_inbox_revalidates_until_the_mailbox_changes(self, client):
+        sender, recipient, message = await self._send(client)
+        url = f"/api/v1/messages/{recipient['id']}/inbox-messages"
+
+        response = await client.get(url)
+        etag = response.headers["etag"]
+        assert etag.startswith('W/"')
+        assert response.headers["cache-control"] == "private, no-cache"
+        # Changes within a second would be invisible to If-Modified-Since
+        assert "last-modified" not in response.headers
+        response = await client.get(
+            url, headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+        )
+        assert response.status_code == 200
+
+        response = await client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        # Other pages and views are different representations
+        response = await client.get(f"{url}?view=snippet", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
+        unread_url = f"/api/v1/messages/{recipient['id']}/unread-messages"
+        unread_etag = (await client.get(unread_url)).headers["etag"]
+
+        await client.patch(f"/api/v1/messages/{message['id']}/users/{recipient['id']}/read")
+        response = await client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["messages"][0]["read"] is True
+        response = await client.get(unread_url, headers={"If-None-Match": unread_etag})
+        assert response.status_code == 200
+        assert response.json()["messages"] == []
+
+        etag = (await client.get(url)).headers["etag"]
+        await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"content": "Another", "recipient_ids": [recipient["id"]]}
+        )
+        response = await client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["total"] == 2
+
+    @pytest.mark.asyncio
+    async def test_message_and_user_validators(self, client):
+        sender, recipient, message = await self._send(client)
+
+        url = f"/api/v1/messages/{message['id']}"
+        response = await client.get(url)
+        etag = response.headers["etag"]
+        assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+        assert (await client.get(url, headers={"If-None-Match": f'"x", {etag}'})).status_code == 304
+
+        await client.patch(f"/api/v1/messages/{message['id']}/users/{recipient['id']}/read")
+        response = await client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["recipients"][0]["read"] is True
+
+        url = f"/api/v1/users/{sender['id']}"
+        response = await client.get(url)
+        last_modified = response.headers["last-modified"]
+        response = await client.get(url, headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+        response = await client.get(url, headers={"If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert response.json()["email"] == "etag1@example.com"
+
+        response = await client.get(
+            f"/api/v1/messages/{sender['id']}/inbox-messages", headers={"If-None-Match": "*"}
+        )
+        assert response.status_code == 304
+        response = await client.get(
+            "/api/v1/messages/00000000-0000-0000-0000-000000000000/inbox-messages"
+        )
+        assert response.status_code == 404
+
+
+class TestMailboxExport:
+
+    async def _users(self, client, *names):
+        users = []
+        for name in names:
+            response = await client.post(
+                "/api/v1/users", json={"email": f"{name}@example.com", "name": name.title()}
+            )
+            users.append(response.json())
+        return users
+
+    async def _export(self, client, user_id):
+        response = await client.get(f"/api/v1/users/{user_id}/export")
+        assert response.status_code == 200
+        return response, [json.loads(line) for line in response.text.splitlines()]
+
+    @pytest.mark.asyncio
+    async def test_export_streams_sent_and_received_messages(self, client, monkeypatch):
+        alice, bob, carol = await self._users(client, "alice", "bob", "carol")
+        # Small batches so sent messages straddle cursor fetches
+        monkeypatch.setattr(export, "BATCH_SIZE", 3)
+        sent = []
+        for i in range(3):
+            response = await client.post(
+                f"/api/v1/messages?sender_id={alice['id']}",
+                json={"subject": f"Sent {i}", "content": f"Body {i}",
+                      "recipient_ids": [bob["id"], carol["id"]]}
+            )
+            sent.append(response.json())
+        received = (await client.post(
+            f"/api/v1/messages?sender_id={bob['id']}",
+            json={"subject": "Reply", "content": "Thanks", "recipient_ids": [alice["id"]]}
+        )).json()
+        await client.patch(f"/api/v1/messages/{sent[1]['id']}/users/{carol['id']}/read")
+
+        response, lines = await self._export(client, alice["id"])
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "attachment" in response.headers["content-disposition"]
+
+        assert [(line["type"], line["subject"]) for line in lines] == [
+            ("sent", "Sent 0"), ("sent", "Sent 1"), ("sent", "Sent 2"), ("received", "Reply")
+        ]
+        read_state = {r["recipient_id"]: r["read"] for r in lines[1]["recipients"]}
+        assert read_state == {bob["id"]: False, carol["id"]: True}
+        assert all(len(line["recipients"]) == 2 for line in lines[:3])
+        assert lines[3]["message_id"] == received["id"]
+        assert lines[3]["sender_id"] == bob["id"]
+        assert lines[3]["read"] is False
+
+    @pytest.mark.asyncio
+    async def test_export_of_an_empty_mailbox(self, client):
+        (dave,) = await self._users(client, "dave")
+        response = await client.get(f"/api/v1/users/{dave['id']}/export")
+        assert response.status_code == 200
+        assert response.content == b""
+
+    @pytest.mark.asyncio
+    async def test_export_unknown_user(self, client):
+        response = await client.get(f"/api/v1/users/{uuid4()}/export")
+        assert response.status_code == 404
+
+
+class TestTotals:
+
+    async def _send(self, client, count):
+        sender = (await client.post(
+            "/api/v1/users", json={"email": "totals1@example.com", "name": "Totals Sender"}
+        )).json()
+        recipient = (await client.post(
+            "/api/v1/users", json={"email": "totals2@example.com", "name": "Totals Recipient"}
+        )).json()
+        for i in range(count):
+            await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={"content": f"Message {i}", "recipient_ids": [recipient["id"]]}
+            )
+        return sender, recipient
+
+    @pytest.mark.asyncio
+    async def test_sent_total_modes(self, client):
+        sender, recipient = await self._send(client, 3)
+        url = f"/api/v1/messages/{sender['id']}/sent-messages?limit=2"
+
+        data = (await client.get(url)).json()
+        assert (data["total"], data["total_kind"]) == (3, "exact")
+
+        data = (await client.get(f"{url}&total=maintained&view=snippet")).json()
+        assert (data["total"], data["total_kind"]) == (3, "maintained")
+
+        # No planner statistics on SQLite
+        data = (await client.get(f"{url}&total=estimated")).json()
+        assert (data["total"], data["total_kind"]) == (3, "exact")
+
+        data = (await client.get(f"{url}&total=none")).json()
+        assert (data["total"], data["total_kind"]) == (None, None)
+        assert len(data["messages"]) == 2
+
+        data = (await client.get(
+            f"/api/v1/messages/{recipient['id']}/sent-messages?total=maintained"
+        )).json()
+        assert (data["total"], data["total_kind"]) == (0, "maintained")
+
+        response = await client.get(f"{url}&total=approximate")
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_inbox_totals_come_from_the_mailbox_counters(self, client, test_db):
+        from sqlalchemy import update
+        from app.models import UserMailboxStats
+
+        _, recipient = await self._send(client, 3)
+        inbox = f"/api/v1/messages/{recipient['id']}/inbox-messages?limit=2"
+        unread = f"/api/v1/messages/{recipient['id']}/unread-messages?limit=2"
+        first = (await client.get(inbox)).json()["messages"][0]
+        await client.patch(f"/api/v1/messages/{first['message_id']}/users/{recipient['id']}/read")
+
+        statements = []
+        engine = test_db.bind.sync_engine
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            data = (await client.get(inbox)).json()
+            assert (data["total"], data["total_kind"]) == (3, "maintained")
+            data = (await client.get(unread)).json()
+            assert (data["total"], data["total_kind"]) == (2, "maintained")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert not [s for s in statements if "count(" in s.lower()]
+
+        # Drifted counters show through until reconciled; exact recounts
+        await test_db.execute(update(UserMailboxStats).values(total_count=99, unread_count=98))
+        await test_db.commit()
+        assert (await client.get(inbox)).json()["total"] == 99
+        data = (await client.get(f"{inbox}&total=exact")).json()
+        assert (data["total"], data["total_kind"]) == (3, "exact")
+        data = (await client.get(f"{unread}&total=exact&view=snippet")).json()
+        assert (data["total"], data["total_kind"]) == (2, "exact")
+        data = (await client.get(f"{unread}&total=none")).json()
+        assert (data["total"], len(data["messages"])) == (None, 2)
+
+    @pytest.mark.asyncio
+    async def test_reconcile_rebuilds_sent_counts(self, client, test_db):
+        from sqlalchemy import update
+        from app.mailbox import reconcile
+        from app.models import UserMailboxStats
+
+        sender, _ = await self._send(client, 2)
+        await test_db.execute(update(UserMailboxStats).values(sent_count=0))
+        await test_db.commit()
+
+        assert await reconcile(test_db) == 1
+        await test_db.commit()
+        data = (await client.get(
+            f"/api/v1/messages/{sender['id']}/sent-messages?total=maintained"
+        )).json()
+        assert data["total"] == 2
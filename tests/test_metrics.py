@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+from app.metrics import CONTENT_TYPE, RouteMetrics, _RequestStats, metrics
+
+
+def _sample(body: str, name: str, **labels: str) -> float:
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{name}\{{{re.escape(wanted)}\}} (\S+)$", body, re.MULTILINE)
+    assert match, f"no {name}{{{wanted}}} sample"
+    return float(match.group(1))
+
+
+class TestRouteMetrics:
+
+    def test_renders_cumulative_histograms(self):
+        registry = RouteMetrics()
+        request = _RequestStats()
+        request.statements = 4
+        request.db_seconds = 0.002
+        registry.record("GET", "/things/{id}", 200, 0.03, request)
+        registry.record("GET", "/things/{id}", 404, 0.004, _RequestStats())
+
+        body = registry.render()
+        labels = {"method": "GET", "route": "/things/{id}"}
+
+        assert _sample(body, "http_requests_total", **labels, status="200") == 1
+        assert _sample(body, "http_requests_total", **labels, status="404") == 1
+        assert _sample(body, "http_request_duration_seconds_bucket", **labels, le="0.005") == 1
+        assert _sample(body, "http_request_duration_seconds_bucket", **labels, le="0.025") == 1
+        assert _sample(body, "http_request_duration_seconds_bucket", **labels, le="0.05") == 2
+        assert _sample(body, "http_request_duration_seconds_bucket", **labels, le="+Inf") == 2
+        assert _sample(body, "http_request_duration_seconds_count", **labels) == 2
+        assert _sample(body, "http_request_duration_seconds_sum", **labels) == pytest.approx(0.034)
+        assert _sample(body, "http_request_db_statements_bucket", **labels, le="0") == 1
+        assert _sample(body, "http_request_db_statements_bucket", **labels, le="3") == 1
+        assert _sample(body, "http_request_db_statements_bucket", **labels, le="5") == 2
+        assert _sample(body, "http_request_db_statements_sum", **labels) == 4
+        assert _sample(body, "http_request_db_seconds_total", **labels) == pytest.approx(0.002)
+        assert "# TYPE http_request_duration_seconds histogram" in body
+
+
+class TestMetricsEndpoint:
+
+    @pytest.mark.asyncio
+    async def test_records_requests_by_route_template(self, client):
+        metrics.clear()
+        for index in range(2):
+            response = await client.post(
+                "/api/v1/users", json={"email": f"metrics{index}@example.com", "name": "Metrics"}
+            )
+            assert response.status_code == 201
+        user_id = response.json()["id"]
+        assert (await client.get(f"/api/v1/users/{user_id}")).status_code == 200
+        assert (await client.get("/api/v1/users")).status_code == 200
+        assert (await client.get("/no/such/route")).status_code == 404
+
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == CONTENT_TYPE
+        body = response.text
+
+        created = {"method": "POST", "route": "/api/v1/users"}
+        assert _sample(body, "http_requests_total", **created, status="201") == 2
+        assert _sample(body, "http_request_duration_seconds_count", **created) == 2
+        assert _sample(body, "http_request_db_statements_sum", **created) >= 2
+        assert _sample(body, "http_request_db_seconds_total", **created) > 0
+        # UserResponse is validated and dumped by FastAPI's serialize_response;
+        # this fails if a FastAPI upgrade bypasses the wrapper in instrument()
+        assert _sample(body, "http_request_serialization_seconds_total", **created) > 0
+
+        read = {"method": "GET", "route": "/api/v1/users/{user_id}"}
+        assert _sample(body, "http_requests_total", **read, status="200") == 1
+        # Rendered by FastJSONResponse (or FastAPI with FAST_JSON off)
+        assert _sample(body, "http_request_serialization_seconds_total", **read) > 0
+
+        listed = {"method": "GET", "route": "/api/v1/users"}
+        assert _sample(body, "http_request_db_statements_sum", **listed) >= 2
+
+        unmatched = {"method": "GET", "route": "unmatched"}
+        assert _sample(body, "http_requests_total", **unmatched, status="404") == 1
+        assert _sample(body, "http_request_db_statements_sum", **unmatched) == 0
+        assert str(user_id) not in body
@@ -0,0 +1,218 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+
+import pytest
+
+from app import realtime
+from app.realtime import InMemoryBroker, PostgresBroker, broker, event_stream
+
+
+class FakeRequest:
+
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class FakeListenerConnection:
+    """Stands in for an asyncpg connection used for LISTEN."""
+
+    def __init__(self):
+        self.listeners = {}
+        self.termination_listeners = []
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    async def remove_listener(self, channel, callback):
+        self.listeners.pop(channel, None)
+
+    async def execute(self, query):
+        if self.closed:
+            raise ConnectionError("connection is closed")
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        if not self.closed:
+            self.closed = True
+            for callback in self.termination_listeners:
+                callback(self)
+
+    async def close(self):
+        self.terminate()
+
+
+async def _eventually(predicate, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    assert predicate()
+
+
+class TestRealtime:
+
+    @pytest.mark.asyncio
+    async def test_send_message_pushes_event_to_subscriber(self, client):
+        sender_response = await client.post(
+            "/api/v1/users", json={"email": "push1@example.com", "name": "Push Sender"}
+        )
+        sender = sender_response.json()
+        recipient_response = await client.post(
+            "/api/v1/users", json={"email": "push2@example.com", "name": "Push Recipient"}
+        )
+        recipient = recipient_response.json()
+
+        subscription = broker.subscribe(UUID(recipient["id"]))
+        try:
+            response = await client.post(
+                f"/api/v1/messages?sender_id={sender['id']}",
+                json={"subject": "Live", "content": "Pushed", "recipient_ids": [recipient["id"]]}
+            )
+            message = response.json()
+
+            event = await subscription.get(timeout=1)
+            assert str(event.message_id) == message["id"]
+            assert event.content == "Pushed"
+            assert event.read is False
+
+            stats = (await client.get("/health/realtime")).json()
+            assert stats["connections"] >= 1
+            assert stats["delivered"] >= 1
+        finally:
+            subscription.close()
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_drops_events(self):
+        local = InMemoryBroker(queue_size=1)
+        user_id = uuid4()
+        subscription = local.subscribe(user_id)
+        message = {"id": uuid4(), "subject": None, "content": "x", "sender_id": uuid4(), "timestamp": None}
+        row = SimpleNamespace(id=uuid4(), recipient_id=user_id, read=False, read_at=None)
+
+        await local.publish(None, message, [row])
+        await local.publish(None, message, [row])
+
+        assert local.delivered == 1
+        assert local.dropped == 1
+        subscription.close()
+        assert local.connections == 0
+
+    @pytest.mark.asyncio
+    async def test_event_stream_formats_sse_and_unsubscribes(self):
+        local = InMemoryBroker()
+        user_id = uuid4()
+        request = FakeRequest()
+        stream = event_stream(request, local, user_id, heartbeat=0.01)
+
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        assert local.connections == 1
+        assert await stream.__anext__() == ": keep-alive\n\n"
+
+        message = {"id": uuid4(), "subject": "s", "content": "c", "sender_id": uuid4(), "timestamp": None}
+        row = SimpleNamespace(id=uuid4(), recipient_id=user_id, read=False, read_at=None)
+        await local.publish(None, message, [row])
+        chunk = await stream.__anext__()
+        assert chunk.startswith(f"event: message\nid: {row.id}\ndata: ")
+        assert json.loads(chunk.split("data: ", 1)[1])["message_id"] == str(message["id"])
+
+        request.disconnected = True
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        assert local.connections == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_unknown_user(self, client):
+        response = await client.get(f"/api/v1/messages/{uuid4()}/inbox-stream")
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_failed_publish_still_returns_the_sent_message(self, client, monkeypatch):
+        sender = (await client.post(
+            "/api/v1/users", json={"email": "push3@example.com", "name": "Push Sender"}
+        )).json()
+        recipient = (await client.post(
+            "/api/v1/users", json={"email": "push4@example.com", "name": "Push Recipient"}
+        )).json()
+
+        async def failing_publish(db, message, recipient_rows):
+            raise ConnectionError("notify failed")
+
+        monkeypatch.setattr(broker, "publish", failing_publish)
+        response = await client.post(
+            f"/api/v1/messages?sender_id={sender['id']}",
+            json={"subject": "Quiet", "content": "Not pushed", "recipient_ids": [recipient["id"]]}
+        )
+        assert response.status_code == 201
+        message = response.json()
+
+        inbox = (await client.get(f"/api/v1/messages/{recipient['id']}/inbox-messages")).json()
+        assert [item["message_id"] for item in inbox["messages"]] == [message["id"]]
+
+    @pytest.mark.asyncio
+    async def test_postgres_listener_reconnects_after_a_dropped_connection(self, monkeypatch):
+        monkeypatch.setattr(realtime, "RECONNECT_DELAY_SECONDS", 0.01)
+        connections = []
+        attempts = 0
+
+        async def connect(dsn):
+            nonlocal attempts
+            attempts += 1
+            # The database is still down for the first attempt after the drop
+            if attempts == 2:
+                raise OSError("connection refused")
+            connections.append(FakeListenerConnection())
+            return connections[-1]
+
+        local = PostgresBroker("postgresql://test", connect=connect)
+        await local.start()
+        try:
+            await _eventually(lambda: local.stats()["listener_connected"])
+            assert local.channel in connections[0].listeners
+
+            # e.g. the database restarted
+            connections[0].terminate()
+            await _eventually(lambda: attempts == 2)
+            stats = local.stats()
+            assert stats["listener_connected"] is False
+            assert "connection refused" in stats["listener_error"]
+
+            await _eventually(lambda: local.stats()["listener_connected"])
+            assert len(connections) == 2
+            assert local.channel in connections[1].listeners
+            stats = local.stats()
+            assert stats["listener_error"] is None
+            assert stats["reconnect_attempts"] == 2
+        finally:
+            await local.stop()
+        assert connections[1].closed
+        assert local.stats()["listener_connected"] is False
+
+    @pytest.mark.asyncio
+    async def test_postgres_listener_notices_a_silently_dead_connection(self, monkeypatch):
+        monkeypatch.setattr(realtime, "RECONNECT_DELAY_SECONDS", 0.01)
+        connections = []
+
+        async def connect(dsn):
+            connections.append(FakeListenerConnection())
+            return connections[-1]
+
+        local = PostgresBroker("postgresql://test", connect=connect, check_interval=0.02)
+        await local.start()
+        try:
+            await _eventually(lambda: local.stats()["listener_connected"])
+            # Closed without the termination callbacks firing, as after a failover
+            connections[0].closed = True
+            await _eventually(lambda: len(connections) == 2 and local.stats()["listener_connected"])
+        finally:
+            await local.stop()
@@ -0,0 +1,102 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import db as database
+from app.cache import cache
+from app.db import ReadRouter, get_read_db
+from app.main import app
+from app.models import Base
+from tests.conftest import TEST_DATABASE_URL
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _sessionmaker(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest_asyncio.fixture
+async def primary_engine(test_db):
+    # Second connection to the database the client fixture writes to
+    engine = create_async_engine(TEST_DATABASE_URL)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def replica_engine(tmp_path):
+    # A separate, empty database: a replica that has not caught up yet
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+class TestReadReplicaRouting:
+
+    @pytest.mark.asyncio
+    async def test_reads_go_to_replica_after_write_window(
+        self, client, monkeypatch, primary_engine, replica_engine
+    ):
+        clock = FakeClock()
+        router = ReadRouter(
+            _sessionmaker(primary_engine), _sessionmaker(replica_engine), window=5, clock=clock
+        )
+        monkeypatch.setattr(database, "read_router", router)
+        app.dependency_overrides.pop(get_read_db)
+
+        response = await client.post(
+            "/api/v1/users", json={"email": "replica@example.com", "name": "Replica User"}
+        )
+        user_id = response.json()["id"]
+        await cache.clear()
+
+        # Read-your-writes: the fresh user is served from the primary
+        response = await client.get(f"/api/v1/users/{user_id}")
+        assert response.status_code == 200
+        assert router.pinned_reads == 1
+
+        # Once the window has passed, reads hit the (lagging) replica
+        clock.now += 6
+        await cache.clear()
+        response = await client.get(f"/api/v1/users/{user_id}")
+        assert response.status_code == 404
+        assert router.replica_reads == 1
+
+    @pytest.mark.asyncio
+    async def test_unreachable_replica_falls_back_to_primary(
+        self, client, monkeypatch, primary_engine, tmp_path
+    ):
+        broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+        clock = FakeClock()
+        router = ReadRouter(
+            _sessionmaker(primary_engine), _sessionmaker(broken), retry_after=30, clock=clock
+        )
+        monkeypatch.setattr(database, "read_router", router)
+        app.dependency_overrides.pop(get_read_db)
+
+        response = await client.post(
+            "/api/v1/users", json={"email": "fallback@example.com", "name": "Fallback User"}
+        )
+        assert response.status_code == 201
+
+        response = await client.get("/api/v1/users")
+        assert response.status_code == 200
+        assert response.json()["total"] == 1
+        response = await client.get("/api/v1/users")
+        assert response.status_code == 200
+
+        stats = router.stats()
+        assert stats["fallbacks"] == 1
+        assert stats["primary_reads"] == 1
+        assert stats["replica_available"] is False
+        await broken.dispose()
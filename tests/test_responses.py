@@ -0,0 +1,37 @@
+import uuid
+from datetime import datetime, timezone
+
+from app.responses import FastJSONResponse
+from app.schemas import MessageRecipientSchema, MessagesRecipientList
+
+
+class TestFastJSONResponse:
+
+    def test_matches_pydantic_serialisation(self):
+        now = datetime.now(timezone.utc)
+        payload = MessagesRecipientList(
+            messages=[
+                MessageRecipientSchema(
+                    id=uuid.uuid4(),
+                    message_id=uuid.uuid4(),
+                    subject="Héllo",
+                    content="Body",
+                    sender_id=uuid.uuid4(),
+                    timestamp=now,
+                    read=True,
+                    read_at=now
+                )
+            ],
+            total=1
+        )
+
+        response = FastJSONResponse(payload)
+
+        assert response.body == payload.model_dump_json().encode()
+        assert response.headers["content-type"] == "application/json"
+
+    def test_renders_plain_data_with_uuid_and_datetime(self):
+        value = uuid.uuid4()
+        response = FastJSONResponse({"id": value, "at": datetime(2025, 1, 1, tzinfo=timezone.utc)})
+
+        assert response.body == f'{{"id":"{value}","at":"2025-01-01T00:00:00Z"}}'.encode()
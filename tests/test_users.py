@@ -2,6 +2,8 @@ import pytest
 import pytest_asyncio
 from uuid import uuid4
 
+from app import importer
+
 
 class TestUserManagement:
 
@@ -56,3 +58,80 @@ class TestUserManagement:
         data = response.json()
         assert data["total"] == 3
         assert len(data["users"]) == 3
+
+
+class TestBulkImport:
+
+    async def _import(self, client, body, content_type):
+        return await client.post(
+            "/api/v1/users/import", content=body, headers={"Content-Type": content_type}
+        )
+
+    @pytest.mark.asyncio
+    async def test_import_csv_skips_existing_and_repeated_emails(self, client, monkeypatch):
+        # Several chunks, with a repeat that lands in a later one
+        monkeypatch.setattr(importer, "CHUNK_SIZE", 2)
+        await client.post("/api/v1/users", json={"email": "taken@example.com", "name": "Taken"})
+        body = (
+            "\ufeffName,Email\n"
+            'Ada,ada@example.com\n'
+            '"Hopper, Grace",grace@example.com\r\n'
+            "Someone Else,taken@example.com\n"
+            "\n"
+            "Ada Again,ada@example.com\n"
+            "Nobody,not-an-email\n"
+            "Linus,linus@example.com"
+        )
+        response = await self._import(client, body.encode(), "text/csv; charset=utf-8")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["skipped"], data["invalid"]) == (3, 2, 1)
+        assert [e["line"] for e in data["errors"]] == [7]
+        assert data["errors"][0]["error"].startswith("email:")
+
+        users = {u["email"]: u["name"] for u in (await client.get("/api/v1/users")).json()["users"]}
+        assert users["grace@example.com"] == "Hopper, Grace"
+        assert users["ada@example.com"] == "Ada"
+        assert users["taken@example.com"] == "Taken"
+        assert len(users) == 4
+
+    @pytest.mark.asyncio
+    async def test_import_ndjson(self, client):
+        body = (
+            b'{"email": "one@example.com", "name": "One"}\n'
+            b'{"email": "two@example.com", "name": "Two"}\n'
+            b'{"email": "three@example.com"\n'
+        )
+        response = await self._import(client, body, "application/x-ndjson")
+
+        data = response.json()
+        assert (data["created"], data["skipped"], data["invalid"]) == (2, 0, 1)
+        assert data["errors"][0]["line"] == 3
+
+        # Importing again creates nothing
+        response = await self._import(client, body, "application/x-ndjson")
+        assert (response.json()["created"], response.json()["skipped"]) == (0, 2)
+
+    @pytest.mark.asyncio
+    async def test_import_rejects_bad_requests(self, client):
+        response = await self._import(client, b"email,name\n", "application/json")
+        assert response.status_code == 415
+
+        response = await self._import(client, b"email,fullname\na@example.com,A\n", "text/csv")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "CSV header is missing: name"
+
+    @pytest.mark.asyncio
+    async def test_import_counts_towards_maintained_total(self, client):
+        await client.post("/api/v1/users", json={"email": "first@example.com", "name": "First"})
+        body = b"email,name\nfirst@example.com,Again\nsecond@example.com,Second\n"
+        await self._import(client, body, "text/csv")
+
+        data = (await client.get("/api/v1/users?total=maintained")).json()
+        assert (data["total"], data["total_kind"]) == (2, "maintained")
+        data = (await client.get("/api/v1/users")).json()
+        assert (data["total"], data["total_kind"]) == (2, "exact")
+        data = (await client.get("/api/v1/users?total=none&fields=email")).json()
+        assert data["total"] is None
+        assert len(data["users"]) == 2